@@ -0,0 +1,65 @@
+"""
+Cold-start benchmark: fresh interpreter -> import the web server -> first HTTP response
+
+Usage:
+    python benchmark_cold_start.py                    # web_server_cloud, 5 runs
+    python benchmark_cold_start.py web_server 10      # another server module / run count
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs in a fresh interpreter so nothing is already imported or cached
+CHILD = """
+import json, time
+started = time.perf_counter()
+import {module} as server
+imported = time.perf_counter()
+client = server.app.test_client()
+client.get('/health' if '/health' in [r.rule for r in server.app.url_map.iter_rules()] else '/api/status')
+responded = time.perf_counter()
+client.get('/')
+page = time.perf_counter()
+claude_client = server.hubspot_system.claude_client if server.hubspot_system else None
+claude = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'first_response_ms': (responded - started) * 1000,
+    'index_page_ms': (page - responded) * 1000,
+    'claude_client_ms': (claude - page) * 1000
+}}))
+"""
+
+
+def run_once(module: str) -> dict:
+    env = dict(os.environ)
+    # Startup must not depend on real credentials
+    env.setdefault('HUBSPOT_API_KEY', 'benchmark')
+    env.setdefault('ANTHROPIC_API_KEY', 'benchmark')
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD.format(module=module)],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else 'web_server_cloud'
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print(f"🧊 Cold-starting {module} {runs} times")
+    samples = [run_once(module) for _ in range(runs)]
+
+    print("=" * 60)
+    for key in ('import_ms', 'first_response_ms', 'index_page_ms', 'claude_client_ms'):
+        values = [sample[key] for sample in samples]
+        print(f"{key:<20} median {statistics.median(values):8.1f} ms   min {min(values):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Microbenchmark: decoding and flattening 100-record HubSpot search pages
+
+Usage:
+    python benchmark_json_decode.py                      # synthetic 100-record contact page
+    python benchmark_json_decode.py pages/*.json         # recorded search responses
+    python benchmark_json_decode.py --record pages 5     # record 5 pages from HubSpot first
+"""
+
+import glob
+import json
+import os
+import sys
+import time
+import random
+import requests
+from dotenv import load_dotenv
+
+import hubspot_json
+
+CONTACT_PROPERTIES = [
+    'email', 'firstname', 'lastname', 'phone', 'mobilephone', 'company', 'createdate',
+    'lastmodifieddate', 'lifecyclestage', 'hs_lead_status', 'city', 'state', 'country',
+    'website', 'jobtitle', 'hs_object_id'
+]
+
+
+def synthetic_page(records: int = 100) -> bytes:
+    """Build a page shaped like a real contacts search response"""
+    rng = random.Random(42)
+    results = []
+    for i in range(records):
+        properties = {prop: f"{prop}-value-{rng.randint(0, 10**6)}" for prop in CONTACT_PROPERTIES}
+        properties['hs_object_id'] = str(1000 + i)
+        properties['createdate'] = f"2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T10:15:30.123Z"
+        properties['jobtitle'] = None if i % 3 else properties['jobtitle']
+        results.append({
+            'id': str(1000 + i),
+            'properties': properties,
+            'createdAt': properties['createdate'],
+            'updatedAt': properties['createdate'],
+            'archived': False
+        })
+    return json.dumps({'total': 25000, 'results': results, 'paging': {'next': {'after': '100'}}}).encode()
+
+
+def record_pages(directory: str, pages: int):
+    """Save raw contacts search responses from the configured HubSpot portal"""
+    load_dotenv(override=True)
+    headers = {
+        'Authorization': f"Bearer {os.getenv('HUBSPOT_API_KEY')}",
+        'Content-Type': 'application/json'
+    }
+    os.makedirs(directory, exist_ok=True)
+    after = None
+    for page in range(pages):
+        payload = {'filterGroups': [], 'properties': CONTACT_PROPERTIES, 'limit': 100}
+        if after:
+            payload['after'] = after
+        response = requests.post(
+            'https://api.hubapi.com/crm/v3/objects/contacts/search',
+            headers=headers,
+            json=payload
+        )
+        response.raise_for_status()
+        with open(os.path.join(directory, f'contacts_page_{page}.json'), 'wb') as f:
+            f.write(response.content)
+        after = response.json().get('paging', {}).get('next', {}).get('after')
+        print(f"💾 Recorded page {page + 1}")
+        if not after:
+            break
+
+
+def baseline(raw: bytes):
+    """What the executor used to do: response.json() then copy each record"""
+    data = json.loads(raw.decode('utf-8'))
+    flattened = []
+    for item in data.get('results', []):
+        record = {'id': item.get('id')}
+        record.update(item['properties'])
+        flattened.append(record)
+    return flattened
+
+
+def decode_and_flatten(raw: bytes):
+    return hubspot_json.decode_search_response(raw)['results']
+
+
+def decode_typed(raw: bytes):
+    """The contacts path: flattening also copies each record into a ContactRecord"""
+    return hubspot_json.decode_search_response(raw, 'contacts')['results']
+
+
+def time_it(function, pages, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for raw in pages:
+                function(raw)
+        best = min(best, time.perf_counter() - start)
+    return best / (repeat * len(pages))
+
+
+def main():
+    args = sys.argv[1:]
+    if args[:1] == ['--record']:
+        record_pages(args[1], int(args[2]) if len(args) > 2 else 5)
+        args = [os.path.join(args[1], '*.json')]
+
+    paths = [path for pattern in args for path in glob.glob(pattern)]
+    if paths:
+        pages = [open(path, 'rb').read() for path in paths]
+        print(f"📂 Using {len(pages)} recorded page(s)")
+    else:
+        pages = [synthetic_page()]
+        print("🧪 Using a synthetic 100-record contacts page")
+
+    size_kb = sum(len(raw) for raw in pages) / len(pages) / 1024
+    repeat = 200
+
+    print(f"📏 Average page size: {size_kb:.1f} KB")
+    print("=" * 60)
+
+    base = time_it(baseline, pages, repeat)
+    print(f"{'baseline (json + copy)':<32} {base * 1e6:8.1f} µs/page")
+
+    for name in hubspot_json.BACKEND_PREFERENCE:
+        hubspot_json.use_backend(name)
+        if hubspot_json.backend_name != name:
+            print(f"{name + ' (not installed)':<32}")
+            continue
+        # Both paths must produce the same records
+        assert decode_and_flatten(pages[0]) == baseline(pages[0])
+        elapsed = time_it(decode_and_flatten, pages, repeat)
+        print(f"{name + ' decode+flatten':<32} {elapsed * 1e6:8.1f} µs/page  ({base / elapsed:.2f}x)")
+        assert decode_typed(pages[0]) == baseline(pages[0])
+        typed = time_it(decode_typed, pages, repeat)
+        print(f"{name + ' decode+typed records':<32} {typed * 1e6:8.1f} µs/page  ({base / typed:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
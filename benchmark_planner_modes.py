@@ -0,0 +1,82 @@
+"""
+Benchmark: tool-use planner vs free-text JSON planner against the live Claude API
+
+Usage:
+    python benchmark_planner_modes.py                  # built-in questions, 2 rounds
+    python benchmark_planner_modes.py questions.txt 3  # one question per line, 3 rounds
+"""
+
+import statistics
+import sys
+import time
+from dotenv import load_dotenv
+
+from hubspot_claude_system_cloud import HubSpotClaudeSystem
+from hubspot_model_router import TierStats
+
+QUESTIONS = [
+    "How many contacts do we have?",
+    "Show me recent contacts",
+    "Find contacts from California",
+    "Find the contact with phone number 4244854061",
+    "Show me deals over $5,000",
+    "Total deal amount by stage",
+    "Which companies have the most contacts?",
+    "Show me contacts created this week who are leads",
+    "Compare deals closed won this month versus last month",
+    "Find companies in the technology industry with more than 50 employees"
+]
+
+
+def run_mode(system: HubSpotClaudeSystem, mode: str, questions, rounds: int) -> dict:
+    system.planner_mode = mode
+    system.model_router.stats = TierStats()
+
+    latencies = []
+    fallbacks = 0
+    for _ in range(rounds):
+        for question in questions:
+            started = time.perf_counter()
+            plan = system.process_question_with_claude(question)
+            latencies.append(time.perf_counter() - started)
+            # Rule-based fallback plans mark every purpose with "(fallback)"
+            endpoints = (plan or {}).get('hubspot_endpoints') or []
+            if not endpoints or all('(fallback)' in str(e.get('purpose', '')) for e in endpoints):
+                fallbacks += 1
+
+    tiers = system.model_router.stats.summary()
+    calls = sum(tier['calls'] for tier in tiers.values())
+    return {
+        'questions': len(latencies),
+        'median_ms': statistics.median(latencies) * 1000,
+        'p95_ms': sorted(latencies)[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        'calls': calls,
+        'failed_calls': sum(tier['failures'] for tier in tiers.values()),
+        'escalations': sum(tier['escalations'] for tier in tiers.values()),
+        'fallbacks': fallbacks,
+        'output_tokens_per_call': sum(tier['output_tokens'] for tier in tiers.values()) / max(calls, 1),
+        'cost_usd': sum(tier['cost_usd'] for tier in tiers.values())
+    }
+
+
+def main():
+    load_dotenv(override=True)
+    questions = QUESTIONS
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            questions = [line.strip() for line in f if line.strip()]
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+
+    system = HubSpotClaudeSystem()
+    results = {mode: run_mode(system, mode, questions, rounds) for mode in ('text', 'tool')}
+
+    print("=" * 60)
+    print(f"{'':<24}{'text':>16}{'tool':>16}")
+    for key in results['text']:
+        text_value, tool_value = results['text'][key], results['tool'][key]
+        fmt = '{:>16.1f}' if isinstance(text_value, float) else '{:>16}'
+        print(f"{key:<24}" + fmt.format(text_value) + fmt.format(tool_value))
+
+
+if __name__ == "__main__":
+    main()
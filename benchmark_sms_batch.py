@@ -0,0 +1,246 @@
+"""
+Benchmark: bulk SMS composition vs the original per-contact composer, checking the output is identical,
+plus segment-aware composition and the segments it saves
+
+Usage:
+    python benchmark_sms_batch.py            # 100,000 synthetic contacts
+    python benchmark_sms_batch.py 500000     # contact count
+"""
+
+import random
+import sys
+import time
+from typing import Dict, List
+
+from hubspot_sms_batch import SmsBatchComposer
+from hubspot_sms_templates import SegmentReport
+
+FIRST_NAMES = ['Ana', 'Ben', 'Chidi', 'Dana', '  Eve ', '', 'Maximiliana-Josephine']
+COMPANIES = ['Acme', 'Globex', '', 'Initech', 'An Extremely Long Company Name That Pushes Past The Limit Inc']
+STAGES = ['appointmentscheduled', 'qualifiedtobuy', 'presentationscheduled', 'decisionmakerboughtin',
+          'contractsent', 'closedwon', 'closedlost', 'Proposal Sent', 'Negotiation', 'in progress']
+AMOUNTS = ['', '0', '950', '1500', '25000', '1250000', '$3,400.50', '12.5.1', None]
+
+
+def synthetic_campaign(count: int, seed: int = 7):
+    """Contacts plus a flat deal list (with contact_id), shaped like flattened search results"""
+    rng = random.Random(seed)
+    contacts, deals = [], []
+    for i in range(count):
+        contact = {'id': str(10000 + i), 'phone': f"415555{i % 10000:04d}"}
+        if i % 9:
+            contact['firstname'] = rng.choice(FIRST_NAMES)
+            contact['lastname'] = rng.choice(['Lee', 'Okafor', '', 'Santos'])
+        if i % 4:
+            contact['company'] = rng.choice(COMPANIES)
+        if i % 5 == 0:
+            contact['email'] = f"user{i}@example.com"
+        contacts.append(contact)
+
+        for _ in range(rng.choice([0, 0, 1, 1, 2, 3])):
+            deal = {
+                'contact_id': contact['id'],
+                'dealname': f"Deal {rng.randint(1, 500)}",
+                'amount': rng.choice(AMOUNTS),
+                'dealstage': rng.choice(STAGES),
+                'createdate': f"2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T10:00:00Z"
+            }
+            if rng.random() < 0.1:
+                del deal['dealname']
+            deals.append(deal)
+    return contacts, deals
+
+
+class PerContactComposer:
+    """The per-contact composer as it was in HubSpotClaudeSystem, frozen here as the reference output"""
+
+    def create_enhanced_sms_message(self, contact_record: Dict, deals: List[Dict]) -> str:
+        """Create a personalized SMS message including deal information"""
+
+        # Extract contact information
+        name = self.extract_name(contact_record)
+
+        # Base greeting
+        if deals:
+            # Contact has deals - create personalized message
+            return self.create_sms_with_deals(name, deals, contact_record)
+        else:
+            # Contact has no deals - create general follow-up message
+            return self.create_sms_without_deals(name, contact_record)
+
+    def create_sms_with_deals(self, name: str, deals: List[Dict], contact_record: Dict) -> str:
+        """Create SMS message when contact has deal data"""
+
+        # Sort deals by amount (highest first) and recency
+        sorted_deals = sorted(deals, key=lambda d: (
+            self.parse_deal_amount(d.get('amount', '0')), 
+            d.get('createdate', '')
+        ), reverse=True)
+
+        # Focus on the most significant deal(s)
+        primary_deal = sorted_deals[0] if sorted_deals else None
+
+        if not primary_deal:
+            return self.create_sms_without_deals(name, contact_record)
+
+        deal_name = primary_deal.get('dealname', 'your opportunity')
+        deal_amount = self.format_deal_amount(primary_deal.get('amount'))
+        deal_stage = primary_deal.get('dealstage', 'in progress')
+
+        # Create different messages based on deal stage and amount
+        if 'closed' in deal_stage.lower() and 'won' in deal_stage.lower():
+            # Closed won deal
+            message = f"Hi {name}! Congratulations on closing {deal_name}"
+            if deal_amount:
+                message += f" for {deal_amount}"
+            message += "! How are things going? Let's discuss next steps."
+
+        elif 'closed' in deal_stage.lower() and 'lost' in deal_stage.lower():
+            # Closed lost deal
+            message = f"Hi {name}, I wanted to follow up on {deal_name}. I'd love to understand what we could improve for future opportunities. Are you available for a quick chat?"
+
+        elif any(stage in deal_stage.lower() for stage in ['proposal', 'quote', 'contract']):
+            # Deal in proposal/contract stage
+            message = f"Hi {name}! Checking in on {deal_name}"
+            if deal_amount:
+                message += f" ({deal_amount})"
+            message += ". Do you have any questions about the proposal? Happy to discuss!"
+
+        elif any(stage in deal_stage.lower() for stage in ['negotiation', 'decision']):
+            # Deal in negotiation/decision stage
+            message = f"Hi {name}, following up on {deal_name}"
+            if deal_amount:
+                message += f" ({deal_amount})"
+            message += ". I'm here to help with any final questions or concerns you might have."
+
+        else:
+            # Early stage or unknown stage
+            message = f"Hi {name}! Wanted to touch base about {deal_name}"
+            if deal_amount:
+                message += f" ({deal_amount})"
+            message += ". How can I best support you moving forward?"
+
+        # Add multiple deals context if applicable
+        if len(sorted_deals) > 1:
+            message += f" (+ {len(sorted_deals) - 1} other opportunities)"
+
+        # Keep message under 160 characters for single SMS if possible
+        if len(message) > 160:
+            # Create shorter version
+            message = f"Hi {name}! Following up on {deal_name}"
+            if deal_amount:
+                message += f" ({deal_amount})"
+            message += ". Let's connect soon!"
+
+        return message
+
+    def create_sms_without_deals(self, name: str, contact_record: Dict) -> str:
+        """Create SMS message when contact has no deal data"""
+
+        # Check when contact was created to personalize message
+        created_date = contact_record.get('createdate', '')
+        company = contact_record.get('company', '')
+
+        if company:
+            message = f"Hi {name}! Hope things are going well at {company}. I'd love to explore how we can help support your goals. Are you available for a brief call?"
+        else:
+            message = f"Hi {name}! I wanted to reach out and see how we might be able to help with your current projects. Would you be interested in a quick conversation?"
+
+        # Keep under 160 characters
+        if len(message) > 160:
+            if company:
+                message = f"Hi {name}! Hope all is well at {company}. Would love to connect about how we can help. Available for a quick call?"
+            else:
+                message = f"Hi {name}! Would love to connect about your current projects and how we might help. Available for a quick call?"
+
+        return message
+
+    def parse_deal_amount(self, amount_str: str) -> float:
+        """Parse deal amount string to float for sorting"""
+        if not amount_str:
+            return 0.0
+
+        # Remove currency symbols, commas, and spaces
+        clean_amount = ''.join(c for c in str(amount_str) if c.isdigit() or c == '.')
+
+        try:
+            return float(clean_amount) if clean_amount else 0.0
+        except ValueError:
+            return 0.0
+
+    def format_deal_amount(self, amount_str: str) -> str:
+        """Format deal amount for display in SMS"""
+        if not amount_str:
+            return ""
+
+        amount = self.parse_deal_amount(amount_str)
+        if amount <= 0:
+            return ""
+
+        # Format based on amount size
+        if amount >= 1000000:
+            return f"${amount/1000000:.1f}M"
+        elif amount >= 1000:
+            return f"${amount/1000:.0f}K"
+        else:
+            return f"${amount:.0f}"
+
+    def extract_name(self, record: Dict) -> str:
+        """Extract name from a record"""
+
+        # Try different name combinations
+        if 'firstname' in record and 'lastname' in record:
+            first = record.get('firstname', '').strip()
+            last = record.get('lastname', '').strip()
+            if first or last:
+                return f"{first} {last}".strip()
+
+        # Try single name fields
+        name_fields = ['name', 'fullname', 'contact_name', 'dealname', 'company']
+        for field in name_fields:
+            if field in record and record[field]:
+                return str(record[field]).strip()
+
+        # Try email as fallback
+        if 'email' in record and record['email']:
+            return record['email'].split('@')[0]
+
+        return 'Contact'
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    contacts, deals = synthetic_campaign(count)
+    deals_by_contact = {}
+    for deal in deals:
+        deals_by_contact.setdefault(deal['contact_id'], []).append(deal)
+
+    reference = PerContactComposer()
+    started = time.perf_counter()
+    expected = [reference.create_enhanced_sms_message(contact, deals_by_contact.get(contact['id'], [])) for contact in contacts]
+    per_contact = time.perf_counter() - started
+
+    runs = {}
+    for label, contact_input, deal_input in (
+        ('batch (dict of lists)', contacts, deals_by_contact),
+        ('batch (flat deal list)', contacts, deals)
+    ):
+        started = time.perf_counter()
+        messages = SmsBatchComposer().compose(contact_input, deal_input)
+        runs[label] = (time.perf_counter() - started, messages == expected)
+    # Segment-aware composition: not comparable byte-for-byte, so report segments instead
+    started = time.perf_counter()
+    fitted = SmsBatchComposer(max_segments=1).compose(contacts, deals)
+    fitted_elapsed = time.perf_counter() - started
+
+    print(f"{count:,} contacts, {len(deals):,} deals")
+    print(f"{'per-contact':<26}{count / per_contact:>14,.0f} msg/s")
+    for label, (elapsed, identical) in runs.items():
+        print(f"{label:<26}{count / elapsed:>14,.0f} msg/s   identical: {identical}")
+    print(f"{'batch (1 segment budget)':<26}{count / fitted_elapsed:>14,.0f} msg/s")
+    print(f"segments: len() > 160 rule {SegmentReport.of(expected).segments:,}, "
+          f"segment budget {SegmentReport.of(fitted).segments:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Gunicorn settings for the cloud deployment (used by Procfile and render.yaml)
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import the app once in the master: modules, static assets and the system are shared
+# copy-on-write by every forked worker instead of being rebuilt per worker.
+# Clients and HTTP sessions are created lazily, so no sockets cross the fork.
+preload_app = True
+
+
+def post_worker_init(worker):
+    # The Claude SDK is imported lazily; pull it in off the request path so the
+    # first question doesn't pay for it
+    from web_startup import warm_imports
+    warm_imports(['anthropic'])
+
+    # Scheduled questions run without waiting for the worker's first request; every worker
+    # starts the thread, and the one that takes the schedule store's leader lock runs them
+    from web_server_cloud import scheduler
+    scheduler.start()
@@ -0,0 +1,166 @@
+"""
+Server-side aggregation (group-by, sum, avg, min, max, count) over HubSpot search results
+"""
+
+import math
+from array import array
+from typing import Dict, List, Any, Iterable
+
+from hubspot_columnar import ColumnarData, CATEGORICAL, NUMERIC
+
+SUPPORTED_OPERATIONS = ('count', 'sum', 'avg', 'min', 'max')
+
+# Key used for records where the group-by property is empty
+MISSING_GROUP = '(none)'
+
+
+def normalize_aggregation(aggregation: Dict) -> Dict:
+    """Fill in defaults and validate an aggregation spec from the plan"""
+
+    group_by = aggregation.get('group_by') or []
+    if isinstance(group_by, str):
+        group_by = [group_by]
+
+    metrics = []
+    for metric in aggregation.get('metrics') or [{'op': 'count'}]:
+        if isinstance(metric, str):
+            metric = {'op': metric}
+        op = str(metric.get('op', 'count')).lower()
+        if op not in SUPPORTED_OPERATIONS:
+            raise ValueError(f"Unsupported aggregation op '{op}' (use one of {', '.join(SUPPORTED_OPERATIONS)})")
+        prop = metric.get('property')
+        if op != 'count' and not prop:
+            raise ValueError(f"Aggregation op '{op}' needs a property")
+        name = metric.get('as') or (f"{op}_{prop}" if prop else op)
+        metrics.append({'op': op, 'property': prop, 'as': name})
+
+    order_by = aggregation.get('order_by') or metrics[0]['as']
+
+    return {
+        'group_by': list(group_by),
+        'metrics': metrics,
+        'order_by': order_by,
+        'descending': aggregation.get('descending', True),
+        'top_n': aggregation.get('top_n'),
+        'max_records': int(aggregation.get('max_records', 100000))
+    }
+
+
+def required_properties(spec: Dict) -> List[str]:
+    """Properties that must be fetched to evaluate the aggregation"""
+    properties = list(spec['group_by'])
+    for metric in spec['metrics']:
+        if metric['property'] and metric['property'] not in properties:
+            properties.append(metric['property'])
+    return properties
+
+
+def aggregate_columns(data: ColumnarData, spec: Dict) -> List[Dict[str, Any]]:
+    """Group and reduce columnar data, one pass per column"""
+
+    n_rows = len(data)
+    group_by = spec['group_by']
+
+    # Pass 1: dense integer group codes. A single group-by property reuses the
+    # column's dictionary codes directly; several are combined per row.
+    if len(group_by) == 1:
+        encoded = data.categorical(group_by[0])
+        codes = encoded.codes
+        group_keys = [(MISSING_GROUP if category is None else category,) for category in encoded.categories]
+    elif group_by:
+        encoded_columns = [data.categorical(prop) for prop in group_by]
+        codes = array('l', bytes(array('l').itemsize * n_rows))
+        group_keys = []
+        key_index: Dict[tuple, int] = {}
+        for row, key in enumerate(zip(*(column.codes for column in encoded_columns))):
+            code = key_index.get(key)
+            if code is None:
+                code = key_index[key] = len(group_keys)
+                group_keys.append(tuple(
+                    MISSING_GROUP if column.categories[part] is None else column.categories[part]
+                    for column, part in zip(encoded_columns, key)
+                ))
+            codes[row] = code
+    else:
+        codes = array('l', bytes(array('l').itemsize * n_rows))
+        group_keys = [()] if n_rows else []
+
+    n_groups = len(group_keys)
+    row_counts = array('l', bytes(array('l').itemsize * n_groups))
+    for code in codes:
+        row_counts[code] += 1
+
+    # Pass 2: one reduction pass per numeric column
+    reductions: Dict[str, Dict[str, array]] = {}
+    for prop in {metric['property'] for metric in spec['metrics'] if metric['property']}:
+        sums = array('d', bytes(8 * n_groups))
+        counts = array('l', bytes(array('l').itemsize * n_groups))
+        mins = array('d', [math.inf]) * n_groups
+        maxs = array('d', [-math.inf]) * n_groups
+        for code, value in zip(codes, data.numeric(prop)):
+            if value != value:  # NaN - missing value
+                continue
+            sums[code] += value
+            counts[code] += 1
+            if value < mins[code]:
+                mins[code] = value
+            if value > maxs[code]:
+                maxs[code] = value
+        reductions[prop] = {'sum': sums, 'count': counts, 'min': mins, 'max': maxs}
+
+    rows = []
+    for code, key in enumerate(group_keys):
+        # Dictionary categories can include values with no rows left in this result
+        if not row_counts[code]:
+            continue
+        row = dict(zip(group_by, key))
+        for metric in spec['metrics']:
+            op, prop = metric['op'], metric['property']
+            if not prop:
+                row[metric['as']] = row_counts[code]
+                continue
+            reduced = reductions[prop]
+            non_null = reduced['count'][code]
+            if op == 'count':
+                value = non_null
+            elif not non_null:
+                value = None
+            elif op == 'sum':
+                value = reduced['sum'][code]
+            elif op == 'avg':
+                value = reduced['sum'][code] / non_null
+            else:
+                value = reduced[op][code]
+            row[metric['as']] = value
+        rows.append(row)
+
+    order_by = spec['order_by']
+    rows.sort(
+        key=lambda r: (r.get(order_by) is not None, r.get(order_by) if r.get(order_by) is not None else 0),
+        reverse=spec['descending']
+    )
+
+    if spec['top_n']:
+        rows = rows[:int(spec['top_n'])]
+
+    return rows
+
+
+def aggregate_records(pages: Iterable[List[Dict]], aggregation: Dict) -> Dict[str, Any]:
+    """Aggregate an iterable of record pages; pages are consumed and dropped one at a time"""
+
+    spec = normalize_aggregation(aggregation)
+
+    # Group keys are stored dictionary-encoded and metrics as float64 columns
+    column_types = {prop: CATEGORICAL for prop in spec['group_by']}
+    column_types.update({m['property']: NUMERIC for m in spec['metrics'] if m['property']})
+    data = ColumnarData(column_types)
+
+    for page in pages:
+        data.append_records(page)
+
+    return {
+        'rows': aggregate_columns(data, spec),
+        'records_scanned': len(data),
+        'spec': spec
+    }
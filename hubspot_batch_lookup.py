@@ -0,0 +1,169 @@
+"""
+Multi-item lookups in a few requests: phone numbers and emails folded into IN filters,
+batches searched concurrently, and every record matched back to the input that found it
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Any, Optional
+
+from hubspot_plan_schema import MAX_FILTER_GROUPS, MAX_FILTERS_TOTAL
+from hubspot_projection import PHONE_FIELDS
+from hubspot_strategies import lookup_key, value_kind
+
+# Values HubSpot accepts in one IN filter
+MAX_IN_VALUES = 100
+# Inputs per request; most inputs match one record, so a batch usually fits one page
+BATCH_SIZE = 50
+
+# Properties searched per kind of input, OR'd as one filter group each. The calculated
+# properties hold national digits, which is what lookup_key() reduces a number to.
+LOOKUP_PROPERTIES = {
+    'phone': ['hs_searchable_calculated_phone_number', 'hs_searchable_calculated_mobile_number'],
+    'email': ['email']
+}
+# Record fields a result is matched back to its input on
+MATCH_FIELDS = {
+    'phone': PHONE_FIELDS + LOOKUP_PROPERTIES['phone'],
+    'email': ['email']
+}
+# Object types whose searches can filter on LOOKUP_PROPERTIES
+BATCHABLE_OBJECTS = {'contacts'}
+# Filter operators a plan uses to look one value up
+LOOKUP_OPERATORS = {'EQ', 'IN', 'CONTAINS_TOKEN'}
+
+
+def lookup_inputs(endpoints: List[Dict[str, Any]]) -> 'OrderedDict[str, str]':
+    """Distinct values a multi-item plan looks up, lookup key -> value as first written"""
+    inputs: 'OrderedDict[str, str]' = OrderedDict()
+    for entry in endpoints:
+        params = entry.get('params', {})
+        values = [params.get('query')] + [
+            value
+            for group in params.get('filterGroups') or [] for filter_item in group.get('filters', [])
+            for value in [filter_item.get('value')] + list(filter_item.get('values') or [])
+        ]
+        for value in values:
+            if value not in (None, '') and str(value).strip():
+                inputs.setdefault(lookup_key(str(value)), str(value).strip())
+    return inputs
+
+
+def batchable_lookup(endpoints: List[Dict[str, Any]]) -> bool:
+    """Whether a plan only looks items up: record searches on one object type whose every
+    filter matches a phone number or email (other filters would be lost when batching)"""
+    if not endpoints or len({entry.get('endpoint', '').strip('/').split('/')[-1] for entry in endpoints}) != 1:
+        return False
+    for entry in endpoints:
+        if entry.get('aggregation') or str(entry.get('mode', '')).lower() == 'count':
+            return False
+        params = entry.get('params', {})
+        filters = [filter_item for group in params.get('filterGroups') or [] for filter_item in group.get('filters', [])]
+        if not params.get('query') and not filters:
+            return False
+        for filter_item in filters:
+            if filter_item.get('operator', 'EQ') not in LOOKUP_OPERATORS:
+                return False
+            values = [filter_item.get('value')] + list(filter_item.get('values') or [])
+            if not all(value_kind(str(value)) in LOOKUP_PROPERTIES for value in values if value not in (None, '')):
+                return False
+    return True
+
+
+def batch_filter_groups(kind: str, keys: List[str]) -> List[Dict[str, Any]]:
+    """One filter group per searched property, each an IN over the batch's keys"""
+    if len(keys) > MAX_IN_VALUES:
+        raise ValueError(f"{len(keys)} values in one IN filter (HubSpot allows {MAX_IN_VALUES})")
+    if len(LOOKUP_PROPERTIES[kind]) > min(MAX_FILTER_GROUPS, MAX_FILTERS_TOTAL):
+        raise ValueError(f"Too many {kind} properties for one search (HubSpot allows {MAX_FILTER_GROUPS} groups)")
+    return [
+        {'filters': [{'propertyName': name, 'operator': 'IN', 'values': list(keys)}]}
+        for name in LOOKUP_PROPERTIES[kind]
+    ]
+
+
+def record_keys(record: Dict[str, Any], kind: str) -> set:
+    return {lookup_key(str(record[name])) for name in MATCH_FIELDS[kind] if record.get(name)}
+
+
+@dataclass
+class LookupMatches:
+    """Records found for each input; inputs with no record map to an empty list"""
+    inputs: Dict[str, str]
+    matches: Dict[str, List[str]]
+    records: 'OrderedDict[str, Dict[str, Any]]' = field(default_factory=OrderedDict)
+    requests: int = 0
+
+    @property
+    def misses(self) -> List[str]:
+        return [self.inputs[key] for key, ids in self.matches.items() if not ids]
+
+    def by_input(self) -> Dict[str, List[str]]:
+        """Input as asked -> matching record IDs, misses included"""
+        return {self.inputs[key]: ids for key, ids in self.matches.items()}
+
+
+class BatchLookup:
+    """Looks up many phone numbers/emails with O(N / batch_size) searches instead of one per format per item
+
+    search(object_type, params, properties, max_records) returns the flattened records of a
+    search; inputs that cannot be folded into an IN filter (names...) get a free-text query each.
+    """
+
+    def __init__(self, search: Callable[..., List[Dict]], batch_size: int = BATCH_SIZE, max_workers: int = 4):
+        self.search = search
+        self.batch_size = max(1, min(batch_size, MAX_IN_VALUES))
+        self.max_workers = max_workers
+
+    def run(self, object_type: str, inputs: Dict[str, str], properties: Optional[Iterable[str]] = None,
+            per_item_limit: int = 5) -> LookupMatches:
+        result = LookupMatches(inputs=dict(inputs), matches={key: [] for key in inputs})
+
+        by_kind: Dict[str, List[str]] = {}
+        for key, value in inputs.items():
+            kind = value_kind(value) if object_type in BATCHABLE_OBJECTS else 'text'
+            by_kind.setdefault(kind if kind in LOOKUP_PROPERTIES else 'text', []).append(key)
+
+        properties = list(properties or [])
+        jobs = []
+        for kind, keys in by_kind.items():
+            if kind == 'text':
+                jobs.extend(('text', [key], properties) for key in keys)
+                continue
+            fields = properties + [name for name in MATCH_FIELDS[kind] if name not in properties]
+            jobs.extend(
+                (kind, keys[start:start + self.batch_size], fields)
+                for start in range(0, len(keys), self.batch_size)
+            )
+
+        def run_job(job):
+            kind, keys, fields = job
+            if kind == 'text':
+                return job, self.search(object_type, {'query': inputs[keys[0]]}, fields, per_item_limit)
+            return job, self.search(
+                object_type, {'filterGroups': batch_filter_groups(kind, keys)}, fields, len(keys) * per_item_limit
+            )
+
+        print(f"🔢 Looking up {len(inputs)} items with {len(jobs)} searches")
+        with ThreadPoolExecutor(max_workers=max(1, min(len(jobs), self.max_workers))) as executor:
+            outcomes = list(executor.map(run_job, jobs))
+        result.requests = len(jobs)
+
+        for (kind, keys, _), records in outcomes:
+            for record in records or []:
+                record_id = str(record.get('id'))
+                if kind == 'text':
+                    matched = keys
+                else:
+                    found = record_keys(record, kind)
+                    matched = [key for key in keys if key in found]
+                for key in matched:
+                    if record_id not in result.matches[key]:
+                        result.matches[key].append(record_id)
+                if matched and record_id not in result.records:
+                    result.records[record_id] = record
+
+        hits = sum(1 for ids in result.matches.values() if ids)
+        print(f"   ✅ {hits}/{len(inputs)} items matched ({len(result.records)} records, {len(result.misses)} misses)")
+        return result
@@ -1,15 +1,51 @@
 import os
-import json
+import hashlib
 import requests
-from datetime import datetime, timedelta
+import threading
+import time
+from datetime import datetime
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
-import anthropic
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from hubspot_aggregation import aggregate_records, normalize_aggregation, required_properties
+from hubspot_batch_lookup import BatchLookup, batchable_lookup, lookup_inputs
+from hubspot_dates import DateContext
+from hubspot_property_schema import PropertySchema, default_cache_dir
+from hubspot_projection import project_plan_properties
+from hubspot_json import decode_search_response, loads as json_loads
+from hubspot_model_router import ModelRouter
+from hubspot_plan_schema import MAX_FILTERS_PER_GROUP, hubspot_error_detail, parse_plan_json
+from hubspot_pipelines import PipelineCache, add_stage_labels
+from hubspot_plan_tool import PLAN_TOOL, PLANNER_MODES
+from hubspot_records import HubSpotRecord, dialable_phone, display_name
+from hubspot_sessions import add_filter, claude_refinement, plan_object_type, rule_refinement
+from hubspot_sms_templates import SegmentReport, SmsTemplate
+from hubspot_strategies import StrategyOrderer, lookup_key
+from hubspot_tenants import DEFAULT_TENANT, RateLimitedSession, TenantConfig, TokenBucket
 
 # Load environment variables with override
 load_dotenv(override=True)
 
+# HubSpot search refuses to page past this many results for a single query
+HUBSPOT_SEARCH_WINDOW = 10000
+
+# Order of displayed results when the plan gives no sorts
+DEFAULT_SORTS = [{'propertyName': 'createdate', 'direction': 'DESCENDING'}]
+
+# Actions that only reach the first records of a result (the top of what was displayed)
+ACTION_RECORD_LIMITS = {'send_sms': 5, 'create_task': 5}
+
+# After a failed portal id lookup, webhook batches are skipped this long before trying again
+PORTAL_RETRY_SECONDS = 300
+
+
+class HubSpotPagingError(Exception):
+    """Raised when a search cannot be paged to the end, so a partial result is never taken as complete"""
+    pass
+
+FOLLOW_UP_SMS = SmsTemplate("Hi {name}! Following up on your inquiry. Let's connect soon!", shrinkable=('name',))
+
 @dataclass
 class QueryResult:
     """Structure for query results"""
@@ -18,31 +54,145 @@ class QueryResult:
     query_type: str
     timestamp: datetime
     total_count: int = 0  # Total count from API (different from len(data))
+    # Multi-item lookups: each input as asked -> IDs of the records it matched ([] for a miss)
+    lookup_matches: Optional[Dict[str, List[str]]] = None
+    
+    def to_json(self) -> Dict[str, Any]:
+        """JSON-ready form (records as plain dicts)"""
+        return {
+            'data': list(self.data),
+            'source': self.source,
+            'query_type': self.query_type,
+            'timestamp': self.timestamp.isoformat(),
+            'total_count': self.total_count,
+            'lookup_matches': self.lookup_matches
+        }
+    
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> 'QueryResult':
+        return cls(**{**data, 'timestamp': datetime.fromisoformat(data['timestamp'])})
+
+
+def result_to_json(result: Dict[str, Any]) -> Dict[str, Any]:
+    """An answer from execute_plan in JSON-ready form (how scheduled answers are shared between workers)"""
+    return {**result, 'results': [query_result.to_json() for query_result in result['results']]}
+
+
+def result_from_json(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {**data, 'results': [QueryResult.from_json(query_result) for query_result in data['results']]}
+
 
 class HubSpotClaudeSystem:
-    def __init__(self):
-        """Initialize the system with API keys"""
+    def __init__(self, tenant: TenantConfig = None):
+        """Initialize the system with API keys (from the environment unless a tenant is given)"""
+        
+        self.tenant = tenant or TenantConfig.from_env()
         
         # HubSpot Configuration
-        self.hubspot_api_key = os.getenv('HUBSPOT_API_KEY')
+        self.hubspot_api_key = self.tenant.hubspot_api_key
         self.hubspot_base_url = "https://api.hubapi.com"
-        
-        # Claude Configuration
-        self.claude_client = anthropic.Anthropic(
-            api_key=os.getenv('ANTHROPIC_API_KEY')
-        )
+        self.rate_limiter = TokenBucket(self.tenant.rate_limit, self.tenant.burst)
+        
+        # The Claude client and HTTP sessions are built on first use (see the properties
+        # below): importing the anthropic SDK alone costs ~0.5s of cold start
+        self._claude_client = None
+        self._hubspot_session = None
+        self._kixie_session = None
+        self._client_lock = threading.Lock()
+        self.model_router = ModelRouter(pinned_model=self.tenant.claude_model)
+        # 'tool': the plan comes back as typed tool input; 'text': free-text JSON (PLANNER_MODE)
+        planner_mode = os.getenv('PLANNER_MODE', 'tool')
+        self.planner_mode = planner_mode if planner_mode in PLANNER_MODES else 'tool'
         
         # Kixie SMS API Configuration
         self.kixie_config = {
-            'api_key': os.getenv('KIXIE_API_KEY'),
-            'business_id': os.getenv('KIXIE_BUSINESS_ID'),
+            'api_key': self.tenant.kixie_api_key,
+            'business_id': self.tenant.kixie_business_id,
             'base_url': 'https://apig.kixie.com/app/event',
-            'sender_email': os.getenv('SENDER_EMAIL', 'cmarshall@kixie.com')
+            'sender_email': self.tenant.sender_email
         }
+        # Messages are shortened to fit this many SMS segments (GSM-7/UCS-2 aware)
+        self.sms_max_segments = int(os.getenv('SMS_MAX_SEGMENTS', 1))
+        
+        # Deal stage IDs -> labels/probabilities, loaded once and refreshed on a TTL
+        self.pipelines = PipelineCache(
+            self.fetch_deal_pipelines,
+            ttl_seconds=int(os.getenv('PIPELINE_CACHE_TTL', 3600))
+        )
+        # Every object's properties, custom ones included, cached on disk per portal
+        self.property_schema = PropertySchema(
+            self.fetch_property_metadata,
+            cache_path=self.property_cache_path(),
+            ttl_seconds=int(os.getenv('PROPERTY_CACHE_TTL', 21600))
+        )
+        self.schema_digest_tokens = int(os.getenv('SCHEMA_DIGEST_TOKENS', 1200))
+        # Portal timezone and fiscal calendar for "this week", "last month", "this quarter"...
+        self.dates = DateContext.for_tenant(self.tenant)
+        # Which lookup strategies find records, and how fast, per kind of value looked up
+        self.strategy_orderer = StrategyOrderer()
+        # Multi-item plans: many numbers/emails folded into a few concurrent IN searches
+        self.batch_lookup = BatchLookup(self.search_records, batch_size=int(os.getenv('LOOKUP_BATCH_SIZE', 50)))
+        # Only webhook events from this tenant's own portal are applied; looked up when not configured
+        self._hubspot_portal_id = str(
+            self.tenant.integrations.get('hubspot_portal_id')
+            or (os.getenv('HUBSPOT_PORTAL_ID') if self.tenant.tenant_id == DEFAULT_TENANT else '')
+            or ''
+        ) or None
+        self._portal_retry_at = 0.0
         
         # Skip MySQL database connection for cloud deployment
         print("✅ HubSpot system initialized (cloud mode - no MySQL)")
         
+    @property
+    def claude_client(self):
+        """Anthropic client, created (and the SDK imported) on first use"""
+        if self._claude_client is None:
+            with self._client_lock:
+                if self._claude_client is None:
+                    import anthropic
+                    self._claude_client = anthropic.Anthropic(
+                        api_key=self.tenant.anthropic_api_key
+                    )
+        return self._claude_client
+
+    @property
+    def hubspot_portal_id(self) -> Optional[str]:
+        """The portal (hub) id of this tenant's HubSpot credentials; None while it can't be looked up"""
+        if self._hubspot_portal_id is None and time.monotonic() >= self._portal_retry_at:
+            portal_id = self.get_hubspot_data('account-info/v3/details').get('portalId')
+            if portal_id:
+                self._hubspot_portal_id = str(portal_id)
+                print(f"🏢 HubSpot portal for tenant '{self.tenant.tenant_id}': {portal_id}")
+            else:
+                self._portal_retry_at = time.monotonic() + PORTAL_RETRY_SECONDS
+        return self._hubspot_portal_id
+
+    @property
+    def hubspot_session(self) -> requests.Session:
+        """Pooled, tenant-rate-limited HTTP session for HubSpot, created on first use"""
+        if self._hubspot_session is None:
+            with self._client_lock:
+                if self._hubspot_session is None:
+                    self._hubspot_session = self._new_session(bucket=self.rate_limiter)
+        return self._hubspot_session
+
+    @property
+    def kixie_session(self) -> requests.Session:
+        """Pooled HTTP session for Kixie, created on first use"""
+        if self._kixie_session is None:
+            with self._client_lock:
+                if self._kixie_session is None:
+                    self._kixie_session = self._new_session()
+        return self._kixie_session
+
+    @staticmethod
+    def _new_session(pool_size: int = 16, bucket: TokenBucket = None) -> requests.Session:
+        # Enough pooled connections for the parallel count/search threads
+        session = RateLimitedSession(bucket)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        return session
+
     def connect_to_database(self):
         """Skip database connection for cloud deployment"""
         print("ℹ️  Database connection skipped in cloud mode")
@@ -57,14 +207,47 @@ class HubSpotClaudeSystem:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = self.hubspot_session.get(url, headers=headers, params=params)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"❌ HubSpot API error: {e}")
+            print(f"❌ HubSpot API error: {e}{hubspot_error_detail(e)}")
             return {}
     
-    def get_hubspot_contacts(self, limit: int = 100, properties: list = None, filters: list = None, query: str = None) -> Dict:
+    def fetch_deal_pipelines(self) -> Dict:
+        """Every deal pipeline with its stages (read through self.pipelines, not per record)"""
+        return self.get_hubspot_data('crm/v3/pipelines/deals')
+    
+    def apply_webhook_batch(self, batch) -> None:
+        """Invalidate the metadata caches that a batch of HubSpot changes shows to be out of date"""
+        for change in batch.changes:
+            if change.changes:
+                self.property_schema.observe(change.object_type, change.changes)
+            if change.object_type == 'deals' and 'dealstage' in change.changes:
+                self.pipelines.observe_stage(change.properties['dealstage'])
+    
+    def fetch_property_metadata(self, object_type: str, etag: str = None) -> tuple:
+        """(properties response, ETag) for one object; (None, etag) when unchanged since etag"""
+        headers = {'Authorization': f'Bearer {self.hubspot_api_key}'}
+        if etag:
+            headers['If-None-Match'] = etag
+        response = self.hubspot_session.get(
+            f"{self.hubspot_base_url}/crm/v3/properties/{object_type}",
+            headers=headers,
+            params={'archived': 'false'}
+        )
+        if response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        return response.json(), response.headers.get('ETag')
+    
+    def property_cache_path(self) -> str:
+        """Property cache file for this tenant's portal (a new API key may mean another portal)"""
+        portal = hashlib.sha256((self.hubspot_api_key or '').encode()).hexdigest()[:16]
+        cache_dir = os.getenv('PROPERTY_CACHE_DIR') or default_cache_dir()
+        return os.path.join(cache_dir, f"{self.tenant.tenant_id}-{portal}.json")
+    
+    def get_hubspot_contacts(self, limit: int = 100, properties: list = None, filters: list = None, query: str = None, sorts: list = None, flatten: bool = False) -> Dict:
         """Get contacts using the search endpoint (more reliable than GET)"""
         
         if properties is None:
@@ -76,14 +259,14 @@ class HubSpotClaudeSystem:
                 'query': query,
                 'properties': properties,
                 'limit': min(limit, 100),  # HubSpot max is 100 per request
-                'sorts': [{'propertyName': 'createdate', 'direction': 'DESCENDING'}]
+                'sorts': sorts or DEFAULT_SORTS
             }
         else:
             search_payload = {
                 'filterGroups': filters or [],
                 'properties': properties,
                 'limit': min(limit, 100),  # HubSpot max is 100 per request
-                'sorts': [{'propertyName': 'createdate', 'direction': 'DESCENDING'}]
+                'sorts': sorts or DEFAULT_SORTS
             }
         
         headers = {
@@ -92,18 +275,20 @@ class HubSpotClaudeSystem:
         }
         
         try:
-            response = requests.post(
+            response = self.hubspot_session.post(
                 f"{self.hubspot_base_url}/crm/v3/objects/contacts/search",
                 headers=headers,
                 json=search_payload
             )
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"❌ HubSpot contacts error: {e}")
+            if flatten:
+                return decode_search_response(response.content, 'contacts')
+            return json_loads(response.content)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"❌ HubSpot contacts error: {e}{hubspot_error_detail(e)}")
             return {}
     
-    def get_hubspot_deals(self, limit: int = 100, properties: list = None, filters: list = None) -> Dict:
+    def get_hubspot_deals(self, limit: int = 100, properties: list = None, filters: list = None, sorts: list = None, flatten: bool = False) -> Dict:
         """Get deals using the search endpoint"""
         
         if properties is None:
@@ -113,7 +298,7 @@ class HubSpotClaudeSystem:
             'filterGroups': filters or [],
             'properties': properties,
             'limit': min(limit, 100),
-            'sorts': [{'propertyName': 'createdate', 'direction': 'DESCENDING'}]
+            'sorts': sorts or DEFAULT_SORTS
         }
         
         headers = {
@@ -122,18 +307,20 @@ class HubSpotClaudeSystem:
         }
         
         try:
-            response = requests.post(
+            response = self.hubspot_session.post(
                 f"{self.hubspot_base_url}/crm/v3/objects/deals/search",
                 headers=headers,
                 json=search_payload
             )
             response.raise_for_status()
-            return response.json()
+            if flatten:
+                return decode_search_response(response.content, 'deals')
+            return json_loads(response.content)
         except Exception as e:
-            print(f"❌ HubSpot deals error: {e}")
+            print(f"❌ HubSpot deals error: {e}{hubspot_error_detail(e)}")
             return {}
     
-    def get_hubspot_companies(self, limit: int = 100, properties: list = None, filters: list = None) -> Dict:
+    def get_hubspot_companies(self, limit: int = 100, properties: list = None, filters: list = None, sorts: list = None, flatten: bool = False) -> Dict:
         """Get companies using the search endpoint"""
         
         if properties is None:
@@ -143,7 +330,7 @@ class HubSpotClaudeSystem:
             'filterGroups': filters or [],
             'properties': properties,
             'limit': min(limit, 100),
-            'sorts': [{'propertyName': 'createdate', 'direction': 'DESCENDING'}]
+            'sorts': sorts or DEFAULT_SORTS
         }
         
         headers = {
@@ -152,67 +339,190 @@ class HubSpotClaudeSystem:
         }
         
         try:
-            response = requests.post(
+            response = self.hubspot_session.post(
                 f"{self.hubspot_base_url}/crm/v3/objects/companies/search",
                 headers=headers,
                 json=search_payload
             )
             response.raise_for_status()
-            return response.json()
+            if flatten:
+                return decode_search_response(response.content, 'companies')
+            return json_loads(response.content)
         except Exception as e:
-            print(f"❌ HubSpot companies error: {e}")
+            print(f"❌ HubSpot companies error: {e}{hubspot_error_detail(e)}")
             return {}
     
-    def get_database_schema(self) -> Dict[str, List[str]]:
-        """Get HubSpot schema for Claude to understand the structure"""
-        
-        # HubSpot object types and their common properties
-        hubspot_objects = {
-            'contacts': [
-                'id', 'email', 'firstname', 'lastname', 'phone', 'company', 
-                'createdate', 'lastmodifieddate', 'lifecyclestage', 'hs_lead_status',
-                'city', 'state', 'country', 'website', 'jobtitle'
-            ],
-            'companies': [
-                'id', 'name', 'domain', 'industry', 'city', 'state', 'country',
-                'createdate', 'numberofemployees', 'annualrevenue', 'phone', 'website'
-            ],
-            'deals': [
-                'id', 'dealname', 'amount', 'dealstage', 'pipeline', 'createdate', 
-                'closedate', 'hubspot_owner_id', 'dealtype', 'description'
-            ],
-            'tickets': [
-                'id', 'subject', 'content', 'hs_pipeline_stage', 'createdate',
-                'hs_ticket_priority', 'hubspot_owner_id'
-            ]
+    def get_hubspot_count(self, endpoint: str, filters: list = None, query: str = None) -> Optional[int]:
+        """Get only the total number of matching records (no record payloads)"""
+        
+        object_type = endpoint.split('/')[-1] if '/' in endpoint else endpoint
+        
+        # limit=1 is the smallest page HubSpot accepts; hs_object_id is returned
+        # with every record anyway, so this keeps the response to a single id
+        search_payload = {
+            'properties': ['hs_object_id'],
+            'limit': 1
         }
+        if query:
+            search_payload['query'] = query
+        else:
+            search_payload['filterGroups'] = filters or []
         
-        return {
-            'hubspot': hubspot_objects
+        headers = {
+            'Authorization': f'Bearer {self.hubspot_api_key}',
+            'Content-Type': 'application/json'
         }
+        
+        try:
+            response = self.hubspot_session.post(
+                f"{self.hubspot_base_url}/crm/v3/objects/{object_type}/search",
+                headers=headers,
+                json=search_payload
+            )
+            response.raise_for_status()
+            return json_loads(response.content).get('total', 0)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"❌ HubSpot count error ({object_type}): {e}{hubspot_error_detail(e)}")
+            return None
     
-    def process_question_with_claude(self, question: str) -> Dict[str, Any]:
-        """Send question to Claude to determine what data to query and how"""
+    def iter_hubspot_search_pages(self, endpoint: str, params: Dict, properties: List[str] = None, max_records: int = 100000, sorts: List[Dict] = None):
+        """Yield pages of flattened records for a search, following HubSpot's paging cursor
+
+        With sorts the records keep that order, but only the first HUBSPOT_SEARCH_WINDOW can be reached
+        """
+        
+        object_type = endpoint.split('/')[-1] if '/' in endpoint else endpoint
+        filter_groups = params.get('filterGroups') or []
+        query = params.get('query')
+        properties = properties or params.get('properties') or []
         
-        schema = self.get_database_schema()
+        headers = {
+            'Authorization': f'Bearer {self.hubspot_api_key}',
+            'Content-Type': 'application/json'
+        }
+        
+        fetched = 0
+        last_id = None
+        
+        while fetched < max_records:
+            # Search results stop at HUBSPOT_SEARCH_WINDOW, so walk hs_object_id in
+            # ascending windows and restart the cursor after the last id seen
+            window_groups = filter_groups
+            if last_id is not None and sorts:
+                return  # a caller's own order can't be split into id windows
+            if last_id is not None:
+                if any(len(group.get('filters', [])) >= MAX_FILTERS_PER_GROUP for group in filter_groups):
+                    raise HubSpotPagingError(
+                        f"{object_type} search has more than {HUBSPOT_SEARCH_WINDOW:,} results and a filter group "
+                        f"with no room for the id window ({MAX_FILTERS_PER_GROUP} filters per group)"
+                    )
+                id_filter = {'propertyName': 'hs_object_id', 'operator': 'GT', 'value': last_id}
+                window_groups = [
+                    {'filters': group.get('filters', []) + [id_filter]} for group in filter_groups
+                ] or [{'filters': [id_filter]}]
+            
+            after = None
+            window_count = 0
+            
+            while fetched < max_records:
+                search_payload = {
+                    'filterGroups': window_groups,
+                    'properties': properties,
+                    'limit': min(100, max_records - fetched),
+                    'sorts': sorts or [{'propertyName': 'hs_object_id', 'direction': 'ASCENDING'}]
+                }
+                if query:
+                    search_payload['query'] = query
+                if after:
+                    search_payload['after'] = after
+                
+                try:
+                    response = self.hubspot_session.post(
+                        f"{self.hubspot_base_url}/crm/v3/objects/{object_type}/search",
+                        headers=headers,
+                        json=search_payload
+                    )
+                    response.raise_for_status()
+                    data = decode_search_response(response.content, object_type)
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    print(f"❌ HubSpot paging error ({object_type}): {e}{hubspot_error_detail(e)}")
+                    raise HubSpotPagingError(f"{object_type} search failed after {fetched:,} records: {e}") from e
+                
+                page = data.get('results', [])
+                if not page:
+                    return
+                
+                fetched += len(page)
+                window_count += len(page)
+                last_id = page[-1]['id']
+                yield page
+                
+                after = data.get('paging', {}).get('next', {}).get('after')
+                if not after:
+                    return
+                if window_count + 100 > HUBSPOT_SEARCH_WINDOW:
+                    break
+    
+    def search_records(self, object_type: str, params: Dict, properties: List[str] = None, max_records: int = 100) -> List[Dict]:
+        """Every flattened record of one search, up to max_records"""
+        return [
+            record
+            for page in self.iter_hubspot_search_pages(object_type, params, properties=properties, max_records=max_records)
+            for record in page
+        ]
+    
+    def iter_plan_records(self, endpoints: List[Dict], max_records: int = 100000, ordered: bool = False):
+        """Yield pages of every record a plan matches, deduplicated across strategies
+
+        ordered keeps each strategy's sorts (the order its results were displayed in) and its limit
+        """
         
-        # Get current date information for Claude to use
-        from datetime import datetime, timedelta
-        import calendar
+        # Exports always want rows, so count and aggregation entries are fetched as records;
+        # only endpoints of the first object type are used so every page has the same columns
+        object_types = [e['endpoint'].split('/')[-1] for e in endpoints]
+        seen_ids = set()
+        remaining = max_records
         
-        now = datetime.now()
-        current_month_start = datetime(now.year, now.month, 1)
-        current_month_start_iso = current_month_start.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        for endpoint_config, object_type in zip(endpoints, object_types):
+            if object_type != object_types[0]:
+                print(f"⏭️  Skipping {object_type} strategy in {object_types[0]} export")
+                continue
+            
+            params = endpoint_config.get('params', {})
+            # Count and aggregation entries have no page of their own to stay within
+            limit = params.get('limit') if ordered and not self.is_count_endpoint(endpoint_config) and 'aggregation' not in endpoint_config else None
+            for page in self.iter_hubspot_search_pages(
+                object_type,
+                params,
+                max_records=min(remaining, limit or remaining),
+                sorts=(params.get('sorts') or DEFAULT_SORTS) if ordered else None
+            ):
+                if len(endpoints) > 1:
+                    page = [record for record in page if record['id'] not in seen_ids]
+                    seen_ids.update(record['id'] for record in page)
+                if page:
+                    remaining -= len(page)
+                    yield page
+                if remaining <= 0:
+                    return
+    
+    def get_database_schema(self) -> Dict[str, List[str]]:
+        """Get HubSpot schema for Claude to understand the structure (every property from the metadata API)"""
+        return {
+            'hubspot': self.property_schema.schema()
+        }
+    
+    def process_question_with_claude(self, question: str) -> Dict[str, Any]:
+        """Send question to Claude to determine what data to query and how"""
         
-        last_month = now.replace(day=1) - timedelta(days=1)
-        last_month_start = datetime(last_month.year, last_month.month, 1)
-        last_month_start_iso = last_month_start.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        # Token-budgeted: portals can have hundreds of properties per object
+        schema_digest = self.property_schema.digest(max_tokens=self.schema_digest_tokens)
         
-        # Get week start (Monday)
-        days_since_monday = now.weekday()
-        week_start = now - timedelta(days=days_since_monday)
-        week_start_midnight = datetime(week_start.year, week_start.month, week_start.day)
-        week_start_iso = week_start_midnight.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        # Period boundaries in the portal's timezone, as UTC (computed once per local day)
+        periods = self.dates.periods()
+        current_month_start_iso = periods.iso('month_start')
+        last_month_start_iso = periods.iso('last_month_start')
+        week_start_iso = periods.iso('week_start')
         
         system_prompt = f"""
         You are an AI assistant that helps analyze business questions about HubSpot CRM data.
@@ -220,14 +530,17 @@ class HubSpotClaudeSystem:
         Available data source:
         - HubSpot API - Real-time CRM data including contacts, companies, deals, and tickets
         
-        HubSpot Schema:
-        {json.dumps(schema['hubspot'], indent=2)}
+        HubSpot Schema (object: properties; custom ones show "label"(type), enumerations {{options}}):
+        {schema_digest}
         
-        CURRENT DATE CONTEXT (use these exact values):
-        - Today's date: {now.strftime("%Y-%m-%d")}
+        CURRENT DATE CONTEXT (use these exact values; timezone {periods.timezone_name}):
+        - Today's date: {periods.today.isoformat()}
+        - Today start: {periods.iso('day_start')}
         - Current month start: {current_month_start_iso}
         - Last month start: {last_month_start_iso}
         - This week start: {week_start_iso}
+        - This fiscal quarter start (Q{periods.fiscal_quarter}): {periods.iso('quarter_start')}
+        - This fiscal year start (FY{periods.fiscal_year}): {periods.iso('year_start')}
         
         Your task is to:
         1. Understand the user's question
@@ -268,6 +581,37 @@ class HubSpotClaudeSystem:
         Strategy 3 - General search query:
         "query": "4244854061"
         
+        COUNT QUESTIONS ("How many...", "number of...", "count of..."):
+        Add "mode": "count" to each endpoint entry. Only the total is fetched, so
+        omit "properties" and "limit". Use one entry per filter you need counted;
+        they run in parallel. Example for "How many contacts and deals do we have?":
+        "hubspot_endpoints": [
+            {{"endpoint": "contacts", "mode": "count", "params": {{}}, "purpose": "Count all contacts"}},
+            {{"endpoint": "deals", "mode": "count", "params": {{}}, "purpose": "Count all deals"}}
+        ]
+        
+        AGGREGATION QUESTIONS ("which companies have the most contacts", "total deal amount by stage", "average deal size"):
+        Add an "aggregation" object to the endpoint entry. The server pages through every
+        matching record and groups it, so do not set "limit" or "properties".
+        - "group_by": property name (or list of names); omit for totals over all records
+        - "metrics": list of {{"op": "count" | "sum" | "avg" | "min" | "max", "property": "<numeric property>"}}
+        - "top_n": number of groups to return, ordered by the first metric (descending)
+        - "order_by": optional metric name such as "sum_amount" or "count"
+        Example for "Total deal amount by stage":
+        "hubspot_endpoints": [
+            {{
+                "endpoint": "deals",
+                "params": {{"filterGroups": []}},
+                "aggregation": {{
+                    "group_by": "dealstage",
+                    "metrics": [{{"op": "sum", "property": "amount"}}, {{"op": "count"}}]
+                }},
+                "purpose": "Sum deal amounts per stage"
+            }}
+        ]
+        Example for "Which companies have the most contacts?":
+        "aggregation": {{"group_by": "company", "metrics": [{{"op": "count"}}], "top_n": 10}}
+        
         IMPORTANT: Respond with ONLY a valid JSON object, no additional text.
         
         Example for "Find contacts that contain the phone number 14244854061":
@@ -329,26 +673,20 @@ class HubSpotClaudeSystem:
         """
         
         try:
-            response = self.claude_client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=2000,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": f"Question: {question}"}
-                ]
+            # Simple questions go to the fast tier; invalid plans escalate to the larger model
+            parsed_response = self.model_router.plan(
+                self.claude_client,
+                system_prompt,
+                question,
+                parse=self.extract_json_from_response,
+                validate=self.check_plan,
+                tool=PLAN_TOOL if self.planner_mode == 'tool' else None
             )
             
-            # Get Claude's response
-            claude_response = response.content[0].text.strip()
-            print(f"📝 Claude raw response: {claude_response[:200]}...")
-            
-            # Try to extract JSON from the response
-            parsed_response = self.extract_json_from_response(claude_response)
-            
             if parsed_response:
                 return parsed_response
             else:
-                print("⚠️  Could not parse Claude's response, using fallback")
+                print("⚠️  No tier produced a usable plan, using fallback")
                 return self.get_fallback_analysis(question)
             
         except Exception as e:
@@ -357,47 +695,48 @@ class HubSpotClaudeSystem:
             return self.get_fallback_analysis(question)
     
     def extract_json_from_response(self, response_text: str) -> Dict[str, Any]:
-        """Extract JSON from Claude's response, handling various formats"""
-        
-        # Remove markdown code blocks if present
-        if "```json" in response_text:
-            # Extract content between ```json and ```
-            start = response_text.find("```json") + 7
-            end = response_text.find("```", start)
-            if end != -1:
-                response_text = response_text[start:end].strip()
-        elif "```" in response_text:
-            # Extract content between ``` and ```
-            start = response_text.find("```") + 3
-            end = response_text.find("```", start)
-            if end != -1:
-                response_text = response_text[start:end].strip()
-        
-        # Try to find JSON object boundaries
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}') + 1
-        
-        if json_start != -1 and json_end > json_start:
-            json_text = response_text[json_start:json_end]
-            
-            try:
-                return json.loads(json_text)
-            except json.JSONDecodeError as e:
-                print(f"⚠️  JSON parse error: {e}")
-                print(f"🔍 Attempted to parse: {json_text[:100]}...")
-                return None
-        
-        # Try parsing the entire response
-        try:
-            return json.loads(response_text)
-        except json.JSONDecodeError:
-            return None
+        """Extract JSON from Claude's response, tolerating code fences, prose and near-JSON"""
+        parsed = parse_plan_json(response_text)
+        if parsed is None:
+            print(f"⚠️  No JSON object found in: {response_text[:100]}...")
+        return parsed
+    
+    def check_plan(self, plan: Dict[str, Any]) -> List[str]:
+        """Repair a plan in place against the schema; returns the errors that could not be repaired"""
+        report = self.property_schema.validator().validate(plan)
+        report.log()
+        return [str(error) for error in report.errors]
     
     def get_fallback_analysis(self, question: str) -> Dict[str, Any]:
         """Provide a fallback analysis when Claude fails"""
         
         question_lower = question.lower()
         
+        # Count questions only need totals, never record payloads
+        if any(phrase in question_lower for phrase in ['how many', 'number of', 'count of']):
+            count_endpoint = 'contacts'
+            if any(word in question_lower for word in ['deal', 'sale', 'opportunit']):
+                count_endpoint = 'deals'
+            elif any(word in question_lower for word in ['compan', 'business', 'organization', 'account']):
+                count_endpoint = 'companies'
+            
+            count_params = {}
+            
+            return {
+                "data_sources": ["hubspot"],
+                "hubspot_endpoints": [
+                    {
+                        "endpoint": count_endpoint,
+                        "mode": "count",
+                        "params": count_params,
+                        "purpose": f"Count {count_endpoint} (fallback)"
+                    }
+                ],
+                "expected_result_type": f"Total number of {count_endpoint}",
+                "suggested_actions": ["generate_report"],
+                "action_triggers": {}
+            }
+        
         # Check for different query types
         if any(word in question_lower for word in ['contact', 'people', 'customer', 'lead']):
             return {
@@ -459,10 +798,50 @@ class HubSpotClaudeSystem:
     
     def execute_hubspot_queries(self, endpoints: List[Dict]) -> QueryResult:
         """Execute HubSpot API calls based on Claude's recommendations"""
+        # Pure count plans never need record payloads
+        if endpoints and all(self.is_count_endpoint(e) for e in endpoints):
+            return self.execute_count_queries(endpoints)
+        
+        # Pure aggregation plans return grouped rows instead of records
+        if endpoints and all(e.get('aggregation') for e in endpoints):
+            results = [self.execute_aggregation_query(e) for e in endpoints]
+            return QueryResult(
+                data=[row for result in results for row in result.data],
+                source='hubspot',
+                query_type='aggregation',
+                timestamp=datetime.now(),
+                total_count=sum(result.total_count for result in results)
+            )
+        
         all_data = []
         total_count = 0
+        unique_records = set()
+        
+        # Single-item lookups (limit <= 5, one value in several formats) stop at the first
+        # strategy with results, trying the one most likely to hit for this kind of value first
+        is_multi_item_search = len(endpoints) > 1 and self.detect_multi_item_search(endpoints)
+        
+        # Multi-item lookups are batched into a few IN searches that keep input -> record matches
+        if is_multi_item_search and batchable_lookup(endpoints):
+            return self.execute_multi_item_lookup(endpoints)
+        
+        is_cascade = (
+            len(endpoints) > 1
+            and all(endpoint_config.get('params', {}).get('limit', 50) <= 5 for endpoint_config in endpoints)
+            and not any(e.get('aggregation') or self.is_count_endpoint(e) for e in endpoints)
+            and not is_multi_item_search
+        )
+        signatures = [None] * len(endpoints)
+        if is_cascade:
+            shape, ordered = self.strategy_orderer.order(endpoints)
+            endpoints = [entry for _, entry in ordered]
+            signatures = [signature for signature, _ in ordered]
         
         for i, endpoint_config in enumerate(endpoints):
+            if is_cascade and unique_records:
+                print(f"⏭️  Skipping remaining {len(endpoints) - i} strategies - single-item lookup already matched")
+                break
+            
             endpoint = endpoint_config['endpoint']
             params = endpoint_config.get('params', {})
             purpose = endpoint_config.get('purpose', f'Strategy {i+1}')
@@ -473,30 +852,56 @@ class HubSpotClaudeSystem:
             filters = params.get('filterGroups', [])
             query = params.get('query')
             
+            # Aggregation entries in a mixed plan contribute their grouped rows
+            if endpoint_config.get('aggregation'):
+                aggregated = self.execute_aggregation_query(endpoint_config)
+                all_data.extend(aggregated.data)
+                total_count += aggregated.total_count
+                continue
+            
+            # Count-only entries in a mixed plan just contribute their total
+            if self.is_count_endpoint(endpoint_config):
+                count = self.get_hubspot_count(endpoint, filters=filters if not query else None, query=query)
+                if count is not None:
+                    print(f"   📊 {purpose}: {count:,} total records (count only)")
+                    all_data.append(self.create_count_record(endpoint, purpose, count))
+                    total_count += count
+                continue
+            
             # Use specific methods for different object types
+            started = time.time()
             if 'contacts' in endpoint:
                 data = self.get_hubspot_contacts(
                     limit=params.get('limit', 50),
                     properties=params.get('properties', None),
                     filters=filters if not query else None,
-                    query=query
+                    query=query,
+                    sorts=params.get('sorts'),
+                    flatten=True
                 )
             elif 'deals' in endpoint:
                 data = self.get_hubspot_deals(
                     limit=params.get('limit', 50),
                     properties=params.get('properties', None),
-                    filters=filters
+                    filters=filters,
+                    sorts=params.get('sorts'),
+                    flatten=True
                 )
             elif 'companies' in endpoint:
                 data = self.get_hubspot_companies(
                     limit=params.get('limit', 50),
                     properties=params.get('properties', None),
-                    filters=filters
+                    filters=filters,
+                    sorts=params.get('sorts'),
+                    flatten=True
                 )
             else:
                 # Fallback to generic method for other endpoints
                 data = self.get_hubspot_data(endpoint, params)
             
+            if is_cascade:
+                self.strategy_orderer.record(shape, signatures[i], bool(data.get('results')), time.time() - started)
+            
             if 'results' in data:
                 api_total = data.get('total', 0)
                 actual_results = data.get('results', [])
@@ -504,16 +909,15 @@ class HubSpotClaudeSystem:
                 
                 print(f"   📊 {purpose}: {api_total:,} total records, {results_count} retrieved")
                 
+                if is_cascade:
+                    # Several formats of one value can match the same record
+                    actual_results = [item for item in actual_results if item.get('id') not in unique_records]
+                    unique_records.update(item.get('id') for item in actual_results)
+                
                 total_count += api_total
                 
-                # Extract and flatten properties
-                for item in actual_results:
-                    if 'properties' in item:
-                        flattened = {'id': item.get('id')}
-                        flattened.update(item['properties'])
-                        all_data.append(flattened)
-                    else:
-                        all_data.append(item)
+                # Results arrive already flattened
+                all_data.extend(actual_results)
         
         return QueryResult(
             data=all_data,
@@ -523,6 +927,176 @@ class HubSpotClaudeSystem:
             total_count=total_count
         )
     
+    def detect_multi_item_search(self, endpoints: List[Dict]) -> bool:
+        """Detect if this is a search for multiple specific items"""
+        
+        # Look for different search values across strategies
+        search_values = set()
+        phone_numbers = set()
+        
+        for endpoint_config in endpoints:
+            params = endpoint_config.get('params', {})
+            
+            # Check query parameter
+            query = params.get('query')
+            if query:
+                search_values.add(lookup_key(query))
+            
+            # Check filter values
+            filter_groups = params.get('filterGroups', [])
+            for group in filter_groups:
+                for filter_item in group.get('filters', []):
+                    value = str(filter_item.get('value', '')).strip()
+                    if value:
+                        # One number sent as '+1555...', '1555...' and '555...' is one value
+                        search_values.add(lookup_key(value))
+                        
+                        # If it looks like a phone number, track it separately
+                        if value.isdigit() and len(value) >= 10:
+                            # Normalize phone number (remove country code variations)
+                            normalized = value.lstrip('1') if value.startswith('1') and len(value) == 11 else value
+                            phone_numbers.add(normalized)
+        
+        # If we have multiple distinct search values or phone numbers, it's a multi-item search
+        is_multi = len(search_values) > 2 or len(phone_numbers) > 1
+        
+        if is_multi:
+            print(f"🔢 Detected multi-item search: {len(search_values)} search values, {len(phone_numbers)} phone numbers")
+            print(f"   📞 Phone numbers: {list(phone_numbers)}")
+        
+        return is_multi
+    
+    def execute_multi_item_lookup(self, endpoints: List[Dict]) -> QueryResult:
+        """Look every item of a multi-item plan up in batched searches, keeping which input found which record"""
+        
+        object_type = endpoints[0]['endpoint'].strip('/').split('/')[-1]
+        properties = []
+        for endpoint_config in endpoints:
+            for name in endpoint_config.get('params', {}).get('properties') or []:
+                if name not in properties:
+                    properties.append(name)
+        per_item_limit = max(endpoint_config.get('params', {}).get('limit', 5) for endpoint_config in endpoints)
+        
+        matches = self.batch_lookup.run(
+            object_type,
+            lookup_inputs(endpoints),
+            properties or ['email', 'firstname', 'lastname', 'phone', 'company'],
+            per_item_limit=min(per_item_limit, 100)
+        )
+        
+        # Each record says which input(s) it answers, so the table shows number -> contact
+        matched_by: Dict[str, List[str]] = {}
+        for value, record_ids in matches.by_input().items():
+            for record_id in record_ids:
+                matched_by.setdefault(record_id, []).append(value)
+        records = list(matches.records.values())
+        for record_id, record in matches.records.items():
+            record['matched_input'] = ', '.join(matched_by[record_id])
+        if matches.misses:
+            print(f"   ⚠️  No match for: {', '.join(matches.misses)}")
+        
+        return QueryResult(
+            data=records,
+            source='hubspot',
+            query_type='api_call',
+            timestamp=datetime.now(),
+            total_count=len(records),
+            lookup_matches=matches.by_input()
+        )
+    
+    def is_count_endpoint(self, endpoint_config: Dict) -> bool:
+        """Check whether a plan entry asks only for a record count"""
+        return str(endpoint_config.get('mode', '')).lower() == 'count'
+    
+    def execute_aggregation_query(self, endpoint_config: Dict) -> QueryResult:
+        """Page through every matching record and aggregate it server-side"""
+        
+        endpoint = endpoint_config['endpoint']
+        params = endpoint_config.get('params', {})
+        purpose = endpoint_config.get('purpose', 'Aggregation')
+        
+        try:
+            spec = normalize_aggregation(endpoint_config['aggregation'])
+        except ValueError as e:
+            print(f"❌ Invalid aggregation for {purpose}: {e}")
+            return QueryResult(data=[], source='hubspot', query_type='aggregation', timestamp=datetime.now())
+        
+        print(f"🧮 {purpose}: aggregating {endpoint} by {spec['group_by'] or 'all records'}")
+        
+        pages = self.iter_hubspot_search_pages(
+            endpoint,
+            params,
+            properties=required_properties(spec),
+            max_records=spec['max_records']
+        )
+        try:
+            aggregated = aggregate_records(pages, spec)
+        except HubSpotPagingError as e:
+            print(f"❌ Aggregation failed for {purpose}: {e}")
+            return QueryResult(data=[], source='hubspot', query_type='aggregation', timestamp=datetime.now())
+        if endpoint == 'deals':
+            add_stage_labels(aggregated['rows'], self.pipelines)
+        
+        print(f"   📊 {purpose}: {aggregated['records_scanned']:,} records scanned, {len(aggregated['rows'])} groups")
+        
+        return QueryResult(
+            data=aggregated['rows'],
+            source='hubspot',
+            query_type='aggregation',
+            timestamp=datetime.now(),
+            total_count=aggregated['records_scanned']
+        )
+    
+    def create_count_record(self, endpoint: str, purpose: str, count: int) -> Dict:
+        """Build the summary record used for count-only results"""
+        return {
+            'query_type': 'count',
+            'total_count': count,
+            'endpoint': endpoint,
+            'purpose': purpose,
+            'summary': f"Total {endpoint}: {count:,} records available"
+        }
+    
+    def execute_count_queries(self, endpoints: List[Dict]) -> QueryResult:
+        """Run count-only queries in parallel and return one summary record per query"""
+        
+        def run_count(endpoint_config):
+            params = endpoint_config.get('params', {})
+            query = params.get('query')
+            return self.get_hubspot_count(
+                endpoint_config['endpoint'],
+                filters=params.get('filterGroups', []) if not query else None,
+                query=query
+            )
+        
+        print(f"🔢 Executing {len(endpoints)} count-only queries")
+        
+        with ThreadPoolExecutor(max_workers=min(len(endpoints), 4)) as executor:
+            counts = list(executor.map(run_count, endpoints))
+        
+        all_data = []
+        total_count = 0
+        
+        for i, (endpoint_config, count) in enumerate(zip(endpoints, counts)):
+            endpoint = endpoint_config['endpoint']
+            purpose = endpoint_config.get('purpose', f'Count {i+1}')
+            
+            if count is None:
+                print(f"   ⚠️  {purpose}: count failed")
+                continue
+            
+            print(f"   📊 {purpose}: {count:,} total records")
+            total_count += count
+            all_data.append(self.create_count_record(endpoint, purpose, count))
+        
+        return QueryResult(
+            data=all_data,
+            source='hubspot',
+            query_type='count',
+            timestamp=datetime.now(),
+            total_count=total_count
+        )
+    
     def send_single_kixie_sms(self, target_phone: str, message: str, sender_email: str = None) -> bool:
         """Send a single SMS via Kixie API"""
         
@@ -545,7 +1119,7 @@ class HubSpotClaudeSystem:
         }
         
         try:
-            response = requests.post(
+            response = self.kixie_session.post(
                 url,
                 headers=headers,
                 json=payload,
@@ -583,9 +1157,10 @@ class HubSpotClaudeSystem:
             print("📱 Sending SMS notifications via Kixie...")
             
             sms_count = 0
+            outbox = []
             
             for result in results:
-                for record in result.data[:5]:  # Limit to first 5 records
+                for record in result.data[:ACTION_RECORD_LIMITS['send_sms']]:
                     
                     # Extract phone number from record
                     phone = self.extract_phone_number(record)
@@ -596,23 +1171,27 @@ class HubSpotClaudeSystem:
                     # Extract name for personalization
                     name = self.extract_name(record)
                     
-                    # Create personalized message
-                    message = f"Hi {name}! Following up on your inquiry. Let's connect soon!"
-                    
-                    print(f"💬 Message for {name}: {message}")
-                    
-                    # Send SMS via Kixie
-                    success = self.send_single_kixie_sms(
-                        target_phone=phone,
-                        message=message,
-                        sender_email=self.kixie_config['sender_email']
-                    )
-                    
-                    if success:
-                        sms_count += 1
-                        print(f"✅ SMS sent to {name} ({phone})")
-                    else:
-                        print(f"❌ Failed to send SMS to {name} ({phone})")
+                    # Create personalized message, shortening the name to the segment budget if needed
+                    message, _ = FOLLOW_UP_SMS.fit({'name': name}, self.sms_max_segments)
+                    outbox.append((name, phone, message))
+            
+            SegmentReport.of((message for _, _, message in outbox), self.sms_max_segments).log()
+            
+            for name, phone, message in outbox:
+                print(f"💬 Message for {name}: {message}")
+                
+                # Send SMS via Kixie
+                success = self.send_single_kixie_sms(
+                    target_phone=phone,
+                    message=message,
+                    sender_email=self.kixie_config['sender_email']
+                )
+                
+                if success:
+                    sms_count += 1
+                    print(f"✅ SMS sent to {name} ({phone})")
+                else:
+                    print(f"❌ Failed to send SMS to {name} ({phone})")
             
             print(f"📊 SMS Summary: {sms_count} messages sent successfully")
             return sms_count > 0
@@ -623,50 +1202,16 @@ class HubSpotClaudeSystem:
     
     def extract_phone_number(self, record: Dict) -> str:
         """Extract phone number from a record"""
-        
-        # Common phone field names in HubSpot and other systems
-        phone_fields = [
-            'phone', 'phoneNumber', 'phone_number', 'mobilephone', 
-            'mobile', 'cell', 'telephone', 'contact_phone', 'number'
-        ]
-        
-        for field in phone_fields:
-            if field in record:
-                phone = record[field]
-                if phone:
-                    # Clean up phone number (remove spaces, dashes, etc.)
-                    cleaned_phone = ''.join(filter(str.isdigit, str(phone)))
-                    
-                    # Add country code if missing (assuming US)
-                    if len(cleaned_phone) == 10:
-                        cleaned_phone = '1' + cleaned_phone
-                    
-                    if len(cleaned_phone) >= 10:
-                        return cleaned_phone
-        
-        return None
+        # Search results carry it already derived
+        if isinstance(record, HubSpotRecord):
+            return record.phone
+        return dialable_phone(record)
     
     def extract_name(self, record: Dict) -> str:
         """Extract name from a record"""
-        
-        # Try different name combinations
-        if 'firstname' in record and 'lastname' in record:
-            first = record.get('firstname', '').strip()
-            last = record.get('lastname', '').strip()
-            if first or last:
-                return f"{first} {last}".strip()
-        
-        # Try single name fields
-        name_fields = ['name', 'fullname', 'contact_name', 'dealname', 'company']
-        for field in name_fields:
-            if field in record and record[field]:
-                return str(record[field]).strip()
-        
-        # Try email as fallback
-        if 'email' in record and record['email']:
-            return record['email'].split('@')[0]
-        
-        return 'Contact'
+        if isinstance(record, HubSpotRecord):
+            return record.display_name
+        return display_name(record)
     
     def send_notification(self, results: List[QueryResult]):
         """Send notification about query results"""
@@ -685,7 +1230,7 @@ class HubSpotClaudeSystem:
         try:
             task_count = 0
             for result in results:
-                for record in result.data[:5]:  # Limit to first 5 records
+                for record in result.data[:ACTION_RECORD_LIMITS['create_task']]:
                     name = self.extract_name(record)
                     print(f"✅ Task created: Follow up with {name}")
                     task_count += 1
@@ -700,7 +1245,19 @@ class HubSpotClaudeSystem:
     def generate_report(self, results: List[QueryResult]):
         """Generate report based on query results"""
         try:
-            total_records = sum(len(result.data) for result in results)
+            # Aggregated results hold one row per group, not per record
+            total_records = sum(
+                result.total_count if result.query_type == 'aggregation' else len(result.data)
+                for result in results
+            )
+            
+            for result in results:
+                if result.query_type != 'aggregation':
+                    continue
+                print(f"📊 Aggregated {result.total_count:,} records into {len(result.data)} groups:")
+                for row in result.data:
+                    print("   " + " | ".join(f"{key}: {value:,.2f}" if isinstance(value, float) else f"{key}: {value}" for key, value in row.items()))
+            
             print(f"📄 Report generated: {total_records} records analyzed")
             return True
             
@@ -708,26 +1265,81 @@ class HubSpotClaudeSystem:
             print(f"❌ Report generation error: {e}")
             return False
     
-    def process_business_question(self, question: str):
-        """Main method to process a natural language question"""
+    def refine_plan(self, base_plan: Dict[str, Any], base_question: str, question: str) -> Optional[Dict[str, Any]]:
+        """Narrow an earlier plan by one filter for a follow-up; None when the follow-up needs a new plan"""
+
+        object_type = plan_object_type(base_plan)
+        schema = self.get_database_schema()['hubspot']
+        if object_type not in schema:
+            return None
+        if any(entry.get('params', {}).get('query') for entry in base_plan.get('hubspot_endpoints', [])):
+            # Searches with a free-text query send it instead of their filters, so an added filter would be ignored
+            return None
+
+        source = 'rules'
+        periods = self.dates.periods()
+        filter_item = rule_refinement(question, object_type, periods)
+        if filter_item is None:
+            source = 'claude'
+            try:
+                filter_item = claude_refinement(
+                    self.claude_client, self.model_router.cheapest.model, question,
+                    base_question, object_type,
+                    self.property_schema.properties_within(object_type, 400),
+                    today=periods.today.isoformat()
+                )
+            except Exception as e:
+                print(f"❌ Claude refinement error: {e}")
+                return None
+        if filter_item is None:
+            return None
+
+        refined = add_filter(base_plan, filter_item)
+        errors = self.check_plan(refined)
+        if errors:
+            print(f"⚠️  Refined plan rejected: {'; '.join(errors[:3])}")
+            return None
+
+        refined['refinement'] = {'base_question': base_question, 'filter': filter_item, 'source': source}
+        print(f"🔁 Refined previous plan ({source}): {filter_item}")
+        return refined
+
+    def process_business_question(self, question: str, action_type: str = None,
+                                  base_plan: Dict[str, Any] = None, base_question: str = None):
+        """Main method to process a natural language question
+
+        With base_plan, the question is a follow-up that narrows that plan instead of being planned from scratch.
+        """
         print(f"🔍 Processing question: {question}")
         
-        # Step 1: Let Claude analyze the question
-        claude_analysis = self.process_question_with_claude(question)
+        # Step 1: Refine the previous plan for a follow-up, otherwise let Claude analyze the question
+        claude_analysis = self.refine_plan(base_plan, base_question, question) if base_plan else None
+        if not claude_analysis:
+            claude_analysis = self.process_question_with_claude(question)
         
         if not claude_analysis:
             print("❌ Could not analyze question with Claude")
             return None
         
         print(f"🧠 Claude's analysis: {claude_analysis.get('expected_result_type', 'Analysis pending...')}")
+        return self.execute_plan(question, claude_analysis, action_type=action_type)
+    
+    def execute_plan(self, question: str, claude_analysis: Dict[str, Any], action_type: str = None) -> Dict[str, Any]:
+        """Run an already resolved plan (no Claude call) and summarize the results"""
+        
+        # Step 1b: Trim each search to the properties the answer and follow-up actions use
+        project_plan_properties(
+            claude_analysis,
+            question,
+            self.get_database_schema()['hubspot'],
+            action_type=action_type
+        )
         
         results = []
         
         # Step 2: Execute HubSpot queries
         if claude_analysis.get('hubspot_endpoints'):
-            hubspot_results = self.execute_hubspot_queries(
-                claude_analysis.get('hubspot_endpoints', [])
-            )
+            hubspot_results = self.execute_hubspot_queries(claude_analysis.get('hubspot_endpoints', []))
             results.append(hubspot_results)
         
         # Step 3: Note available actions
@@ -762,6 +1374,10 @@ class HubSpotClaudeSystem:
         }
     
     def close_connections(self):
-        """Clean up connections (simplified - no database)"""
+        """Close pooled HTTP sessions (no database to close)"""
+        for session in (self._hubspot_session, self._kixie_session):
+            if session is not None:
+                session.close()
+        self._hubspot_session = None
+        self._kixie_session = None
         print("🔒 System ready for shutdown")
-        pass
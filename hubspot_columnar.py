@@ -0,0 +1,198 @@
+"""
+Columnar, compact in-memory container for flattened HubSpot records
+"""
+
+import math
+import sys
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Iterable, Optional
+
+# Column kinds
+NUMERIC = 'numeric'
+DATE = 'date'
+CATEGORICAL = 'categorical'
+STRING = 'string'
+
+# Well-known HubSpot properties and how to store them; anything else is a plain string column
+NUMERIC_PROPERTIES = {
+    'amount', 'annualrevenue', 'numberofemployees', 'hs_deal_stage_probability',
+    'num_associated_contacts', 'num_contacted_notes', 'hs_num_associated_deals',
+    'amount_in_home_currency', 'hs_forecast_amount', 'hs_projected_amount'
+}
+DATE_PROPERTIES = {
+    'createdate', 'closedate', 'lastmodifieddate', 'hs_lastmodifieddate',
+    'notes_last_updated', 'notes_last_contacted', 'hs_lead_status_updated_date'
+}
+CATEGORICAL_PROPERTIES = {
+    'dealstage', 'lifecyclestage', 'pipeline', 'hs_lead_status', 'industry', 'dealtype',
+    'hubspot_owner_id', 'city', 'state', 'country', 'company', 'hs_pipeline',
+    'hs_pipeline_stage', 'hs_ticket_priority', 'jobtitle'
+}
+
+
+def infer_column_type(name: str) -> str:
+    """Pick a storage kind for a property name"""
+    if name in NUMERIC_PROPERTIES:
+        return NUMERIC
+    if name in DATE_PROPERTIES:
+        return DATE
+    if name in CATEGORICAL_PROPERTIES:
+        return CATEGORICAL
+    return STRING
+
+
+def format_number(value: float) -> str:
+    """Render a float the way HubSpot returns numbers ('1500', '1500.5')"""
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def parse_date(value: str) -> float:
+    """Parse a HubSpot ISO timestamp to epoch seconds"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def format_date(value: float) -> str:
+    """Render epoch seconds as HubSpot's ISO format (milliseconds only when non-zero)"""
+    moment = datetime.fromtimestamp(value, tz=timezone.utc)
+    if moment.microsecond:
+        return moment.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class CategoricalColumn:
+    """Dictionary-encoded column: small integer codes into a list of interned strings"""
+
+    MISSING = 0
+
+    def __init__(self):
+        self.categories: List[Optional[str]] = [None]
+        self.codes = array('I')
+        self._index: Dict[str, int] = {}
+        # row -> '' for blank values, which group with missing ones but read back as ''
+        self.raw: Dict[int, str] = {}
+
+    def append(self, value: Any):
+        if value is None or value == '':
+            if value is not None:
+                self.raw[len(self.codes)] = value
+            self.codes.append(self.MISSING)
+            return
+        value = str(value)
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.categories)
+            self.categories.append(sys.intern(value))
+        self.codes.append(code)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        if row in self.raw:
+            return self.raw[row]
+        return self.categories[self.codes[row]]
+
+
+class TypedColumn:
+    """Numeric or date column stored as float64; values that would not round-trip keep their raw text"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.values = array('d')
+        # row -> original string, only for values the parsed form can't reproduce
+        self.raw: Dict[int, Any] = {}
+        self._parse = float if kind == NUMERIC else parse_date
+        self._format = format_number if kind == NUMERIC else format_date
+
+    def append(self, value: Any):
+        row = len(self.values)
+        if value is None or value == '':
+            self.values.append(math.nan)
+            if value is not None:
+                self.raw[row] = value
+            return
+        try:
+            parsed = self._parse(value)
+        except (TypeError, ValueError):
+            self.values.append(math.nan)
+            self.raw[row] = value
+            return
+        self.values.append(parsed)
+        if self._format(parsed) != value:
+            self.raw[row] = value
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, row: int) -> Any:
+        if row in self.raw:
+            return self.raw[row]
+        value = self.values[row]
+        if value != value:  # NaN - missing
+            return None
+        return self._format(value)
+
+
+class ColumnarData:
+    """One typed column per property, filled a page at a time (the aggregation working set)"""
+
+    def __init__(self, column_types: Dict[str, str] = None):
+        self.column_types: Dict[str, str] = dict(column_types or {})
+        self._columns: Dict[str, Any] = {}
+        self._length = 0
+
+    def _new_column(self, name: str):
+        kind = self.column_types.setdefault(name, infer_column_type(name))
+        if kind == CATEGORICAL:
+            column = CategoricalColumn()
+        elif kind in (NUMERIC, DATE):
+            column = TypedColumn(kind)
+        else:
+            column = []
+        # Pad rows that were appended before this property first appeared
+        for _ in range(self._length):
+            column.append(None)
+        self._columns[name] = column
+        return column
+
+    def append_records(self, records: Iterable[Dict]):
+        """Append flattened records (one page at a time is fine)"""
+        for record in records:
+            for name in record:
+                if name not in self._columns:
+                    self._new_column(name)
+            for name, column in self._columns.items():
+                column.append(record.get(name))
+            self._length += 1
+
+    def numeric(self, name: str) -> array:
+        """Float64 values for a property, parsing string columns on demand"""
+        column = self._columns.get(name)
+        if column is None:
+            return array('d', [math.nan]) * self._length
+        if isinstance(column, TypedColumn) and column.kind == NUMERIC:
+            return column.values
+        values = array('d')
+        for row in range(self._length):
+            value = column[row]
+            try:
+                values.append(float(value) if value not in (None, '') else math.nan)
+            except (TypeError, ValueError):
+                values.append(math.nan)
+        return values
+
+    def categorical(self, name: str) -> CategoricalColumn:
+        """Dictionary-encoded view of a property, encoding string columns on demand"""
+        column = self._columns.get(name)
+        if isinstance(column, CategoricalColumn):
+            return column
+        encoded = CategoricalColumn()
+        for row in range(self._length):
+            encoded.append(column[row] if column is not None else None)
+        return encoded
+
+    def __len__(self) -> int:
+        return self._length
@@ -0,0 +1,149 @@
+"""
+Calendar periods for planning: today, this week, this/last month and the fiscal quarter/year,
+bounded at midnight in the portal's timezone, as UTC timestamps computed once per local day
+"""
+
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import Any, Dict, Optional
+
+# HubSpot filter values: UTC with milliseconds
+HUBSPOT_TIMESTAMP = '%Y-%m-%dT%H:%M:%S.000Z'
+
+BUCKET_GRANULARITIES = ('day', 'week', 'month', 'quarter', 'year')
+
+
+def utc_iso(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime(HUBSPOT_TIMESTAMP)
+
+
+def load_timezone(name: Optional[str]) -> tzinfo:
+    """IANA zone by name; UTC when unset or unknown (e.g. no tz database installed)"""
+    if not name or name.upper() == 'UTC':
+        return timezone.utc
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(name)
+    except Exception as e:
+        print(f"⚠️  Unknown timezone '{name}' ({e}); using UTC")
+        return timezone.utc
+
+
+def _local_midnight(day: date, zone: tzinfo) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=zone).astimezone(timezone.utc)
+
+
+def _add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+@dataclass(frozen=True)
+class DatePeriods:
+    """Period boundaries for one local day; every *_start is an aware UTC datetime"""
+    timezone_name: str
+    today: date
+    day_start: datetime
+    week_start: datetime
+    month_start: datetime
+    last_month_start: datetime
+    quarter_start: datetime
+    year_start: datetime
+    fiscal_year: int
+    fiscal_quarter: int
+    week_start_date: date
+
+    def iso(self, boundary: str) -> str:
+        """'month_start' -> '2026-10-01T04:00:00.000Z'"""
+        return utc_iso(getattr(self, boundary))
+
+    def bucket(self, granularity: str = 'day') -> str:
+        """Stable ID of the current period, for keying caches and precomputed results"""
+        label = {
+            'day': self.today.isoformat(),
+            'week': f"week-of-{self.week_start_date.isoformat()}",
+            'month': self.today.strftime('%Y-%m'),
+            'quarter': f"FY{self.fiscal_year}-Q{self.fiscal_quarter}",
+            'year': f"FY{self.fiscal_year}"
+        }.get(granularity)
+        if label is None:
+            raise ValueError(f"Unknown period '{granularity}' (use one of {', '.join(BUCKET_GRANULARITIES)})")
+        return f"{self.timezone_name}/{label}"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'timezone': self.timezone_name,
+            'today': self.today.isoformat(),
+            **{boundary: self.iso(boundary) for boundary in (
+                'day_start', 'week_start', 'month_start', 'last_month_start', 'quarter_start', 'year_start'
+            )},
+            'fiscal_year': self.fiscal_year,
+            'fiscal_quarter': self.fiscal_quarter
+        }
+
+
+class DateContext:
+    """Periods in one portal's timezone and fiscal calendar, recomputed only when the local day changes
+
+    fiscal_year_start_month 1 is the calendar year; otherwise the fiscal year is named after
+    the calendar year it ends in (FY2027 starts in October 2026 with month 10).
+    week_start_day is 0 for Monday weeks, 6 for Sunday weeks.
+    """
+
+    def __init__(self, timezone_name: str = None, fiscal_year_start_month: int = 1, week_start_day: int = 0):
+        self.zone = load_timezone(timezone_name)
+        self.timezone_name = timezone_name if self.zone is not timezone.utc else 'UTC'
+        if not 1 <= fiscal_year_start_month <= 12:
+            raise ValueError(f"Fiscal year start month must be 1-12, not {fiscal_year_start_month}")
+        self.fiscal_year_start_month = fiscal_year_start_month
+        self.week_start_day = week_start_day % 7
+        self._periods: Optional[DatePeriods] = None
+
+    @classmethod
+    def for_tenant(cls, tenant) -> 'DateContext':
+        """Timezone and fiscal calendar from the tenant's integrations, else PORTAL_TIMEZONE etc."""
+        settings = tenant.integrations if tenant else {}
+
+        def setting(name: str, env: str, default):
+            # 0 is a real value (week_start_day 0 is Monday); only absent or blank falls back
+            value = settings.get(name)
+            return os.getenv(env, default) if value is None or value == '' else value
+
+        return cls(
+            settings.get('timezone') or os.getenv('PORTAL_TIMEZONE'),
+            int(setting('fiscal_year_start_month', 'FISCAL_YEAR_START_MONTH', 1)),
+            int(setting('week_start_day', 'WEEK_START_DAY', 0))
+        )
+
+    def periods(self, now: datetime = None) -> DatePeriods:
+        now = now or datetime.now(timezone.utc)
+        today = now.astimezone(self.zone).date()
+        periods = self._periods
+        if periods is None or periods.today != today:
+            periods = self._periods = self._compute(today)
+        return periods
+
+    def _compute(self, today: date) -> DatePeriods:
+        week_start = today - timedelta(days=(today.weekday() - self.week_start_day) % 7)
+        month_start = today.replace(day=1)
+
+        start_month = self.fiscal_year_start_month
+        months_into_year = (today.month - start_month) % 12
+        year_start = _add_months(month_start, -months_into_year)
+        quarter_start = _add_months(year_start, months_into_year // 3 * 3)
+        fiscal_year = year_start.year + (1 if start_month > 1 else 0)
+
+        return DatePeriods(
+            timezone_name=self.timezone_name,
+            today=today,
+            day_start=_local_midnight(today, self.zone),
+            week_start=_local_midnight(week_start, self.zone),
+            month_start=_local_midnight(month_start, self.zone),
+            last_month_start=_local_midnight(_add_months(month_start, -1), self.zone),
+            quarter_start=_local_midnight(quarter_start, self.zone),
+            year_start=_local_midnight(year_start, self.zone),
+            fiscal_year=fiscal_year,
+            fiscal_quarter=months_into_year // 3 + 1,
+            week_start_date=week_start
+        )
@@ -0,0 +1,139 @@
+"""
+Streaming CSV / NDJSON / Parquet writers for full HubSpot query results
+"""
+
+import csv
+import io
+import json
+from typing import Dict, List, Iterable, Iterator
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+
+class ExportError(Exception):
+    """Raised when an export cannot be produced (bad format, missing optional dependency)"""
+    pass
+
+
+def peek_fields(pages: Iterable[List[Dict]]):
+    """Read the first page to learn the column names; returns (fields, pages including the first)"""
+
+    pages = iter(pages)
+    first_page = next(pages, [])
+
+    fields = []
+    for record in first_page:
+        for key in record:
+            if key not in fields:
+                fields.append(key)
+    # Keep the record id as the first column
+    if 'id' in fields:
+        fields.remove('id')
+        fields.insert(0, 'id')
+
+    def chained():
+        if first_page:
+            yield first_page
+        yield from pages
+
+    return fields, chained()
+
+
+def stream_csv(pages: Iterable[List[Dict]], fields: List[str]) -> Iterator[str]:
+    """Yield CSV text one page at a time"""
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+
+    for page in pages:
+        writer.writerows(page)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_ndjson(pages: Iterable[List[Dict]], fields: List[str]) -> Iterator[str]:
+    """Yield newline-delimited JSON one page at a time"""
+
+    for page in pages:
+        yield ''.join(json.dumps(record, default=str) + '\n' for record in page)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the generator"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_parquet(pages: Iterable[List[Dict]], fields: List[str]) -> Iterator[bytes]:
+    """Yield a Parquet file one row group (page) at a time; needs pyarrow"""
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    # HubSpot returns every property as a string, so the schema is all strings
+    schema = pa.schema([(field, pa.string()) for field in fields])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    try:
+        for page in pages:
+            columns = {field: [record.get(field) for record in page] for field in fields}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+
+    yield sink.drain()
+
+
+def stream_export(pages: Iterable[List[Dict]], export_format: str):
+    """Return (mimetype, chunk iterator) for the requested format"""
+
+    export_format = (export_format or 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Unsupported export format '{export_format}' (use {', '.join(EXPORT_FORMATS)})")
+
+    if export_format == 'parquet':
+        # Fail before any bytes are sent if pyarrow is missing
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    fields, pages = peek_fields(pages)
+
+    writers = {'csv': stream_csv, 'ndjson': stream_ndjson, 'parquet': stream_parquet}
+    return EXPORT_FORMATS[export_format], writers[export_format](pages, fields)
@@ -0,0 +1,82 @@
+"""
+Pluggable JSON backend and decode-and-flatten path for HubSpot search responses
+"""
+
+import json
+import os
+from typing import Dict, Any, Callable
+
+from hubspot_records import record_type
+
+# Preferred order when HUBSPOT_JSON_BACKEND is not set
+BACKEND_PREFERENCE = ('orjson', 'ujson', 'json')
+
+
+def _load_backend(name: str) -> Callable[[bytes], Any]:
+    if name == 'orjson':
+        import orjson
+        return orjson.loads
+    if name == 'ujson':
+        import ujson
+        return ujson.loads
+    if name == 'json':
+        return json.loads
+    raise ValueError(f"Unknown JSON backend '{name}'")
+
+
+def select_backend(preferred: str = None):
+    """Return (name, loads) for the first importable backend, falling back to the stdlib"""
+
+    preferred = preferred or os.getenv('HUBSPOT_JSON_BACKEND')
+    candidates = (preferred,) + BACKEND_PREFERENCE if preferred else BACKEND_PREFERENCE
+
+    for name in candidates:
+        try:
+            return name, _load_backend(name)
+        except ImportError:
+            continue
+        except ValueError as e:
+            print(f"⚠️  {e}, falling back")
+            continue
+
+    return 'json', json.loads
+
+
+backend_name, loads = select_backend()
+
+
+def use_backend(name: str):
+    """Switch the module-wide backend (used by the benchmark)"""
+    global backend_name, loads
+    backend_name, loads = select_backend(name)
+
+
+def flatten_results(data: Dict[str, Any], object_type: str = None) -> Dict[str, Any]:
+    """Turn each {'id', 'properties': {...}} result into its properties dict plus 'id', in place
+
+    Contacts, deals and companies become their typed record (hubspot_records), a copy of the
+    properties, as no JSON backend decodes straight into a dict subclass (benchmark_json_decode.py
+    measures the cost); other object types keep the decoded properties dict itself.
+    """
+
+    results = data.get('results')
+    if results:
+        typed = record_type(object_type)
+        flattened = []
+        for item in results:
+            properties = item.get('properties')
+            if properties is None:
+                flattened.append(item)
+                continue
+            if typed is not None:
+                properties = typed(properties)
+            # Without a record type the decoded properties dict becomes the output record
+            dict.__setitem__(properties, 'id', item.get('id'))
+            flattened.append(properties)
+        data['results'] = flattened
+    return data
+
+
+def decode_search_response(raw: bytes, object_type: str = None) -> Dict[str, Any]:
+    """Decode a search response body straight from bytes and flatten its results"""
+    return flatten_results(loads(raw), object_type)
@@ -0,0 +1,201 @@
+"""
+Claude model tiering: route simple questions to a fast model, complex ones to a larger one,
+and escalate when a plan does not validate
+"""
+
+import os
+import re
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+from hubspot_plan_tool import TOOL_INSTRUCTION, create_tool_message, response_text, tool_input
+
+
+@dataclass
+class ModelTier:
+    name: str
+    model: str
+    max_tokens: int
+    input_cost: float  # USD per million input tokens
+    output_cost: float  # USD per million output tokens
+
+
+def default_tiers() -> List[ModelTier]:
+    """Cheapest first; CLAUDE_FAST_MODEL / CLAUDE_SMART_MODEL override the models"""
+    return [
+        ModelTier('fast', os.getenv('CLAUDE_FAST_MODEL', 'claude-3-5-haiku-20241022'), 1200, 0.80, 4.00),
+        ModelTier('smart', os.getenv('CLAUDE_SMART_MODEL', 'claude-3-5-sonnet-20241022'), 2000, 3.00, 15.00)
+    ]
+
+
+OBJECT_WORDS = {
+    'contacts': ('contact', 'people', 'person', 'lead', 'customer'),
+    'deals': ('deal', 'pipeline', 'opportunit', 'revenue', 'closed won', 'closed lost'),
+    'companies': ('compan', 'account', 'organization', 'business'),
+    'tickets': ('ticket', 'support', 'issue')
+}
+
+# Phrasing that needs joins, grouping or multi-step reasoning
+COMPLEX_PATTERNS = [
+    r'\bassociated\b', r'\bwith(out)? (any |no )?(deals?|contacts?|compan\w+|tickets?)\b',
+    r'\bwho (have|has|had)\b', r'\bper\b', r'\bgroup(ed)? by\b', r'\bbreakdown\b',
+    r'\bcompar\w*\b', r'\bversus\b', r'\bvs\.?\b', r'\btrend\w*\b', r'\baverage\b', r'\btop \d+\b',
+    r'\bbetween\b.*\band\b', r'\bexcept\b', r'\bnot in\b', r'\bboth\b', r'\beither\b'
+]
+
+# Long questions usually carry several conditions
+COMPLEX_WORD_COUNT = 25
+
+
+def classify_question(question: str) -> Tuple[str, List[str]]:
+    """Return ('simple' | 'complex', reasons)"""
+
+    text = (question or '').lower()
+    reasons = []
+
+    objects = [name for name, words in OBJECT_WORDS.items() if any(word in text for word in words)]
+    if len(objects) > 1:
+        reasons.append(f"mentions {', '.join(objects)}")
+
+    matched = [pattern for pattern in COMPLEX_PATTERNS if re.search(pattern, text)]
+    if matched:
+        reasons.append(f"relational/analytical phrasing ({len(matched)} cue{'s' if len(matched) > 1 else ''})")
+
+    if len(text.split()) > COMPLEX_WORD_COUNT:
+        reasons.append(f"{len(text.split())} words")
+
+    return ('complex' if reasons else 'simple'), reasons
+
+
+def basic_plan_errors(plan: Any) -> List[str]:
+    """Minimal structural check a plan must pass before it is executed"""
+
+    if not isinstance(plan, dict):
+        return ['plan is not a JSON object']
+    endpoints = plan.get('hubspot_endpoints')
+    if not isinstance(endpoints, list) or not endpoints:
+        return ['hubspot_endpoints must be a non-empty list']
+
+    errors = []
+    for index, entry in enumerate(endpoints):
+        if not isinstance(entry, dict) or not str(entry.get('endpoint') or '').strip('/'):
+            errors.append(f"hubspot_endpoints[{index}].endpoint must name an object type")
+        elif not isinstance(entry.get('params', {}), dict):
+            errors.append(f"hubspot_endpoints[{index}].params must be an object")
+    return errors
+
+
+class TierStats:
+    """Calls, failures, escalations, latency and cost for each tier"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._tiers: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, tier: ModelTier, latency: float, usage=None, ok: bool = True, escalated: bool = False):
+        input_tokens = getattr(usage, 'input_tokens', 0) or 0
+        output_tokens = getattr(usage, 'output_tokens', 0) or 0
+        cost = (input_tokens * tier.input_cost + output_tokens * tier.output_cost) / 1_000_000
+
+        with self._lock:
+            stats = self._tiers.setdefault(tier.name, {
+                'model': tier.model, 'calls': 0, 'failures': 0, 'escalations': 0,
+                'input_tokens': 0, 'output_tokens': 0, 'cost_usd': 0.0,
+                'latencies': deque(maxlen=self.window)
+            })
+            stats['calls'] += 1
+            stats['failures'] += 0 if ok else 1
+            stats['escalations'] += 1 if escalated else 0
+            stats['input_tokens'] += input_tokens
+            stats['output_tokens'] += output_tokens
+            stats['cost_usd'] += cost
+            stats['latencies'].append(latency)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            summary = {}
+            for name, stats in self._tiers.items():
+                latencies = sorted(stats['latencies'])
+                summary[name] = {
+                    **{key: value for key, value in stats.items() if key != 'latencies'},
+                    'cost_usd': round(stats['cost_usd'], 6),
+                    'median_latency_ms': round(statistics.median(latencies) * 1000, 1) if latencies else None,
+                    'p95_latency_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1) if latencies else None
+                }
+            return summary
+
+
+class ModelRouter:
+    """Pick a tier per question and escalate to the next one when the plan does not come back valid"""
+
+    def __init__(self, tiers: List[ModelTier] = None, pinned_model: str = None):
+        if pinned_model:
+            # An explicitly configured model (e.g. from the setup page) disables routing
+            tiers = [ModelTier('pinned', pinned_model, 2000, 3.00, 15.00)]
+        self.tiers = tiers or default_tiers()
+        self.stats = TierStats()
+
+    @property
+    def cheapest(self) -> ModelTier:
+        return self.tiers[0]
+
+    def route(self, question: str) -> int:
+        """Index of the starting tier for this question"""
+        complexity, reasons = classify_question(question)
+        start = len(self.tiers) - 1 if complexity == 'complex' else 0
+        detail = f" ({'; '.join(reasons)})" if reasons else ''
+        print(f"🧭 Routing {complexity} question to {self.tiers[start].name} tier ({self.tiers[start].model}){detail}")
+        return start
+
+    def plan(self, client, system_prompt: str, question: str,
+             parse: Callable[[str], Optional[Dict]],
+             validate: Callable[[Any], List[str]] = basic_plan_errors,
+             tool: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """Ask Claude for a query plan, escalating through the tiers; None when every tier fails
+
+        With a tool, Claude is forced to call it and the plan is its typed input (no text parsing).
+        """
+
+        start = self.route(question)
+        for index in range(start, len(self.tiers)):
+            tier = self.tiers[index]
+            has_next = index + 1 < len(self.tiers)
+            request = dict(
+                model=tier.model,
+                max_tokens=tier.max_tokens,
+                system=f"{system_prompt}\n{TOOL_INSTRUCTION}" if tool else system_prompt,
+                messages=[
+                    {"role": "user", "content": f"Question: {question}"}
+                ]
+            )
+            started = time.perf_counter()
+            try:
+                response = create_tool_message(client, tool, **request) if tool else client.messages.create(**request)
+            except Exception as e:
+                self.stats.record(tier, time.perf_counter() - started, ok=False, escalated=has_next)
+                print(f"❌ Claude {tier.name} tier error: {e}")
+                continue
+
+            latency = time.perf_counter() - started
+            plan = tool_input(response, tool['name']) if tool else None
+            if plan is not None:
+                print(f"🛠️  Claude tool call ({tier.name}, {latency * 1000:.0f}ms): {len(plan.get('hubspot_endpoints') or [])} endpoint(s)")
+            else:
+                claude_response = response_text(response)
+                print(f"📝 Claude raw response ({tier.name}, {latency * 1000:.0f}ms): {claude_response[:200]}...")
+                plan = parse(claude_response)
+
+            errors = validate(plan) if plan else ['response was not valid JSON']
+            self.stats.record(tier, latency, response.usage, ok=not errors, escalated=bool(errors) and has_next)
+
+            if not errors:
+                return plan
+            print(f"⚠️  {tier.name} tier plan rejected: {'; '.join(errors[:3])}"
+                  + (", escalating" if has_next else ""))
+
+        return None
@@ -0,0 +1,149 @@
+"""
+Deal pipeline metadata: stage IDs resolved to labels, probabilities and closed/won flags
+from crm/v3/pipelines/deals, cached with a TTL so lookups never call the API per record
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Any, Callable, Optional
+
+# After a failed refresh the stale copy is kept and the next attempt waits this long
+RETRY_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class DealStage:
+    stage_id: str
+    label: str
+    pipeline_id: str
+    pipeline_label: str
+    probability: Optional[float]  # 0.0-1.0 from the stage metadata
+    is_closed: bool
+    display_order: int = 0
+
+    @property
+    def is_won(self) -> bool:
+        return self.is_closed and self.probability is not None and self.probability >= 1.0
+
+    @property
+    def is_lost(self) -> bool:
+        return self.is_closed and self.probability is not None and self.probability <= 0.0
+
+
+def parse_pipelines(payload: Dict[str, Any]) -> Dict[str, DealStage]:
+    """Stage ID -> DealStage for every stage of every pipeline in a pipelines API response"""
+
+    stages = {}
+    for pipeline in payload.get('results', []):
+        for stage in pipeline.get('stages', []):
+            metadata = stage.get('metadata') or {}
+            try:
+                probability = float(metadata['probability'])
+            except (KeyError, TypeError, ValueError):
+                probability = None
+            stages[str(stage['id'])] = DealStage(
+                stage_id=str(stage['id']),
+                label=stage.get('label') or str(stage['id']),
+                pipeline_id=str(pipeline.get('id')),
+                pipeline_label=pipeline.get('label') or str(pipeline.get('id')),
+                probability=probability,
+                is_closed=str(metadata.get('isClosed', '')).lower() == 'true',
+                display_order=stage.get('displayOrder', 0)
+            )
+    return stages
+
+
+class PipelineCache:
+    """Deal stages loaded on first use and refreshed after ttl_seconds
+
+    fetch returns the raw crm/v3/pipelines/deals response. A failed refresh keeps serving
+    the previous copy; unknown stage IDs resolve to themselves.
+    """
+
+    def __init__(self, fetch: Callable[[], Dict[str, Any]], ttl_seconds: int = 3600):
+        self.fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self._stages: Dict[str, DealStage] = {}
+        self._pipelines: Dict[str, str] = {}
+        self._expires = 0.0
+        self._loaded_at: Optional[float] = None
+        self._refreshes = 0
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            payload = self.fetch()
+            if not isinstance(payload, dict) or 'results' not in payload:
+                raise ValueError('no pipelines in response')
+            stages = parse_pipelines(payload)
+        except Exception as e:
+            self._failures += 1
+            self._expires = time.monotonic() + RETRY_SECONDS
+            print(f"⚠️  Deal pipeline refresh failed ({e}); {'keeping cached stages' if self._stages else 'stages unresolved'}")
+            return
+
+        self._stages = stages
+        self._pipelines = {stage.pipeline_id: stage.pipeline_label for stage in stages.values()}
+        self._loaded_at = time.time()
+        self._expires = time.monotonic() + self.ttl_seconds
+        self._refreshes += 1
+        print(f"🗂️  Loaded {len(stages)} deal stages in {len(self._pipelines)} pipeline(s)")
+
+    def stages(self) -> Dict[str, DealStage]:
+        if time.monotonic() >= self._expires:
+            with self._lock:
+                # Another thread may have refreshed while this one waited
+                if time.monotonic() >= self._expires:
+                    self._refresh()
+        return self._stages
+
+    def invalidate(self):
+        """Reload on the next lookup (e.g. after a pipeline change)"""
+        self._expires = 0.0
+
+    def observe_stage(self, stage_id: Any):
+        """A deal moved to stage_id (webhook): reload if the loaded pipelines don't have it"""
+        if self._loaded_at is not None and stage_id and str(stage_id) not in self._stages:
+            self.invalidate()
+
+    def stage(self, stage_id: Any) -> Optional[DealStage]:
+        if stage_id is None:
+            return None
+        return self.stages().get(str(stage_id))
+
+    def label(self, stage_id: Any) -> Any:
+        stage = self.stage(stage_id)
+        return stage.label if stage else stage_id
+
+    def probability(self, stage_id: Any) -> Optional[float]:
+        stage = self.stage(stage_id)
+        return stage.probability if stage else None
+
+    def pipeline_label(self, pipeline_id: Any) -> Any:
+        self.stages()
+        return self._pipelines.get(str(pipeline_id), pipeline_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'stages': len(self._stages),
+            'pipelines': len(self._pipelines),
+            'loaded_at': self._loaded_at,
+            'refreshes': self._refreshes,
+            'failures': self._failures,
+            'ttl_seconds': self.ttl_seconds
+        }
+
+
+def add_stage_labels(rows: List[Dict[str, Any]], pipelines: PipelineCache) -> List[Dict[str, Any]]:
+    """Add dealstage_label / pipeline_label beside grouped deal stage and pipeline IDs"""
+
+    if not rows:
+        return rows
+    resolvers = {'dealstage': pipelines.label, 'pipeline': pipelines.pipeline_label}
+    keys = [key for key in resolvers if key in rows[0]]
+    for row in rows:
+        for key in keys:
+            row[f"{key}_label"] = resolvers[key](row[key])
+    return rows
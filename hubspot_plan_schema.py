@@ -0,0 +1,427 @@
+"""
+Query plan validation and repair: catch malformed plans before they reach HubSpot
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Iterable, Optional, Set
+
+# HubSpot CRM search limits
+MAX_FILTER_GROUPS = 5
+MAX_FILTERS_PER_GROUP = 6
+MAX_FILTERS_TOTAL = 18
+MAX_LIMIT = 100
+
+OPERATORS = {
+    'EQ', 'NEQ', 'LT', 'LTE', 'GT', 'GTE', 'BETWEEN', 'IN', 'NOT_IN',
+    'HAS_PROPERTY', 'NOT_HAS_PROPERTY', 'CONTAINS_TOKEN', 'NOT_CONTAINS_TOKEN'
+}
+
+OPERATOR_ALIASES = {
+    '=': 'EQ', '==': 'EQ', 'EQUALS': 'EQ', 'EQUAL': 'EQ', 'IS': 'EQ',
+    '!=': 'NEQ', '<>': 'NEQ', 'NE': 'NEQ', 'NOT_EQUALS': 'NEQ', 'NOT_EQ': 'NEQ',
+    '<': 'LT', '<=': 'LTE', '>': 'GT', '>=': 'GTE',
+    'LESS_THAN': 'LT', 'GREATER_THAN': 'GT', 'LESS_THAN_OR_EQUAL': 'LTE', 'GREATER_THAN_OR_EQUAL': 'GTE',
+    'CONTAINS': 'CONTAINS_TOKEN', 'LIKE': 'CONTAINS_TOKEN',
+    'NOT_CONTAINS': 'NOT_CONTAINS_TOKEN', 'NOT_LIKE': 'NOT_CONTAINS_TOKEN',
+    'EXISTS': 'HAS_PROPERTY', 'IS_KNOWN': 'HAS_PROPERTY', 'NOT_NULL': 'HAS_PROPERTY',
+    'NOT_EXISTS': 'NOT_HAS_PROPERTY', 'IS_UNKNOWN': 'NOT_HAS_PROPERTY', 'IS_NULL': 'NOT_HAS_PROPERTY',
+    'NIN': 'NOT_IN', 'IN_LIST': 'IN', 'RANGE': 'BETWEEN'
+}
+
+LIST_OPERATORS = {'IN', 'NOT_IN'}
+NO_VALUE_OPERATORS = {'HAS_PROPERTY', 'NOT_HAS_PROPERTY'}
+
+# Search-only properties HubSpot accepts in filters even though they are not returned
+SEARCHABLE_EXTRAS = {'hs_object_id', 'hs_searchable_calculated_phone_number', 'hs_lastmodifieddate'}
+
+OBJECT_ALIASES = {
+    'contact': 'contacts', 'deal': 'deals', 'company': 'companies', 'ticket': 'tickets'
+}
+
+KNOWN_ACTIONS = {'send_sms', 'create_task', 'send_notification', 'generate_report'}
+
+
+@dataclass
+class PlanIssue:
+    path: str
+    message: str
+
+    def __str__(self):
+        return f"{self.path}: {self.message}"
+
+
+@dataclass
+class PlanReport:
+    """Outcome of validating a plan; the plan itself is repaired in place"""
+    plan: Any
+    errors: List[PlanIssue] = field(default_factory=list)
+    repairs: List[PlanIssue] = field(default_factory=list)
+    warnings: List[PlanIssue] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def log(self):
+        for repair in self.repairs:
+            print(f"🔧 Plan repair - {repair}")
+        for warning in self.warnings:
+            print(f"⚠️  Plan warning - {warning}")
+        for error in self.errors:
+            print(f"❌ Plan error - {error}")
+
+
+def _squash(name: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+class PlanValidator:
+    """Validator compiled once per schema: property lookups and aliases are precomputed"""
+
+    def __init__(self, schema: Dict[str, List[str]], strict_properties: bool = False,
+                 strict_objects: Iterable[str] = ()):
+        self.strict_properties = strict_properties
+        # Objects whose schema is complete even when strict_properties is off
+        self.strict_objects = set(strict_objects)
+        self.properties: Dict[str, Set[str]] = {}
+        self.squashed: Dict[str, Dict[str, str]] = {}
+        for object_type, properties in schema.items():
+            known = set(properties) | SEARCHABLE_EXTRAS
+            known.discard('id')
+            self.properties[object_type] = known
+            # 'first_name', 'FirstName' and 'firstname' all resolve to 'firstname'
+            self.squashed[object_type] = {_squash(prop): prop for prop in known}
+
+    # --- top level ---------------------------------------------------------
+
+    def validate(self, plan: Any) -> PlanReport:
+        report = PlanReport(plan)
+        if not isinstance(plan, dict):
+            report.errors.append(PlanIssue('$', 'plan must be a JSON object'))
+            return report
+
+        endpoints = plan.get('hubspot_endpoints')
+        if isinstance(endpoints, dict):
+            plan['hubspot_endpoints'] = endpoints = [endpoints]
+            report.repairs.append(PlanIssue('hubspot_endpoints', 'wrapped a single endpoint object in a list'))
+        if not isinstance(endpoints, list) or not endpoints:
+            report.errors.append(PlanIssue('hubspot_endpoints', 'must be a non-empty list'))
+            return report
+
+        for index, entry in enumerate(endpoints):
+            self._validate_endpoint(entry, f'hubspot_endpoints[{index}]', report)
+
+        self._validate_actions(plan, report)
+        return report
+
+    def _validate_actions(self, plan: Dict, report: PlanReport):
+        actions = plan.get('suggested_actions')
+        if actions is None:
+            return
+        if isinstance(actions, str):
+            actions = [actions]
+            report.repairs.append(PlanIssue('suggested_actions', 'wrapped a single action in a list'))
+        if not isinstance(actions, list):
+            report.repairs.append(PlanIssue('suggested_actions', 'dropped (not a list)'))
+            actions = []
+        unknown = [action for action in actions if action not in KNOWN_ACTIONS]
+        if unknown:
+            report.repairs.append(PlanIssue('suggested_actions', f"dropped unknown action(s) {unknown}"))
+        plan['suggested_actions'] = [action for action in actions if action in KNOWN_ACTIONS]
+
+    # --- endpoints ---------------------------------------------------------
+
+    def _object_type(self, endpoint: str, path: str, report: PlanReport) -> Optional[str]:
+        match = re.search(r'crm/v3/objects/([a-z_]+)', endpoint or '')
+        raw_type = match.group(1) if match else (endpoint or '').strip('/').split('/')[-1]
+        object_type = OBJECT_ALIASES.get(raw_type, raw_type)
+        if object_type not in self.properties:
+            report.errors.append(PlanIssue(f'{path}.endpoint', f"unknown object type in '{endpoint}' (use {', '.join(sorted(self.properties))})"))
+            return None
+        return object_type
+
+    def _validate_endpoint(self, entry: Any, path: str, report: PlanReport):
+        if not isinstance(entry, dict):
+            report.errors.append(PlanIssue(path, 'must be an object'))
+            return
+
+        endpoint = entry.get('endpoint')
+        object_type = self._object_type(endpoint, path, report)
+        if not object_type:
+            return
+        # Plans name the object type alone ("contacts"), as in the planner prompt
+        canonical = object_type
+        if endpoint != canonical:
+            entry['endpoint'] = canonical
+            report.repairs.append(PlanIssue(f'{path}.endpoint', f"'{endpoint}' -> '{canonical}'"))
+
+        params = entry.get('params')
+        if params is None:
+            params = entry['params'] = {}
+        if not isinstance(params, dict):
+            report.errors.append(PlanIssue(f'{path}.params', 'must be an object'))
+            return
+
+        # A bare 'filters' list at the params level is one filter group
+        if 'filters' in params and 'filterGroups' not in params:
+            params['filterGroups'] = [{'filters': params.pop('filters')}]
+            report.repairs.append(PlanIssue(f'{path}.params.filters', 'moved into filterGroups[0]'))
+
+        self._validate_filter_groups(params, object_type, f'{path}.params', report)
+        self._validate_properties(params, object_type, f'{path}.params', report)
+        self._validate_sorts(params, object_type, f'{path}.params', report)
+
+        if 'query' in params and params['query'] is not None and not isinstance(params['query'], str):
+            params['query'] = str(params['query'])
+            report.repairs.append(PlanIssue(f'{path}.params.query', 'converted to a string'))
+
+        if 'limit' in params:
+            try:
+                limit = int(params['limit'])
+            except (TypeError, ValueError):
+                report.errors.append(PlanIssue(f'{path}.params.limit', f"'{params['limit']}' is not a number"))
+                return
+            clamped = max(1, min(limit, MAX_LIMIT))
+            if clamped != params['limit']:
+                params['limit'] = clamped
+                report.repairs.append(PlanIssue(f'{path}.params.limit', f'{limit} -> {clamped}'))
+
+    # --- filters -----------------------------------------------------------
+
+    def _validate_filter_groups(self, params: Dict, object_type: str, path: str, report: PlanReport):
+        groups = params.get('filterGroups')
+        if groups is None:
+            return
+        if isinstance(groups, dict):
+            groups = params['filterGroups'] = [groups]
+            report.repairs.append(PlanIssue(f'{path}.filterGroups', 'wrapped a single group in a list'))
+        if not isinstance(groups, list):
+            report.errors.append(PlanIssue(f'{path}.filterGroups', 'must be a list'))
+            return
+
+        # A flat list of filters is one group
+        if groups and all(isinstance(group, dict) and 'propertyName' in group for group in groups):
+            groups = params['filterGroups'] = [{'filters': groups}]
+            report.repairs.append(PlanIssue(f'{path}.filterGroups', 'wrapped a flat list of filters in one group'))
+
+        total = 0
+        for group_index, group in enumerate(groups):
+            group_path = f'{path}.filterGroups[{group_index}]'
+            filters = group.get('filters') if isinstance(group, dict) else None
+            if not isinstance(filters, list):
+                report.errors.append(PlanIssue(f'{group_path}.filters', 'must be a list'))
+                continue
+            if len(filters) > MAX_FILTERS_PER_GROUP:
+                report.errors.append(PlanIssue(f'{group_path}.filters', f'{len(filters)} filters (HubSpot allows {MAX_FILTERS_PER_GROUP} per group)'))
+            total += len(filters)
+            for filter_index, filter_item in enumerate(filters):
+                self._validate_filter(filter_item, object_type, f'{group_path}.filters[{filter_index}]', report)
+
+        if len(groups) > MAX_FILTER_GROUPS:
+            report.errors.append(PlanIssue(f'{path}.filterGroups', f'{len(groups)} groups (HubSpot allows {MAX_FILTER_GROUPS})'))
+        if total > MAX_FILTERS_TOTAL:
+            report.errors.append(PlanIssue(f'{path}.filterGroups', f'{total} filters in total (HubSpot allows {MAX_FILTERS_TOTAL})'))
+
+    def _validate_filter(self, filter_item: Any, object_type: str, path: str, report: PlanReport):
+        if not isinstance(filter_item, dict):
+            report.errors.append(PlanIssue(path, 'must be an object'))
+            return
+
+        for alias in ('property', 'field', 'name'):
+            if 'propertyName' not in filter_item and alias in filter_item:
+                filter_item['propertyName'] = filter_item.pop(alias)
+                report.repairs.append(PlanIssue(f'{path}.{alias}', "renamed to 'propertyName'"))
+
+        prop = filter_item.get('propertyName')
+        if not prop or not isinstance(prop, str):
+            report.errors.append(PlanIssue(f'{path}.propertyName', 'missing'))
+            return
+        resolved = self._resolve_property(prop, object_type, f'{path}.propertyName', report)
+        if resolved:
+            filter_item['propertyName'] = resolved
+
+        operator = filter_item.get('operator')
+        if not isinstance(operator, str):
+            report.errors.append(PlanIssue(f'{path}.operator', 'missing'))
+            return
+        canonical = operator.strip().upper().replace(' ', '_')
+        canonical = OPERATOR_ALIASES.get(canonical, canonical)
+        if canonical not in OPERATORS:
+            report.errors.append(PlanIssue(f'{path}.operator', f"unknown operator '{operator}' (use {', '.join(sorted(OPERATORS))})"))
+            return
+        if canonical != operator:
+            filter_item['operator'] = canonical
+            report.repairs.append(PlanIssue(f'{path}.operator', f"'{operator}' -> '{canonical}'"))
+
+        self._repair_values(filter_item, canonical, path, report)
+
+    def _repair_values(self, filter_item: Dict, operator: str, path: str, report: PlanReport):
+        has_value = filter_item.get('value') is not None
+        has_values = filter_item.get('values') is not None
+
+        if operator in NO_VALUE_OPERATORS:
+            for key in ('value', 'values', 'highValue'):
+                if key in filter_item:
+                    filter_item.pop(key)
+                    report.repairs.append(PlanIssue(f'{path}.{key}', f'removed ({operator} takes no value)'))
+            return
+
+        if operator in LIST_OPERATORS:
+            if not has_values and has_value:
+                value = filter_item.pop('value')
+                values = [v.strip() for v in value.split(',')] if isinstance(value, str) else value
+                filter_item['values'] = values if isinstance(values, list) else [values]
+                report.repairs.append(PlanIssue(f'{path}.value', f"moved into 'values' ({operator} takes a list)"))
+            elif has_values and not isinstance(filter_item['values'], list):
+                filter_item['values'] = [filter_item['values']]
+                report.repairs.append(PlanIssue(f'{path}.values', 'wrapped in a list'))
+            if not filter_item.get('values'):
+                report.errors.append(PlanIssue(f'{path}.values', f'{operator} needs a non-empty list'))
+            return
+
+        if operator == 'BETWEEN':
+            values = filter_item.get('values')
+            if isinstance(values, list) and len(values) == 2 and not has_value:
+                filter_item['value'], filter_item['highValue'] = values
+                filter_item.pop('values')
+                report.repairs.append(PlanIssue(f'{path}.values', "split into 'value' and 'highValue'"))
+            if filter_item.get('value') is None or filter_item.get('highValue') is None:
+                report.errors.append(PlanIssue(path, "BETWEEN needs 'value' and 'highValue'"))
+            return
+
+        if not has_value and has_values:
+            values = filter_item['values']
+            if isinstance(values, list) and len(values) == 1:
+                filter_item['value'] = filter_item.pop('values')[0]
+                report.repairs.append(PlanIssue(f'{path}.values', f"single value moved into 'value' ({operator})"))
+            elif isinstance(values, list) and operator in ('EQ', 'NEQ'):
+                filter_item['operator'] = 'IN' if operator == 'EQ' else 'NOT_IN'
+                report.repairs.append(PlanIssue(f'{path}.operator', f"{operator} with a list -> {filter_item['operator']}"))
+            else:
+                report.errors.append(PlanIssue(f'{path}.values', f"{operator} takes a single 'value'"))
+        elif not has_value:
+            report.errors.append(PlanIssue(f'{path}.value', f'{operator} needs a value'))
+
+    # --- properties --------------------------------------------------------
+
+    def _resolve_property(self, prop: str, object_type: str, path: str, report: PlanReport) -> Optional[str]:
+        known = self.properties[object_type]
+        if prop in known:
+            return prop
+        match = self.squashed[object_type].get(_squash(prop))
+        if match:
+            report.repairs.append(PlanIssue(path, f"'{prop}' -> '{match}'"))
+            return match
+        # The static schema only lists common properties; custom ones are legitimate
+        strict = self.strict_properties or object_type in self.strict_objects
+        issues = report.errors if strict else report.warnings
+        issues.append(PlanIssue(path, f"'{prop}' is not a known {object_type} property"))
+        return None
+
+    def _validate_properties(self, params: Dict, object_type: str, path: str, report: PlanReport):
+        properties = params.get('properties')
+        if properties is None:
+            return
+        if isinstance(properties, str):
+            properties = params['properties'] = [p.strip() for p in properties.split(',') if p.strip()]
+            report.repairs.append(PlanIssue(f'{path}.properties', 'split a comma-separated string into a list'))
+        if not isinstance(properties, list):
+            report.errors.append(PlanIssue(f'{path}.properties', 'must be a list'))
+            return
+        resolved = []
+        for index, prop in enumerate(properties):
+            if prop == 'id':
+                continue  # always returned
+            name = self._resolve_property(str(prop), object_type, f'{path}.properties[{index}]', report) or str(prop)
+            if name not in resolved:
+                resolved.append(name)
+        params['properties'] = resolved
+
+    def _validate_sorts(self, params: Dict, object_type: str, path: str, report: PlanReport):
+        sorts = params.get('sorts')
+        if sorts is None:
+            return
+        if isinstance(sorts, (str, dict)):
+            sorts = params['sorts'] = [sorts]
+            report.repairs.append(PlanIssue(f'{path}.sorts', 'wrapped in a list'))
+        for index, sort in enumerate(sorts):
+            sort_path = f'{path}.sorts[{index}]'
+            if isinstance(sort, str):
+                sort = sorts[index] = {'propertyName': sort.lstrip('-'), 'direction': 'DESCENDING' if sort.startswith('-') else 'ASCENDING'}
+                report.repairs.append(PlanIssue(sort_path, 'expanded to {propertyName, direction}'))
+            if not isinstance(sort, dict) or not sort.get('propertyName'):
+                report.errors.append(PlanIssue(f'{sort_path}.propertyName', 'missing'))
+                continue
+            resolved = self._resolve_property(sort['propertyName'], object_type, f'{sort_path}.propertyName', report)
+            if resolved:
+                sort['propertyName'] = resolved
+            direction = str(sort.get('direction', 'DESCENDING')).upper()
+            direction = {'DESC': 'DESCENDING', 'ASC': 'ASCENDING'}.get(direction, direction)
+            if direction not in ('ASCENDING', 'DESCENDING'):
+                report.errors.append(PlanIssue(f'{sort_path}.direction', f"'{sort.get('direction')}' must be ASCENDING or DESCENDING"))
+            elif direction != sort.get('direction'):
+                sort['direction'] = direction
+                report.repairs.append(PlanIssue(f'{sort_path}.direction', f'-> {direction}'))
+
+
+# --- JSON extraction --------------------------------------------------------
+
+_FENCE = re.compile(r'```(?:json)?\s*(.*?)```', re.DOTALL)
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_LINE_COMMENT = re.compile(r'^\s*//.*$', re.MULTILINE)
+_PY_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+
+def _lenient(text: str) -> str:
+    """Fix the usual near-JSON: trailing commas, // comments, Python literals, smart quotes"""
+    text = _LINE_COMMENT.sub('', text)
+    text = _TRAILING_COMMA.sub(r'\1', text)
+    text = text.replace('“', '"').replace('”', '"')
+    return re.sub(r'\b(True|False|None)\b(?=(?:[^"]*"[^"]*")*[^"]*$)', lambda m: _PY_LITERALS[m.group(1)], text)
+
+
+def parse_plan_json(text: str) -> Optional[Dict[str, Any]]:
+    """First JSON object in a model response, tolerating fences, prose and near-JSON"""
+
+    if not text:
+        return None
+    candidates = [match.group(1) for match in _FENCE.finditer(text)] + [text]
+    decoder = json.JSONDecoder()
+
+    for candidate in candidates:
+        for source in (candidate, _lenient(candidate)):
+            # raw_decode at each '{' finds a complete object even with prose around it;
+            # a non-plan object only counts when it is the outermost one (never a lone inner filter)
+            outermost = None
+            position = first_brace = source.find('{')
+            while position != -1:
+                try:
+                    value, _ = decoder.raw_decode(source, position)
+                    if isinstance(value, dict):
+                        if 'hubspot_endpoints' in value:
+                            return value
+                        if position == first_brace:
+                            outermost = value
+                except json.JSONDecodeError:
+                    pass
+                position = source.find('{', position + 1)
+            if outermost is not None:
+                return outermost
+    return None
+
+
+def hubspot_error_detail(error: Exception) -> str:
+    """HubSpot's explanation of a failed request (400 bodies name the bad filter or property)"""
+
+    response = getattr(error, 'response', None)
+    if response is None:
+        return ''
+    try:
+        body = response.json()
+    except ValueError:
+        return f" - {response.text[:300]}" if response.text else ''
+    message = body.get('message', '')
+    details = [item.get('message', '') for item in body.get('errors', []) if isinstance(item, dict)]
+    return ' - ' + ' | '.join(part for part in [message] + details if part)
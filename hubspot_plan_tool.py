@@ -0,0 +1,127 @@
+"""
+Tool-use planner mode: the query plan is a tool whose typed input Claude fills in directly
+"""
+
+import inspect
+from typing import Dict, Any, Optional
+
+from hubspot_aggregation import SUPPORTED_OPERATIONS
+from hubspot_plan_schema import KNOWN_ACTIONS, OPERATORS
+
+PLANNER_MODES = ('tool', 'text')
+
+_FILTER = {
+    'type': 'object',
+    'properties': {
+        'propertyName': {'type': 'string'},
+        'operator': {'type': 'string', 'enum': sorted(OPERATORS)},
+        'value': {'type': ['string', 'number', 'boolean']},
+        'values': {'type': 'array', 'items': {'type': ['string', 'number']}},
+        'highValue': {'type': ['string', 'number']}
+    },
+    'required': ['propertyName', 'operator']
+}
+
+_AGGREGATION = {
+    'type': 'object',
+    'properties': {
+        'group_by': {'type': 'array', 'items': {'type': 'string'}},
+        'metrics': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'op': {'type': 'string', 'enum': list(SUPPORTED_OPERATIONS)},
+                    'property': {'type': 'string'}
+                },
+                'required': ['op']
+            }
+        },
+        'top_n': {'type': 'integer', 'minimum': 1},
+        'order_by': {'type': 'string'}
+    }
+}
+
+PLAN_TOOL = {
+    'name': 'submit_query_plan',
+    'description': 'Submit the HubSpot query plan that answers the question.',
+    'input_schema': {
+        'type': 'object',
+        'properties': {
+            'hubspot_endpoints': {
+                'type': 'array',
+                'minItems': 1,
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'endpoint': {'type': 'string', 'enum': ['contacts', 'deals', 'companies', 'tickets']},
+                        'mode': {'type': 'string', 'enum': ['records', 'count']},
+                        'params': {
+                            'type': 'object',
+                            'properties': {
+                                'filterGroups': {
+                                    'type': 'array',
+                                    'maxItems': 5,
+                                    'items': {
+                                        'type': 'object',
+                                        'properties': {'filters': {'type': 'array', 'maxItems': 6, 'items': _FILTER}},
+                                        'required': ['filters']
+                                    }
+                                },
+                                'query': {'type': 'string'},
+                                'properties': {'type': 'array', 'items': {'type': 'string'}},
+                                'limit': {'type': 'integer', 'minimum': 1, 'maximum': 100},
+                                'sorts': {
+                                    'type': 'array',
+                                    'items': {
+                                        'type': 'object',
+                                        'properties': {
+                                            'propertyName': {'type': 'string'},
+                                            'direction': {'type': 'string', 'enum': ['ASCENDING', 'DESCENDING']}
+                                        }
+                                    }
+                                }
+                            }
+                        },
+                        'aggregation': _AGGREGATION,
+                        'purpose': {'type': 'string'}
+                    },
+                    'required': ['endpoint', 'params', 'purpose']
+                }
+            },
+            'expected_result_type': {'type': 'string'},
+            'suggested_actions': {'type': 'array', 'items': {'type': 'string', 'enum': sorted(KNOWN_ACTIONS)}},
+            'action_triggers': {'type': 'object'}
+        },
+        'required': ['hubspot_endpoints', 'expected_result_type']
+    }
+}
+
+# Appended to the planner prompt; the JSON examples in it describe the tool input
+TOOL_INSTRUCTION = f"Submit the plan by calling the {PLAN_TOOL['name']} tool; its input is the JSON plan described above."
+
+
+def create_tool_message(client, tool: Dict[str, Any], **kwargs):
+    """messages.create forced to call the tool; SDKs before tools went GA only have it under beta"""
+
+    create = client.messages.create
+    if 'tools' not in inspect.signature(create).parameters:
+        create = client.beta.tools.messages.create
+    # tool_choice predates the SDK's keyword for it, so send it in the body
+    return create(
+        tools=[tool],
+        extra_body={'tool_choice': {'type': 'tool', 'name': tool['name']}},
+        **kwargs
+    )
+
+
+def tool_input(response, tool_name: str) -> Optional[Dict[str, Any]]:
+    """The arguments of the named tool call, already decoded by the API"""
+    for block in response.content:
+        if getattr(block, 'type', None) == 'tool_use' and block.name == tool_name:
+            return block.input if isinstance(block.input, dict) else None
+    return None
+
+
+def response_text(response) -> str:
+    return ''.join(getattr(block, 'text', '') for block in response.content if getattr(block, 'type', 'text') == 'text').strip()
@@ -0,0 +1,157 @@
+"""
+Property projection: work out the smallest property list each search needs
+"""
+
+import re
+from typing import Dict, List, Any, Iterable, Set
+
+# Fields read by extract_phone_number, in lookup order
+PHONE_FIELDS = [
+    'phone', 'phoneNumber', 'phone_number', 'mobilephone',
+    'mobile', 'cell', 'telephone', 'contact_phone', 'number'
+]
+
+# Fields read by extract_name, in lookup order (email is the last-resort fallback)
+NAME_FIELDS = ['firstname', 'lastname', 'name', 'fullname', 'contact_name', 'dealname', 'company', 'email']
+
+# Properties each follow-up action reads from a record
+ACTION_FIELDS = {
+    'send_sms': PHONE_FIELDS + NAME_FIELDS,
+    'create_task': NAME_FIELDS,
+    'send_notification': [],
+    'generate_report': []
+}
+
+# What each action needs from a record: at least one field of every group
+ACTION_REQUIREMENTS = {
+    'send_sms': [PHONE_FIELDS, NAME_FIELDS],
+    'create_task': [NAME_FIELDS]
+}
+
+# The web interface offers every action on contact results, whatever the plan suggested
+INTERFACE_ACTIONS = {
+    'contacts': ['send_sms', 'send_notification', 'create_task', 'generate_report']
+}
+
+# What the web interface shows for each object type
+DISPLAY_FIELDS = {
+    'contacts': ['firstname', 'lastname', 'email'],
+    'companies': ['name', 'domain'],
+    'deals': ['dealname', 'amount', 'dealstage'],
+    'tickets': ['subject', 'hs_pipeline_stage']
+}
+
+# Words in a question that point at a property without naming it
+INTENT_SYNONYMS = {
+    'phone': ['phone', 'mobilephone'],
+    'number': ['phone', 'mobilephone'],
+    'mobile': ['mobilephone'],
+    'stage': ['dealstage', 'lifecyclestage', 'hs_pipeline_stage'],
+    'revenue': ['amount', 'annualrevenue'],
+    'value': ['amount'],
+    'size': ['amount', 'numberofemployees'],
+    'employees': ['numberofemployees'],
+    'title': ['jobtitle'],
+    'owner': ['hubspot_owner_id'],
+    'created': ['createdate'],
+    'recent': ['createdate'],
+    'new': ['createdate'],
+    'closing': ['closedate'],
+    'close': ['closedate'],
+    'status': ['hs_lead_status'],
+    'location': ['city', 'state', 'country'],
+    'priority': ['hs_ticket_priority']
+}
+
+# Properties used only for searching; HubSpot never needs to send them back
+SEARCH_ONLY_PROPERTIES = {'hs_searchable_calculated_phone_number', 'hs_object_id'}
+
+
+def question_properties(text: str, known: Set[str]) -> List[str]:
+    """Properties a question (or the plan's expected result) talks about"""
+
+    properties = []
+    for word in re.findall(r'[a-z_]+', (text or '').lower()):
+        candidates = INTENT_SYNONYMS.get(word, [])
+        if word in known:
+            candidates = [word] + candidates
+        elif word.endswith('s') and word[:-1] in known:
+            candidates = [word[:-1]] + candidates
+        properties.extend(p for p in candidates if p in known and p not in properties)
+    return properties
+
+
+def filter_properties(params: Dict) -> List[str]:
+    """Properties a search filters on (worth showing back next to the results)"""
+
+    properties = []
+    for group in params.get('filterGroups') or []:
+        for filter_item in group.get('filters', []):
+            prop = filter_item.get('propertyName')
+            if prop and prop not in SEARCH_ONLY_PROPERTIES and prop not in properties:
+                properties.append(prop)
+    return properties
+
+
+def _ordered_union(*lists: Iterable[str]) -> List[str]:
+    merged = []
+    for items in lists:
+        for item in items:
+            if item not in merged:
+                merged.append(item)
+    return merged
+
+
+def project_endpoint(endpoint_config: Dict, question: str, schema: Dict[str, List[str]],
+                     actions: List[str], intent_text: str = '') -> List[str]:
+    """Minimal property list for one plan entry"""
+
+    object_type = endpoint_config['endpoint'].split('/')[-1]
+    params = endpoint_config.get('params', {})
+    requested = params.get('properties') or []
+
+    # Everything the planner asked for is presumed to exist, on top of the known schema
+    known = set(schema.get(object_type, [])) | set(requested)
+    known.discard('id')
+
+    actions = _ordered_union(actions, INTERFACE_ACTIONS.get(object_type, []))
+    needed = _ordered_union(
+        DISPLAY_FIELDS.get(object_type, []),
+        [field for action in actions for field in ACTION_FIELDS.get(action, [])],
+        question_properties(f"{question} {intent_text}", known),
+        filter_properties(params)
+    )
+
+    return [prop for prop in needed if prop in known and prop not in SEARCH_ONLY_PROPERTIES]
+
+
+def project_plan_properties(plan: Dict[str, Any], question: str, schema: Dict[str, List[str]],
+                            action_type: str = None) -> Dict[str, Any]:
+    """Replace each search's property list with the minimal set; returns the same plan"""
+
+    actions = list(plan.get('suggested_actions') or [])
+    if action_type and action_type not in actions:
+        actions.append(action_type)
+    intent_text = plan.get('expected_result_type', '')
+
+    for endpoint_config in plan.get('hubspot_endpoints') or []:
+        # Count and aggregation entries already fetch only what they need
+        if endpoint_config.get('mode') == 'count' or endpoint_config.get('aggregation'):
+            continue
+
+        params = endpoint_config.setdefault('params', {})
+        before = params.get('properties') or []
+        projected = project_endpoint(endpoint_config, question, schema, actions, intent_text)
+
+        if projected:
+            params['properties'] = projected
+            print(f"🎯 Projection for {endpoint_config['endpoint']}: {len(before) or 'default'} → {len(projected)} properties {projected}")
+
+    return plan
+
+
+def action_requirements(action_type: str, known: Set[str]) -> List[List[str]]:
+    """The action's field groups narrowed to properties that exist (groups with none are dropped)"""
+
+    groups = [[field for field in group if field in known] for group in ACTION_REQUIREMENTS.get(action_type, [])]
+    return [group for group in groups if group]
@@ -0,0 +1,331 @@
+"""
+Property metadata from crm/v3/properties/{object}: cached on disk per portal, revalidated
+with ETags after a TTL, and condensed into a token-budgeted schema digest for the planner
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Any, Callable, Iterable, Optional, Tuple
+
+from hubspot_plan_schema import PlanValidator
+
+OBJECT_TYPES = ('contacts', 'companies', 'deals', 'tickets')
+
+# Used for any object whose metadata could not be loaded, and listed first in the digest
+DEFAULT_PROPERTIES = {
+    'contacts': [
+        'id', 'email', 'firstname', 'lastname', 'phone', 'mobilephone', 'company',
+        'createdate', 'lastmodifieddate', 'lifecyclestage', 'hs_lead_status',
+        'city', 'state', 'country', 'website', 'jobtitle'
+    ],
+    'companies': [
+        'id', 'name', 'domain', 'industry', 'city', 'state', 'country',
+        'createdate', 'numberofemployees', 'annualrevenue', 'phone', 'website'
+    ],
+    'deals': [
+        'id', 'dealname', 'amount', 'dealstage', 'pipeline', 'createdate',
+        'closedate', 'hubspot_owner_id', 'dealtype', 'description'
+    ],
+    'tickets': [
+        'id', 'subject', 'content', 'hs_pipeline_stage', 'createdate',
+        'hs_ticket_priority', 'hubspot_owner_id'
+    ]
+}
+
+# Enumerations with more options than this list none of them in the digest
+MAX_DIGEST_OPTIONS = 6
+# Rough prompt-token cost of digest text
+CHARS_PER_TOKEN = 4
+# After a failed refresh the stale copy is kept and the next attempt waits this long
+RETRY_SECONDS = 300
+
+
+@dataclass(frozen=True)
+class PropertyInfo:
+    name: str
+    label: str
+    type: str
+    field_type: str = ''
+    options: Tuple[str, ...] = ()
+    hubspot_defined: bool = False
+    calculated: bool = False
+    hidden: bool = False
+
+    @classmethod
+    def from_api(cls, prop: Dict[str, Any]) -> 'PropertyInfo':
+        return cls(
+            name=prop['name'],
+            label=prop.get('label') or prop['name'],
+            type=prop.get('type', 'string'),
+            field_type=prop.get('fieldType', ''),
+            options=tuple(option.get('value') for option in prop.get('options') or [] if not option.get('hidden')),
+            # HubSpot omits hubspotDefined on custom properties
+            hubspot_defined=bool(prop.get('hubspotDefined', False)),
+            calculated=bool(prop.get('calculated', False)),
+            hidden=bool(prop.get('hidden', False))
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact form kept in the disk cache"""
+        return {
+            'name': self.name, 'label': self.label, 'type': self.type, 'fieldType': self.field_type,
+            'options': [{'value': value} for value in self.options],
+            'hubspotDefined': self.hubspot_defined, 'calculated': self.calculated, 'hidden': self.hidden
+        }
+
+    def digest_entry(self) -> str:
+        """'name', plus type, label and options where the planner can't guess them"""
+        entry = self.name
+        if not self.hubspot_defined:
+            if self.label.lower().replace(' ', '') != self.name.lower().replace('_', ''):
+                entry += f' "{self.label}"'
+            if self.type != 'string':
+                entry += f"({self.type})"
+        if self.options and len(self.options) <= MAX_DIGEST_OPTIONS:
+            entry += '{' + '|'.join(self.options) + '}'
+        return entry
+
+
+class PropertySchema:
+    """Every property of every CRM object, with O(1) lookups and a prompt digest
+
+    fetch(object_type, etag) returns (response JSON, etag), or (None, etag) when HubSpot
+    answers 304 Not Modified. Metadata is read from cache_path when fresh, refreshed after
+    ttl_seconds, and objects that never loaded fall back to DEFAULT_PROPERTIES.
+    """
+
+    def __init__(self, fetch: Callable[[str, Optional[str]], Tuple[Optional[Dict], Optional[str]]],
+                 cache_path: str = None, ttl_seconds: int = 21600, object_types: Iterable[str] = OBJECT_TYPES):
+        self.fetch = fetch
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+        self.object_types = tuple(object_types)
+        self._properties: Dict[str, Dict[str, PropertyInfo]] = {}
+        self._etags: Dict[str, Optional[str]] = {}
+        self._fetched_at: Dict[str, float] = {}
+        self._retry_at: Dict[str, float] = {}
+        self._disk_loaded = False
+        self._lock = threading.Lock()
+        # Derived views, rebuilt only when metadata changes
+        self._schema: Optional[Dict[str, List[str]]] = None
+        self._validator: Optional[PlanValidator] = None
+        self._digests: Dict[tuple, str] = {}
+        self.requests = 0
+        self.not_modified = 0
+        self.failures = 0
+
+    # --- loading -----------------------------------------------------------
+
+    def _read_disk(self):
+        self._disk_loaded = True
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️  Ignoring unreadable property cache {self.cache_path}: {e}")
+            return
+        for object_type, entry in cached.items():
+            if object_type not in self.object_types:
+                continue
+            self._properties[object_type] = {
+                prop['name']: PropertyInfo.from_api(prop) for prop in entry.get('results', [])
+            }
+            self._etags[object_type] = entry.get('etag')
+            self._fetched_at[object_type] = entry.get('fetched_at', 0)
+        if cached:
+            print(f"📂 Property metadata for {', '.join(sorted(self._properties))} read from {self.cache_path}")
+
+    def _write_disk(self):
+        if not self.cache_path:
+            return
+        cached = {
+            object_type: {
+                'etag': self._etags.get(object_type),
+                'fetched_at': self._fetched_at.get(object_type, 0),
+                'results': [prop.to_dict() for prop in properties.values()]
+            }
+            for object_type, properties in self._properties.items()
+        }
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            temp_path = f"{self.cache_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(cached, f)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"⚠️  Could not write property cache {self.cache_path}: {e}")
+
+    def _stale(self, object_type: str, now: float) -> bool:
+        if now < self._retry_at.get(object_type, 0):
+            return False
+        return now - self._fetched_at.get(object_type, 0) >= self.ttl_seconds
+
+    def _refresh(self, object_type: str, now: float) -> Optional[bool]:
+        """Revalidate one object's metadata: True when it changed, False when not, None on failure"""
+        self.requests += 1
+        etag = self._etags.get(object_type) if object_type in self._properties else None
+        try:
+            payload, etag = self.fetch(object_type, etag)
+            if payload is not None and 'results' not in payload:
+                raise ValueError('no properties in response')
+        except Exception as e:
+            self.failures += 1
+            self._retry_at[object_type] = now + RETRY_SECONDS
+            fallback = 'keeping cached metadata' if object_type in self._properties else 'using the default schema'
+            print(f"⚠️  Property metadata for {object_type} unavailable ({e}); {fallback}")
+            return None
+
+        self._fetched_at[object_type] = time.time()
+        self._etags[object_type] = etag
+        if payload is None:
+            self.not_modified += 1
+            return False
+        self._properties[object_type] = {
+            prop.name: prop for prop in map(PropertyInfo.from_api, payload['results'])
+        }
+        print(f"🏷️  Loaded {len(self._properties[object_type])} {object_type} properties")
+        return True
+
+    def _ensure_fresh(self):
+        # Wall-clock time so that freshness survives restarts through the disk cache
+        if self._disk_loaded and not any(self._stale(object_type, time.time()) for object_type in self.object_types):
+            return
+        with self._lock:
+            if not self._disk_loaded:
+                self._read_disk()
+                self._reset_views()
+            now = time.time()
+            stale = [object_type for object_type in self.object_types if self._stale(object_type, now)]
+            if not stale:
+                return
+            outcomes = [self._refresh(object_type, now) for object_type in stale]
+            if any(outcome is not None for outcome in outcomes):
+                self._write_disk()
+            if any(outcomes):
+                self._reset_views()
+
+    def _reset_views(self):
+        self._schema = None
+        self._validator = None
+        self._digests = {}
+
+    def invalidate(self, object_type: str = None):
+        """Revalidate one object (or all) on next use, e.g. after a property-change webhook"""
+        with self._lock:
+            for name in ([object_type] if object_type else self.object_types):
+                self._fetched_at[name] = 0
+                self._retry_at.pop(name, None)
+
+    def observe(self, object_type: str, names: Iterable[str]):
+        """Properties seen on a record (webhook): revalidate the object when one is new to us"""
+        properties = self._properties.get(object_type)
+        if properties is not None and any(name not in properties for name in names):
+            self.invalidate(object_type)
+
+    # --- lookups -----------------------------------------------------------
+
+    @property
+    def complete(self) -> bool:
+        """True when every object's live metadata is loaded (not the default schema)"""
+        self._ensure_fresh()
+        return all(object_type in self._properties for object_type in self.object_types)
+
+    def property(self, object_type: str, name: str) -> Optional[PropertyInfo]:
+        self._ensure_fresh()
+        return self._properties.get(object_type, {}).get(name)
+
+    def _ordered(self, object_type: str) -> List[PropertyInfo]:
+        """Visible properties, most useful to the planner first: common, then custom, then the rest"""
+        properties = self._properties.get(object_type, {})
+        common = [properties[name] for name in DEFAULT_PROPERTIES.get(object_type, []) if name in properties]
+        common_names = {prop.name for prop in common}
+        rest = [prop for prop in properties.values() if prop.name not in common_names and not prop.hidden]
+        custom = sorted((prop for prop in rest if not prop.hubspot_defined), key=lambda prop: prop.name)
+        builtin = sorted(
+            (prop for prop in rest if prop.hubspot_defined),
+            # Internal hs_* and calculated properties are the least likely to be asked about
+            key=lambda prop: (prop.calculated, prop.name.startswith('hs_'), prop.name)
+        )
+        return common + custom + builtin
+
+    def schema(self) -> Dict[str, List[str]]:
+        """object type -> property names, in the shape of the old hard-coded schema
+
+        Every loaded property is listed, hidden ones last: they are real and can be queried,
+        they are only left out of the planner digest.
+        """
+        self._ensure_fresh()
+        schema = self._schema
+        if schema is None:
+            schema = {}
+            for object_type in self.object_types:
+                if object_type in self._properties:
+                    ordered = [prop.name for prop in self._ordered(object_type)]
+                    listed = set(ordered)
+                    hidden = sorted(name for name in self._properties[object_type] if name not in listed)
+                    schema[object_type] = ['id'] + ordered + hidden
+                else:
+                    schema[object_type] = list(DEFAULT_PROPERTIES.get(object_type, ['id']))
+            self._schema = schema
+        return schema
+
+    def validator(self) -> PlanValidator:
+        """Validator over every known property; unknown names are errors for objects with live metadata"""
+        schema = self.schema()
+        validator = self._validator
+        if validator is None:
+            validator = self._validator = PlanValidator(schema, strict_objects=list(self._properties))
+        return validator
+
+    def properties_within(self, object_type: str, max_tokens: int) -> List[str]:
+        """Digest entries for one object, in priority order, within a token budget"""
+        self._ensure_fresh()
+        if object_type not in self._properties:
+            return [name for name in DEFAULT_PROPERTIES.get(object_type, []) if name != 'id']
+        entries = []
+        budget = max_tokens * CHARS_PER_TOKEN
+        for prop in self._ordered(object_type):
+            entry = prop.digest_entry()
+            budget -= len(entry) + 2
+            if budget < 0:
+                break
+            entries.append(entry)
+        return entries
+
+    def digest(self, object_types: Iterable[str] = None, max_tokens: int = 1200) -> str:
+        """One line per object for the planner prompt, sharing max_tokens between the objects"""
+        object_types = tuple(object_types or self.object_types)
+        self._ensure_fresh()
+        key = (object_types, max_tokens)
+        digest = self._digests.get(key)
+        if digest is None:
+            lines = []
+            for object_type in object_types:
+                entries = self.properties_within(object_type, max_tokens // len(object_types))
+                total = len(self._ordered(object_type)) if object_type in self._properties else len(entries)
+                more = f" (+{total - len(entries)} more)" if total > len(entries) else ''
+                lines.append(f"{object_type}: {', '.join(entries)}{more}")
+            digest = self._digests[key] = '\n'.join(lines)
+        return digest
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'objects': {object_type: len(properties) for object_type, properties in self._properties.items()},
+            'complete': all(object_type in self._properties for object_type in self.object_types),
+            'requests': self.requests,
+            'not_modified': self.not_modified,
+            'failures': self.failures,
+            'ttl_seconds': self.ttl_seconds
+        }
+
+
+def default_cache_dir() -> str:
+    return os.path.join(tempfile.gettempdir(), 'hubspot_properties')
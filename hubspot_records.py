@@ -0,0 +1,144 @@
+"""
+Typed search records: contacts, deals and companies as built by flattening, with the dialable
+phone number and display name each derived once instead of re-probed on every read
+"""
+
+from typing import Any, Dict, Mapping, Optional
+
+from hubspot_projection import PHONE_FIELDS
+
+# Stands in for a property a record does not have at all
+MISSING = object()
+
+# Single-field names tried after firstname/lastname, in order (email is the last resort)
+NAME_FALLBACK_FIELDS = ('name', 'fullname', 'contact_name', 'dealname', 'company')
+
+
+def dialable_phone(record: Mapping) -> Optional[str]:
+    """Digits of the first phone field with 10+ of them, a 10-digit number prefixed with 1 (US)"""
+    for field in PHONE_FIELDS:
+        phone = record.get(field)
+        if phone:
+            cleaned_phone = ''.join(filter(str.isdigit, str(phone)))
+            if len(cleaned_phone) == 10:
+                cleaned_phone = '1' + cleaned_phone
+            if len(cleaned_phone) >= 10:
+                return cleaned_phone
+    return None
+
+
+def display_name(record: Mapping) -> str:
+    """'First Last', else a single name field, else the email's local part, else 'Contact'
+
+    Null first/last names read as empty.
+    """
+    first = record.get('firstname', MISSING)
+    if first is not MISSING:
+        last = record.get('lastname', MISSING)
+        if last is not MISSING:
+            first = (first or '').strip()
+            last = (last or '').strip()
+            if first or last:
+                return f"{first} {last}".strip()
+    for field in NAME_FALLBACK_FIELDS:
+        value = record.get(field)
+        if value:
+            return str(value).strip()
+    email = record.get('email')
+    if email:
+        return email.split('@')[0]
+    return 'Contact'
+
+
+class HubSpotRecord(dict):
+    """A flattened search result
+
+    Still the record's property dict, so JSON responses, aggregation and exports read it
+    unchanged; the slots hold what the SMS and task paths derive from it. Both are computed on
+    first read and forgotten when a property is set (webhook patches update records in place).
+    """
+    __slots__ = ('_phone', '_display_name')
+    object_type: Optional[str] = None
+
+    @property
+    def phone(self) -> Optional[str]:
+        try:
+            return self._phone
+        except AttributeError:
+            self._phone = dialable_phone(self)
+            return self._phone
+
+    @property
+    def display_name(self) -> str:
+        try:
+            return self._display_name
+        except AttributeError:
+            self._display_name = display_name(self)
+            return self._display_name
+
+    def _forget(self):
+        for slot in HubSpotRecord.__slots__:
+            try:
+                delattr(self, slot)
+            except AttributeError:
+                pass
+
+    def __setitem__(self, name: str, value: Any):
+        dict.__setitem__(self, name, value)
+        self._forget()
+
+    def __delitem__(self, name: str):
+        dict.__delitem__(self, name)
+        self._forget()
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._forget()
+
+    def pop(self, *args):
+        self._forget()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._forget()
+        return dict.popitem(self)
+
+    def setdefault(self, name: str, default: Any = None):
+        self._forget()
+        return dict.setdefault(self, name, default)
+
+    def clear(self):
+        dict.clear(self)
+        self._forget()
+
+    def __ior__(self, other):
+        dict.update(self, other)
+        self._forget()
+        return self
+
+
+class ContactRecord(HubSpotRecord):
+    __slots__ = ()
+    object_type = 'contacts'
+
+
+class DealRecord(HubSpotRecord):
+    __slots__ = ()
+    object_type = 'deals'
+
+
+class CompanyRecord(HubSpotRecord):
+    __slots__ = ()
+    object_type = 'companies'
+
+
+RECORD_TYPES: Dict[str, type] = {
+    record_type.object_type: record_type for record_type in (ContactRecord, DealRecord, CompanyRecord)
+}
+
+
+def record_type(object_type: Optional[str]) -> Optional[type]:
+    """Record class for an object type ('contacts', 'crm/v3/objects/deals'...); None for others"""
+    if not object_type:
+        return None
+    return RECORD_TYPES.get(object_type.strip('/').split('/')[-1])
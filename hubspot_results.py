@@ -0,0 +1,309 @@
+"""
+Server-held query results: stored under an opaque ID with a TTL, spilled to disk when large,
+and paged in further (in the plan's order) when an action reaches past the held page
+"""
+
+import dataclasses
+import itertools
+import json
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Iterable, Iterator, Optional
+
+from hubspot_projection import filter_properties, action_requirements
+
+# Result types that carry totals or grouped rows rather than the matched records
+SUMMARY_TYPES = ('count', 'aggregation')
+
+
+def plan_limit(plan: Dict[str, Any]) -> Optional[int]:
+    """How many records the plan asked for in all; None when an entry has no limit (counts, aggregations)"""
+    limits = [
+        None if str(entry.get('mode', '')).lower() == 'count' or 'aggregation' in entry else entry.get('params', {}).get('limit')
+        for entry in plan.get('hubspot_endpoints', [])
+    ]
+    if not limits or None in limits:
+        return None
+    return sum(limits)
+
+
+class SpilledRecords:
+    """Records kept in a JSON-lines file and read back lazily; supports len(), iteration and slicing"""
+
+    def __init__(self, path: str, count: int):
+        self.path = path
+        self.count = count
+
+    @classmethod
+    def write(cls, path: str, pages: Iterable[Iterable[Dict]]) -> 'SpilledRecords':
+        count = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for page in pages:
+                for record in page:
+                    f.write(json.dumps(record, default=str))
+                    f.write('\n')
+                    count += 1
+        return cls(path, count)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[Dict]:
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(itertools.islice(iter(self), index.start, index.stop, index.step))
+        if index < 0:
+            index += self.count
+        for record in itertools.islice(iter(self), index, index + 1):
+            return record
+        raise IndexError(index)
+
+
+class ResultHandle:
+    """One stored result: the plan that produced it and its QueryResults"""
+
+    def __init__(self, result_id: str, tenant_id: str, question: str, plan: Dict[str, Any], results: List[Any]):
+        self.result_id = result_id
+        self.tenant_id = tenant_id
+        self.question = question
+        self.plan = plan
+        self.results = results
+        self.created = time.monotonic()
+        self.lock = threading.Lock()
+        # Set when webhook changes could not be patched in; the next action re-fetches
+        self.stale = False
+
+    def covers(self, needed: Optional[int] = None, fields: Optional[List[List[str]]] = None) -> bool:
+        """True when the held records include the first `needed` the plan asked for (all of them when None)
+
+        fields are groups of properties the action reads; every group needs one of its fields on the held
+        records, otherwise they were projected without them and must be fetched again.
+        """
+        if self.stale:
+            return False
+        wanted = plan_limit(self.plan)
+        for result in self.results:
+            if result.query_type == 'count':
+                return False
+            if result.query_type in SUMMARY_TYPES:
+                continue
+            target = min(bound for bound in (result.total_count, wanted, needed) if bound is not None)
+            if len(result.data) < target:
+                return False
+            # Every record of a search carries the same requested properties, so the first one tells
+            if fields and len(result.data) and any(not set(group) & result.data[0].keys() for group in fields):
+                return False
+        return True
+
+
+    def apply_changes(self, changes: Dict[str, Any]) -> bool:
+        """Patch held records with webhook changes (object id -> ObjectChange); False when marked stale
+
+        Property values are updated in place and deleted records dropped. A created record, or
+        a change to a property the plan filters on, may change which records match, so those -
+        like spilled records, which aren't patched - mark the result stale instead.
+        """
+        endpoints = self.plan.get('hubspot_endpoints') or []
+        filtered = {prop for entry in endpoints for prop in filter_properties(entry.get('params', {}))}
+        free_text = any(entry.get('params', {}).get('query') for entry in endpoints)
+        for change in changes.values():
+            if change.created or change.other or filtered.intersection(change.changes) or (free_text and change.changes):
+                self.stale = True
+                return False
+
+        for index, result in enumerate(self.results):
+            if result.query_type in SUMMARY_TYPES:
+                continue
+            if not isinstance(result.data, list):
+                self.stale = True
+                return False
+            kept = []
+            for record in result.data:
+                change = changes.get(str(record.get('id')))
+                if change is None:
+                    kept.append(record)
+                elif not change.deleted:
+                    for name, value in change.properties.items():
+                        if name in record:
+                            record[name] = value
+                    kept.append(record)
+            if len(kept) < len(result.data):
+                self.results[index] = dataclasses.replace(
+                    result, data=kept, total_count=max(result.total_count - (len(result.data) - len(kept)), 0)
+                )
+        return True
+
+
+class ResultStore:
+    """Results by opaque ID, per tenant, expired after ttl_seconds
+
+    Record sets larger than max_memory_records are written to spill_dir as JSON lines
+    (no spill_dir keeps everything in memory).
+    """
+
+    def __init__(self, ttl_seconds: int = 1800, max_results: int = 500,
+                 max_memory_records: int = 5000, spill_dir: str = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_results = max_results
+        self.max_memory_records = max_memory_records
+        self.spill_dir = spill_dir
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._results: 'OrderedDict[str, ResultHandle]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _spill_path(self, handle: ResultHandle, index: int) -> str:
+        return os.path.join(self.spill_dir, handle.result_id, f"{index}.jsonl")
+
+    def _store_records(self, handle: ResultHandle, index: int, result, pages: Iterable[Iterable[Dict]]):
+        """The result with its records in memory, or spilled to disk once they pass the memory limit"""
+        pages = iter(pages)
+        held = []
+        for page in pages:
+            held.extend(page)
+            if self.spill_dir and len(held) > self.max_memory_records:
+                path = self._spill_path(handle, index)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                records = SpilledRecords.write(path, itertools.chain([held], pages))
+                print(f"💾 Spilled {len(records):,} records of result {handle.result_id[:8]} to disk")
+                return dataclasses.replace(result, data=records)
+        return dataclasses.replace(result, data=held)
+
+    def _drop(self, handle: ResultHandle):
+        if self.spill_dir:
+            shutil.rmtree(os.path.join(self.spill_dir, handle.result_id), ignore_errors=True)
+
+    def _expire(self, now: float):
+        expired = []
+        with self._lock:
+            while self._results:
+                oldest = next(iter(self._results.values()))
+                if now - oldest.created < self.ttl_seconds and len(self._results) <= self.max_results:
+                    break
+                expired.append(self._results.popitem(last=False)[1])
+        for handle in expired:
+            self._drop(handle)
+
+    def put(self, tenant_id: str, question: str, plan: Dict[str, Any], results: List[Any]) -> ResultHandle:
+        handle = ResultHandle(secrets.token_urlsafe(18), tenant_id, question, plan, [])
+        handle.results = [
+            self._store_records(handle, index, result, [result.data])
+            if self.spill_dir and result.query_type not in SUMMARY_TYPES and len(result.data) > self.max_memory_records
+            else result
+            for index, result in enumerate(results)
+        ]
+        with self._lock:
+            self._results[handle.result_id] = handle
+        self._expire(time.monotonic())
+        return handle
+
+    def get(self, result_id: Optional[str], tenant_id: str) -> Optional[ResultHandle]:
+        """The stored result, or None when unknown, expired or owned by another tenant"""
+        if not result_id:
+            return None
+        self._expire(time.monotonic())
+        with self._lock:
+            handle = self._results.get(result_id)
+        if handle is None or handle.tenant_id != tenant_id:
+            return None
+        return handle
+
+    def complete(self, handle: ResultHandle, system, max_records: int, needed: Optional[int] = None,
+                 action_type: Optional[str] = None) -> List[Any]:
+        """The handle's results with the records an action needs, paging through HubSpot once if the held page is short
+
+        needed is how many leading records the action reaches (None for all of them). Records are paged in with
+        the plan's sorts and limits, so the first ones are those that were displayed, and with the properties
+        action_type reads when the displayed ones were projected without them.
+        """
+        with handle.lock:
+            endpoints = handle.plan.get('hubspot_endpoints', [])
+            fields = []
+            if action_type and endpoints:
+                object_type = endpoints[0]['endpoint'].split('/')[-1]
+                fields = action_requirements(action_type, set(system.get_database_schema()['hubspot'].get(object_type, [])))
+            if handle.covers(needed, fields):
+                return handle.results
+
+            if fields:
+                endpoints = [self._with_properties(entry, [field for group in fields for field in group]) for entry in endpoints]
+            summaries = [result for result in handle.results if result.query_type in SUMMARY_TYPES]
+            template = next((result for result in handle.results if result.query_type not in SUMMARY_TYPES), handle.results[0])
+            fetch = max_records if needed is None else min(needed, max_records)
+            print(f"📚 Fetching the result for '{handle.question}' (up to {fetch:,} records)")
+
+            full = self._store_records(
+                handle,
+                len(handle.results),
+                dataclasses.replace(template, query_type='search', source='hubspot'),
+                system.iter_plan_records(endpoints, max_records=fetch, ordered=True)
+            )
+            # A fetch cut short for this action keeps the matched total, so a later action needing more pages again
+            if fetch < max_records and len(full.data) >= fetch:
+                full.total_count = max(template.total_count, len(full.data))
+            else:
+                full.total_count = len(full.data)
+            handle.stale = False
+            # Aggregations stay for reports; a bare count is replaced by the records it counted
+            handle.results = [full] + [result for result in summaries if result.query_type == 'aggregation']
+            return handle.results
+
+    @staticmethod
+    def _with_properties(entry: Dict[str, Any], properties: List[str]) -> Dict[str, Any]:
+        """A copy of a plan entry that also requests the given properties"""
+        params = entry.get('params', {})
+        requested = params.get('properties') or []
+        extra = [prop for prop in properties if prop not in requested]
+        return {**entry, 'params': {**params, 'properties': requested + extra}} if extra else entry
+
+    def apply_changes(self, tenant_id: str, changes: Iterable[Any]) -> int:
+        """Bring the tenant's held results up to date with webhook changes; returns how many were touched"""
+
+        by_type: Dict[str, Dict[str, Any]] = {}
+        for change in changes:
+            by_type.setdefault(change.object_type, {})[change.object_id] = change
+        with self._lock:
+            handles = [handle for handle in self._results.values() if handle.tenant_id == tenant_id]
+
+        touched = 0
+        for handle in handles:
+            object_types = {
+                entry.get('endpoint', '').strip('/').split('/')[-1]
+                for entry in handle.plan.get('hubspot_endpoints') or []
+            }
+            relevant = [by_type[object_type] for object_type in object_types if object_type in by_type]
+            if not relevant:
+                continue
+            touched += 1
+            with handle.lock:
+                if len(object_types) > 1:
+                    # Record IDs are only unique per object type
+                    handle.stale = True
+                else:
+                    handle.apply_changes(relevant[0])
+        return touched
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            handles = list(self._results.values())
+        return {
+            'stored_results': len(handles),
+            'stale_results': sum(1 for handle in handles if handle.stale),
+            'spilled_results': sum(
+                1 for handle in handles if any(isinstance(result.data, SpilledRecords) for result in handle.results)
+            ),
+            'ttl_seconds': self.ttl_seconds
+        }
+
+
+def default_spill_dir() -> str:
+    return os.path.join(tempfile.gettempdir(), 'hubspot_results')
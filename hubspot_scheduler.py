@@ -0,0 +1,513 @@
+"""
+Scheduled questions: planned once, re-run on cron schedules in the background, and their
+materialized answers served to matching interactive questions while fresh
+"""
+
+import contextlib
+import copy
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Callable, Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # no file locks (Windows): one process is assumed to serve everything
+    fcntl = None
+
+CRON_ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *'
+}
+# (low, high) for minute, hour, day of month, month, day of week (0 and 7 = Sunday)
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+# How far ahead a schedule's runs are checked against the minimum interval
+INTERVAL_HORIZON = timedelta(days=62)
+INTERVAL_MAX_RUNS = 2000
+
+
+class CronSchedule:
+    """Standard five-field cron expression (*, lists, ranges and steps), evaluated in UTC"""
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        fields = CRON_ALIASES.get(self.expression, self.expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: '{expression}'")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(text, low, high) for text, (low, high) in zip(fields, CRON_FIELDS)
+        )
+        # Cron ORs day-of-month and day-of-week when both are restricted
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _parse(text: str, low: int, high: int) -> frozenset:
+        values = set()
+        for part in text.split(','):
+            spec, _, step = part.partition('/')
+            if spec == '*':
+                start, end = low, high
+            elif '-' in spec:
+                start, end = (int(value) for value in spec.split('-', 1))
+            else:
+                start = end = int(spec)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError(f"Cron field '{text}' is outside {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        if high == 7:
+            values = {value % 7 for value in values}
+        return frozenset(values)
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_month = moment.day in self.days
+        in_week = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after moment"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+    def runs_closer_than(self, seconds: float, start: datetime = None) -> bool:
+        """True when two consecutive runs are less than seconds apart (checked over INTERVAL_HORIZON)"""
+        previous = self.next_after(start or datetime.now(timezone.utc))
+        limit = previous + INTERVAL_HORIZON
+        for _ in range(INTERVAL_MAX_RUNS):
+            moment = self.next_after(previous)
+            if (moment - previous).total_seconds() < seconds:
+                return True
+            if moment > limit:
+                break
+            previous = moment
+        return False
+
+
+def normalize_question(question: str) -> str:
+    """Key for matching an asked question to a scheduled one: case, spacing and end punctuation ignored"""
+    return re.sub(r'\s+', ' ', question.lower()).strip().rstrip('?.! ')
+
+
+@dataclass
+class ScheduledQuestion:
+    schedule_id: str
+    tenant_id: str
+    question: str
+    cron: str
+    max_age_seconds: int
+    # Resolved plan and the portal-day bucket it was resolved in: plans carry literal
+    # dates ("this week"), so they are re-planned when the portal's day changes
+    plan: Optional[Dict[str, Any]] = None
+    plan_bucket: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    last_run_at: Optional[float] = None
+    last_duration: Optional[float] = None
+    last_error: Optional[str] = None
+    next_run_at: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop('plan')
+        data['planned'] = self.plan is not None
+        return data
+
+
+@dataclass
+class Materialized:
+    """The last answer computed for a schedule"""
+    result: Dict[str, Any]
+    computed_at: float
+    # Webhook changes since computed_at: refreshed ahead of schedule
+    dirty: bool = False
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.computed_at
+
+
+class QuestionScheduler:
+    """Scheduled questions per tenant, run by one background thread across all worker processes
+
+    system_for(tenant_id) returns the tenant's system. Schedules are saved to path (plans
+    included) and answers to the directory beside it as JSON (encode_result / decode_result turn
+    an answer into JSON-ready data and back), so every worker sees the same schedules and serves
+    the same answers. Each change re-reads the store under a file lock, and only
+    the process holding the leader lock runs schedules; the others take over if it exits.
+    Without a path everything stays in this process's memory.
+    """
+
+    def __init__(self, system_for: Callable[[str], Any], path: str = None, tick_seconds: float = 30,
+                 default_max_age: int = 3600, min_refresh_seconds: int = 60, min_interval_seconds: int = 900,
+                 encode_result: Callable[[Any], Any] = None, decode_result: Callable[[Any], Any] = None):
+        self.system_for = system_for
+        self.encode_result = encode_result or (lambda result: result)
+        self.decode_result = decode_result or (lambda data: data)
+        self.path = path
+        self.answers_dir = f"{path}.answers" if path else None
+        self.tick_seconds = tick_seconds
+        self.default_max_age = default_max_age
+        self.min_refresh_seconds = min_refresh_seconds
+        self.min_interval_seconds = min_interval_seconds
+        self._schedules: Dict[str, ScheduledQuestion] = {}
+        self._index: Dict[tuple, str] = {}
+        self._crons: Dict[str, CronSchedule] = {}
+        self._materialized: Dict[str, Materialized] = {}
+        # schedule id -> identity of the answer file the materialized copy was read from
+        self._answer_files: Dict[str, tuple] = {}
+        self._store_version: Optional[tuple] = None
+        self._leader_file = None
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self._refresh()
+
+    # --- persistence -------------------------------------------------------
+
+    @staticmethod
+    def _version(path: str) -> Optional[tuple]:
+        """Identity of a file's current contents (replaced files get a new inode)"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self, force: bool = False):
+        """Re-read the schedule store when another process (or this one) has rewritten it"""
+        if not self.path:
+            return
+        version = self._version(self.path)
+        if version == self._store_version and not force:
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            saved = []
+        except json.JSONDecodeError as e:
+            print(f"⚠️  Ignoring unreadable schedule store {self.path}: {e}")
+            return
+        schedules, crons = {}, {}
+        for data in saved:
+            data.pop('plan_date', None)  # saved before plans were keyed by period bucket
+            try:
+                schedule = ScheduledQuestion(**data)
+                crons[schedule.schedule_id] = CronSchedule(schedule.cron)
+            except (TypeError, ValueError) as e:
+                print(f"⚠️  Skipping saved schedule {data.get('schedule_id')}: {e}")
+                continue
+            schedules[schedule.schedule_id] = schedule
+        with self._lock:
+            self._schedules, self._crons = schedules, crons
+            self._index = {
+                (schedule.tenant_id, normalize_question(schedule.question)): schedule.schedule_id
+                for schedule in schedules.values()
+            }
+            for schedule_id in set(self._materialized) - set(schedules):
+                del self._materialized[schedule_id]
+                self._answer_files.pop(schedule_id, None)
+            self._store_version = version
+
+    @contextlib.contextmanager
+    def _store_lock(self):
+        """Exclusive access to the store file across processes"""
+        if not self.path or fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _update(self, change: Callable[[], Any]) -> Any:
+        """Apply change (under self._lock) to the freshly read store and save it, keeping other workers' edits"""
+        with self._store_lock():
+            self._refresh(force=True)
+            with self._lock:
+                outcome = change()
+                saved = [asdict(schedule) for schedule in self._schedules.values()]
+            if self.path:
+                temp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump(saved, f, indent=2)
+                os.replace(temp_path, self.path)
+                self._store_version = self._version(self.path)
+        return outcome
+
+    def _answer_path(self, schedule_id: str, suffix: str = '.json') -> str:
+        return os.path.join(self.answers_dir, schedule_id + suffix)
+
+    def _save_answer(self, schedule_id: str, answer: Materialized):
+        with self._lock:
+            self._materialized[schedule_id] = answer
+        if not self.answers_dir:
+            return
+        os.makedirs(self.answers_dir, exist_ok=True)
+        path = self._answer_path(schedule_id)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'result': self.encode_result(answer.result), 'computed_at': answer.computed_at}, f, default=str)
+        os.replace(temp_path, path)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._answer_path(schedule_id, '.dirty'))
+        self._answer_files[schedule_id] = self._version(path)
+
+    def _answer(self, schedule_id: str) -> Optional[Materialized]:
+        """The latest materialized answer, read from disk when another process computed it"""
+        if not self.answers_dir:
+            return self._materialized.get(schedule_id)
+        version = self._version(self._answer_path(schedule_id))
+        if version is None or version == self._answer_files.get(schedule_id):
+            return self._materialized.get(schedule_id)
+        try:
+            with open(self._answer_path(schedule_id)) as f:
+                saved = json.load(f)
+            answer = Materialized(self.decode_result(saved['result']), saved['computed_at'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️  Could not read the answer of schedule {schedule_id}: {e}")
+            return self._materialized.get(schedule_id)
+        with self._lock:
+            self._materialized[schedule_id] = answer
+            self._answer_files[schedule_id] = version
+        return answer
+
+    def _drop_answer(self, schedule_id: str):
+        self._materialized.pop(schedule_id, None)
+        self._answer_files.pop(schedule_id, None)
+        if self.answers_dir:
+            for suffix in ('.json', '.dirty'):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._answer_path(schedule_id, suffix))
+
+    def _is_dirty(self, schedule_id: str, answer: Materialized) -> bool:
+        return answer.dirty or bool(self.answers_dir) and os.path.exists(self._answer_path(schedule_id, '.dirty'))
+
+    def _lead(self) -> bool:
+        """True in the one process that runs schedules: the holder of the store's leader lock"""
+        if self._leader_file is not None or not self.path or fcntl is None:
+            return True
+        leader_file = open(f"{self.path}.leader", 'a')
+        try:
+            fcntl.flock(leader_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            leader_file.close()
+            return False
+        self._leader_file = leader_file
+        print(f"🗓️  Process {os.getpid()} runs the scheduled questions")
+        return True
+
+    # --- schedules ---------------------------------------------------------
+
+    def add(self, tenant_id: str, question: str, cron: str, max_age_seconds: int = None) -> ScheduledQuestion:
+        """Schedule a question (or reschedule it when already scheduled); first run is immediate"""
+
+        question = question.strip()
+        if not question:
+            raise ValueError('Question is required')
+        schedule_cron = CronSchedule(cron)
+        if self.min_interval_seconds and schedule_cron.runs_closer_than(self.min_interval_seconds):
+            raise ValueError(f"Schedules may run at most every {self.min_interval_seconds // 60} minutes")
+        key = (tenant_id, normalize_question(question))
+
+        def change():
+            existing = self._schedules.get(self._index.get(key))
+            schedule = existing or ScheduledQuestion(
+                schedule_id=secrets.token_urlsafe(9),
+                tenant_id=tenant_id,
+                question=question,
+                cron=schedule_cron.expression,
+                max_age_seconds=max_age_seconds or self.default_max_age
+            )
+            schedule.cron = schedule_cron.expression
+            if max_age_seconds:
+                schedule.max_age_seconds = max_age_seconds
+            schedule.next_run_at = 0.0
+            self._schedules[schedule.schedule_id] = schedule
+            self._crons[schedule.schedule_id] = schedule_cron
+            self._index[key] = schedule.schedule_id
+            return schedule
+
+        schedule = self._update(change)
+        self.start()
+        return schedule
+
+    def remove(self, tenant_id: str, schedule_id: str) -> bool:
+        def change():
+            schedule = self._schedules.get(schedule_id)
+            if schedule is None or schedule.tenant_id != tenant_id:
+                return False
+            del self._schedules[schedule_id]
+            self._crons.pop(schedule_id, None)
+            self._drop_answer(schedule_id)
+            self._index.pop((tenant_id, normalize_question(schedule.question)), None)
+            return True
+
+        return self._update(change)
+
+    def schedules(self, tenant_id: str) -> List[Dict[str, Any]]:
+        self._refresh()
+        with self._lock:
+            owned = [schedule for schedule in self._schedules.values() if schedule.tenant_id == tenant_id]
+        summaries = []
+        for schedule in owned:
+            summary = schedule.summary()
+            answer = self._answer(schedule.schedule_id)
+            summary['materialized_at'] = answer.computed_at if answer else None
+            summaries.append(summary)
+        return summaries
+
+    def lookup(self, tenant_id: str, question: str) -> Optional[tuple]:
+        """(schedule, materialized answer) when the question is scheduled and its answer is fresh enough"""
+        self._refresh()
+        with self._lock:
+            schedule = self._schedules.get(self._index.get((tenant_id, normalize_question(question))))
+        answer = self._answer(schedule.schedule_id) if schedule else None
+        if answer is None or answer.age > schedule.max_age_seconds:
+            if schedule is not None:
+                self.misses += 1
+            return None
+        self.hits += 1
+        return schedule, answer
+
+    def mark_dirty(self, tenant_id: str, object_types: Iterable[str]):
+        """Webhook changes to these objects: refresh the tenant's answers over them early"""
+        object_types = set(object_types)
+        self._refresh()
+        with self._lock:
+            for schedule in self._schedules.values():
+                if schedule.tenant_id != tenant_id or not schedule.plan:
+                    continue
+                planned = {
+                    entry.get('endpoint', '').strip('/').split('/')[-1]
+                    for entry in schedule.plan.get('hubspot_endpoints') or []
+                }
+                if not planned & object_types:
+                    continue
+                answer = self._materialized.get(schedule.schedule_id)
+                if answer is not None:
+                    answer.dirty = True
+                if self.answers_dir and os.path.isdir(self.answers_dir):
+                    # Webhooks reach any worker; the flag file tells the one running schedules
+                    open(self._answer_path(schedule.schedule_id, '.dirty'), 'a').close()
+
+    # --- running -----------------------------------------------------------
+
+    def run(self, schedule: ScheduledQuestion):
+        """Compute and materialize one schedule's answer (re-planning with Claude once per portal day)"""
+
+        started = time.time()
+        try:
+            system = self.system_for(schedule.tenant_id)
+            bucket = system.dates.periods().bucket('day')
+            if schedule.plan is None or schedule.plan_bucket != bucket:
+                result = system.process_business_question(schedule.question)
+                if result:
+                    schedule.plan = copy.deepcopy(result['analysis'])
+                    schedule.plan_bucket = bucket
+            else:
+                # execute_plan trims the plan in place; the stored copy stays as resolved
+                result = system.execute_plan(schedule.question, copy.deepcopy(schedule.plan))
+            if not result:
+                raise RuntimeError('no plan for the question')
+        except Exception as e:
+            schedule.last_error = str(e)
+            print(f"❌ Scheduled question '{schedule.question}' failed: {e}")
+        else:
+            schedule.last_error = None
+            self._save_answer(schedule.schedule_id, Materialized(result, time.time()))
+            print(f"🗓️  Materialized '{schedule.question}' in {time.time() - started:.1f}s")
+        schedule.last_run_at = started
+        schedule.last_duration = time.time() - started
+
+    def run_due(self, now: float = None) -> int:
+        """Run every schedule that is due (or dirty and past the refresh debounce); only in the leader process"""
+
+        with self._run_lock:
+            if not self._lead():
+                return 0
+            now = time.time() if now is None else now
+            self._refresh()
+            with self._lock:
+                schedules = list(self._schedules.values())
+            due = []
+            for schedule in schedules:
+                answer = self._answer(schedule.schedule_id)
+                # A schedule whose answer was never stored (e.g. a new disk) runs now unless it just failed
+                missing = answer is None and schedule.last_error is None
+                early = answer is not None and answer.age >= self.min_refresh_seconds and self._is_dirty(schedule.schedule_id, answer)
+                if schedule.next_run_at <= now or missing or early:
+                    due.append(schedule)
+            for schedule in due:
+                self.run(schedule)
+                moment = datetime.fromtimestamp(max(now, time.time()), tz=timezone.utc)
+                schedule.next_run_at = self._crons[schedule.schedule_id].next_after(moment).timestamp()
+            if due:
+                self._update(lambda: self._merge_runs(due))
+            return len(due)
+
+    def _merge_runs(self, ran: List[ScheduledQuestion]):
+        """Carry run results into the re-read store; schedules removed meanwhile stay removed"""
+        for schedule in ran:
+            stored = self._schedules.get(schedule.schedule_id)
+            if stored is None or stored.cron != schedule.cron:
+                # Removed, or rescheduled while it ran (a new cron runs at once)
+                continue
+            for name in ('plan', 'plan_bucket', 'last_run_at', 'last_duration', 'last_error', 'next_run_at'):
+                setattr(stored, name, getattr(schedule, name))
+
+    def start(self):
+        """Start the background thread (per process: threads don't survive a worker fork)"""
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._loop, name='question-scheduler', daemon=True)
+                    self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_due()
+            except Exception as e:
+                print(f"❌ Scheduler error: {e}")
+            time.sleep(self.tick_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'schedules': len(self._schedules),
+                'materialized': len(self._materialized),
+                'dirty': sum(1 for answer in self._materialized.values() if answer.dirty),
+                'hits': self.hits,
+                'misses': self.misses,
+                'running': self._thread is not None and self._thread.is_alive(),
+                'leader': self._leader_file is not None or not self.path or fcntl is None,
+                'min_interval_seconds': self.min_interval_seconds
+            }
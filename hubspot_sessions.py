@@ -0,0 +1,254 @@
+"""
+Conversation sessions: keep the last plan and result so follow-up questions refine them
+instead of re-planning from scratch
+"""
+
+import copy
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+from hubspot_dates import DateContext, DatePeriods
+from hubspot_plan_schema import parse_plan_json
+
+# What a follow-up calls the previous result; generic words ("that", "it") are left out
+# because they open ordinary clauses ("contacts that were created today")
+REFERENT = (
+    r'(all of (them|these|those)|them|these|those|everyone|the ones|'
+    r'(these|those|the) (contacts|deals|companies|people|results|records))'
+)
+
+# Follow-ups that act on the previous result, with the result as the object of the action:
+# "text them", "send those a message", "create tasks for these", "report on them"
+ACTION_PATTERNS = [
+    ('send_sms', re.compile(
+        rf'\b(text|sms|message)\s+{REFERENT}\b|\bsend\s+{REFERENT}\s+(an? )?(text|sms|message)\b|'
+        rf'\b(texts?|sms|messages?)\s+to\s+{REFERENT}\b'
+    )),
+    ('create_task', re.compile(rf'\btasks?\s+(for|about)\s+(each of )?{REFERENT}\b')),
+    ('send_notification', re.compile(
+        rf'\b(notify|alert)\s+(me\s+)?(about\s+)?{REFERENT}\b|\bnotifications?\s+(for|about)\s+{REFERENT}\b'
+    )),
+    ('generate_report', re.compile(rf'\breport\s+(on|of|for|about)\s+{REFERENT}\b'))
+]
+
+# A question with its own filter clause describes a new set of records, not the previous one
+OWN_FILTER = re.compile(
+    r'\b(that|who|which|where|whose|with|without|created|closed|modified|since|before|after)\b|'
+    r'\b(today|yesterday|(this|last|next) (week|month|quarter|year))\b'
+)
+
+# Follow-ups that narrow the previous result: "now only the ones in California"
+REFINE_CUES = re.compile(
+    r'^(and |but |ok |okay |now |then )*(only|just|filter|narrow|limit|restrict|exclude|'
+    r'of (those|these|them)|which of (those|these|them)|among (those|these|them)|same but|what about)\b'
+)
+MAX_REFINE_WORDS = 15
+
+US_STATES = {
+    'alabama': 'AL', 'alaska': 'AK', 'arizona': 'AZ', 'arkansas': 'AR', 'california': 'CA',
+    'colorado': 'CO', 'connecticut': 'CT', 'delaware': 'DE', 'florida': 'FL', 'georgia': 'GA',
+    'hawaii': 'HI', 'idaho': 'ID', 'illinois': 'IL', 'indiana': 'IN', 'iowa': 'IA', 'kansas': 'KS',
+    'kentucky': 'KY', 'louisiana': 'LA', 'maine': 'ME', 'maryland': 'MD', 'massachusetts': 'MA',
+    'michigan': 'MI', 'minnesota': 'MN', 'mississippi': 'MS', 'missouri': 'MO', 'montana': 'MT',
+    'nebraska': 'NE', 'nevada': 'NV', 'new hampshire': 'NH', 'new jersey': 'NJ', 'new mexico': 'NM',
+    'new york': 'NY', 'north carolina': 'NC', 'north dakota': 'ND', 'ohio': 'OH', 'oklahoma': 'OK',
+    'oregon': 'OR', 'pennsylvania': 'PA', 'rhode island': 'RI', 'south carolina': 'SC',
+    'south dakota': 'SD', 'tennessee': 'TN', 'texas': 'TX', 'utah': 'UT', 'vermont': 'VT',
+    'virginia': 'VA', 'washington': 'WA', 'west virginia': 'WV', 'wisconsin': 'WI', 'wyoming': 'WY'
+}
+
+LIFECYCLE_STAGES = {
+    'subscriber': 'subscriber', 'lead': 'lead', 'mql': 'marketingqualifiedlead',
+    'marketing qualified': 'marketingqualifiedlead', 'sql': 'salesqualifiedlead',
+    'sales qualified': 'salesqualifiedlead', 'opportunit': 'opportunity', 'customer': 'customer',
+    'evangelist': 'evangelist'
+}
+
+AMOUNT_PATTERN = re.compile(
+    r'\b(over|above|more than|greater than|at least|under|below|less than|at most)\s+\$?(\d[\d,]*(?:\.\d+)?)\s*(k|m)?\b'
+)
+
+
+def rule_refinement(question: str, object_type: str, periods: DatePeriods = None) -> Optional[Dict[str, Any]]:
+    """One extra filter for the common follow-ups, without asking Claude (dates from periods, else UTC)"""
+
+    text = question.lower()
+
+    if object_type in ('contacts', 'companies'):
+        # Longest names first, so "west virginia" is not read as "virginia"
+        for name, code in sorted(US_STATES.items(), key=lambda item: -len(item[0])):
+            # Two-letter codes only count when written as codes ("in CA"), not as words ("in" / "or")
+            if re.search(rf'\b{name}\b', text) or re.search(rf'\bin {code}\b', question):
+                return {'propertyName': 'state', 'operator': 'IN', 'values': [name.title(), code]}
+
+    if object_type == 'contacts':
+        for word, stage in LIFECYCLE_STAGES.items():
+            if re.search(rf'\b{word}', text):
+                return {'propertyName': 'lifecyclestage', 'operator': 'EQ', 'value': stage}
+        if re.search(r'\b(with|have|has) (a |an )?(phone|number|mobile)', text):
+            return {'propertyName': 'phone', 'operator': 'HAS_PROPERTY'}
+
+    if object_type == 'deals':
+        match = AMOUNT_PATTERN.search(text)
+        if match:
+            word, number, suffix = match.groups()
+            amount = float(number.replace(',', '')) * {'k': 1e3, 'm': 1e6}.get(suffix or '', 1)
+            operator = {
+                'over': 'GT', 'above': 'GT', 'more than': 'GT', 'greater than': 'GT', 'at least': 'GTE',
+                'under': 'LT', 'below': 'LT', 'less than': 'LT', 'at most': 'LTE'
+            }[word]
+            return {'propertyName': 'amount', 'operator': operator, 'value': str(int(amount) if amount.is_integer() else amount)}
+
+    date_property = 'closedate' if object_type == 'deals' and 'clos' in text else 'createdate'
+    for phrase, boundary in (('today', 'day_start'), ('this week', 'week_start'), ('this month', 'month_start'),
+                             ('this quarter', 'quarter_start'), ('this year', 'year_start')):
+        if phrase in text:
+            periods = periods or DateContext().periods()
+            return {'propertyName': date_property, 'operator': 'GTE', 'value': periods.iso(boundary)}
+
+    return None
+
+
+REFINE_PROMPT = """A user is narrowing the result of an earlier HubSpot CRM search.
+Earlier question: {base_question}
+Object type searched: {object_type}
+Searchable properties: {properties}
+
+Reply with ONLY one JSON search filter that applies the follow-up, e.g.
+{{"propertyName": "industry", "operator": "EQ", "value": "Technology"}}
+Operators: EQ, NEQ, LT, LTE, GT, GTE, BETWEEN, IN, NOT_IN, HAS_PROPERTY, NOT_HAS_PROPERTY, CONTAINS_TOKEN.
+Dates are ISO 8601 (today is {today}). If the follow-up is really a new question, reply {{"new_question": true}}."""
+
+
+def claude_refinement(client, model: str, question: str, base_question: str,
+                      object_type: str, properties: List[str], today: str = None) -> Optional[Dict[str, Any]]:
+    """Ask a cheap model for the single filter a follow-up adds; None when it is not a refinement"""
+
+    response = client.messages.create(
+        model=model,
+        max_tokens=200,
+        system=REFINE_PROMPT.format(
+            base_question=base_question,
+            object_type=object_type,
+            properties=', '.join(properties),
+            today=today or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        ),
+        messages=[{"role": "user", "content": f"Follow-up: {question}"}]
+    )
+    text = ''.join(getattr(block, 'text', '') for block in response.content)
+    filter_item = parse_plan_json(text)
+    if not isinstance(filter_item, dict) or not filter_item.get('propertyName') or not filter_item.get('operator'):
+        return None
+    return {key: filter_item[key] for key in ('propertyName', 'operator', 'value', 'values', 'highValue') if key in filter_item}
+
+
+def classify_follow_up(question: str, has_context: bool) -> Optional[Dict[str, Any]]:
+    """{'type': 'action', 'action': ...} or {'type': 'refine'} for follow-ups; None for a new question"""
+
+    if not has_context:
+        return None
+    text = question.lower().strip()
+
+    if not OWN_FILTER.search(text):
+        for action, pattern in ACTION_PATTERNS:
+            if pattern.search(text):
+                return {'type': 'action', 'action': action}
+
+    if REFINE_CUES.search(text) and len(text.split()) <= MAX_REFINE_WORDS:
+        return {'type': 'refine'}
+    return None
+
+
+def plan_object_type(plan: Dict[str, Any]) -> Optional[str]:
+    for endpoint_config in plan.get('hubspot_endpoints') or []:
+        return endpoint_config.get('endpoint', '').strip('/').split('/')[-1]
+    return None
+
+
+def add_filter(plan: Dict[str, Any], filter_item: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of the plan with the filter ANDed into every record search (each OR group gets it)"""
+
+    refined = copy.deepcopy(plan)
+    for endpoint_config in refined.get('hubspot_endpoints') or []:
+        params = endpoint_config.setdefault('params', {})
+        groups = params.get('filterGroups') or [{'filters': []}]
+        for group in groups:
+            group.setdefault('filters', []).append(dict(filter_item))
+        params['filterGroups'] = groups
+        endpoint_config['purpose'] = f"{endpoint_config.get('purpose', 'Search')} (refined)"
+    return refined
+
+
+class ConversationSession:
+    """One browser conversation: what was asked, the plan that answered it and its stored result"""
+
+    def __init__(self, session_id: str, tenant_id: str):
+        self.session_id = session_id
+        self.tenant_id = tenant_id
+        self.updated = time.monotonic()
+        self.history: List[Dict[str, Any]] = []
+        self.last_question: Optional[str] = None
+        self.last_plan: Optional[Dict[str, Any]] = None
+        self.last_result_id: Optional[str] = None
+        self.lock = threading.Lock()
+
+    @property
+    def has_context(self) -> bool:
+        return self.last_plan is not None
+
+    def remember(self, question: str, plan: Dict[str, Any], result_id: str, follow_up: str = None):
+        self.last_question = question
+        self.last_plan = plan
+        self.last_result_id = result_id
+        self.history.append({'question': question, 'follow_up': follow_up, 'at': datetime.now().isoformat()})
+        del self.history[:-20]
+
+
+class SessionStore:
+    """In-memory sessions with an idle TTL and a size cap (least recently used go first)"""
+
+    def __init__(self, ttl_seconds: int = 1800, max_sessions: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: 'OrderedDict[str, ConversationSession]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.updated < self.ttl_seconds and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    def get(self, session_id: Optional[str], tenant_id: str) -> Optional[ConversationSession]:
+        """The live session, or None; a session never crosses tenants"""
+        if not session_id:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None or session.tenant_id != tenant_id:
+                return None
+            session.updated = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def get_or_create(self, session_id: Optional[str], tenant_id: str) -> ConversationSession:
+        session = self.get(session_id, tenant_id)
+        if session is not None:
+            return session
+        session = ConversationSession(secrets.token_urlsafe(16), tenant_id)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._expire(time.monotonic())
+        return session
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'active_sessions': len(self._sessions), 'ttl_seconds': self.ttl_seconds}
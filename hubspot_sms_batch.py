@@ -0,0 +1,303 @@
+"""
+Bulk SMS composition: the deal-aware per-contact messages rendered for a whole campaign at once
+"""
+
+from typing import Dict, List, Any, Mapping, Optional, Sequence, Tuple
+
+from hubspot_pipelines import DealStage, PipelineCache
+from hubspot_records import HubSpotRecord, display_name
+from hubspot_sms_templates import SmsTemplate
+
+# Deal stage classes, in the order they are tested
+WON, LOST, PROPOSAL, NEGOTIATION, EARLY = range(5)
+
+SMS_LIMIT = 160
+
+
+def classify_stage(stage: Optional[str], info: DealStage = None) -> int:
+    """Stage class from the stage's pipeline metadata when known, else from words in its name
+
+    Portals with custom pipelines have numeric stage IDs, so with info the closed/won flags
+    decide WON and LOST and the stage label, not its ID, is matched.
+    """
+    if info is not None:
+        if info.is_won:
+            return WON
+        if info.is_lost:
+            return LOST
+        stage = info.label
+    if stage is None:
+        # A null stage is treated as unknown
+        return EARLY
+    stage = stage.lower()
+    if 'closed' in stage and 'won' in stage:
+        return WON
+    if 'closed' in stage and 'lost' in stage:
+        return LOST
+    if any(word in stage for word in ('proposal', 'quote', 'contract')):
+        return PROPOSAL
+    if any(word in stage for word in ('negotiation', 'decision')):
+        return NEGOTIATION
+    return EARLY
+
+
+def parse_deal_amount(amount_str: Any) -> float:
+    """Deal amount as a number for ranking: keep digits and dots, else 0"""
+    if not amount_str:
+        return 0.0
+    clean_amount = ''.join(c for c in str(amount_str) if c.isdigit() or c == '.')
+    try:
+        return float(clean_amount) if clean_amount else 0.0
+    except ValueError:
+        return 0.0
+
+
+def amount_label(amount: float) -> str:
+    """The SMS rendering of a parsed amount ('$1.2M', '$15K', '$900'; '' when not positive)"""
+    if amount <= 0:
+        return ""
+    if amount >= 1000000:
+        return f"${amount/1000000:.1f}M"
+    elif amount >= 1000:
+        return f"${amount/1000:.0f}K"
+    return f"${amount:.0f}"
+
+
+def extract_name(record: Mapping) -> str:
+    """HubSpotClaudeSystem.extract_name: already derived on search records"""
+    if isinstance(record, HubSpotRecord):
+        return record.display_name
+    return display_name(record)
+
+
+def render_deal_message(name: str, deal_name: Any, amount: str, stage: int, deal_count: int) -> str:
+    if stage == WON:
+        message = f"Hi {name}! Congratulations on closing {deal_name}"
+        if amount:
+            message += f" for {amount}"
+        message += "! How are things going? Let's discuss next steps."
+    elif stage == LOST:
+        message = f"Hi {name}, I wanted to follow up on {deal_name}. I'd love to understand what we could improve for future opportunities. Are you available for a quick chat?"
+    elif stage == PROPOSAL:
+        message = f"Hi {name}! Checking in on {deal_name}"
+        if amount:
+            message += f" ({amount})"
+        message += ". Do you have any questions about the proposal? Happy to discuss!"
+    elif stage == NEGOTIATION:
+        message = f"Hi {name}, following up on {deal_name}"
+        if amount:
+            message += f" ({amount})"
+        message += ". I'm here to help with any final questions or concerns you might have."
+    else:
+        message = f"Hi {name}! Wanted to touch base about {deal_name}"
+        if amount:
+            message += f" ({amount})"
+        message += ". How can I best support you moving forward?"
+
+    if deal_count > 1:
+        message += f" (+ {deal_count - 1} other opportunities)"
+
+    if len(message) > SMS_LIMIT:
+        message = f"Hi {name}! Following up on {deal_name}"
+        if amount:
+            message += f" ({amount})"
+        message += ". Let's connect soon!"
+    return message
+
+
+def render_no_deal_message(name: str, company: Any) -> str:
+    if company:
+        message = f"Hi {name}! Hope things are going well at {company}. I'd love to explore how we can help support your goals. Are you available for a brief call?"
+        if len(message) > SMS_LIMIT:
+            message = f"Hi {name}! Hope all is well at {company}. Would love to connect about how we can help. Available for a quick call?"
+    else:
+        message = f"Hi {name}! I wanted to reach out and see how we might be able to help with your current projects. Would you be interested in a quick conversation?"
+        if len(message) > SMS_LIMIT:
+            message = f"Hi {name}! Would love to connect about your current projects and how we might help. Available for a quick call?"
+    return message
+
+
+# The same messages as compiled templates, for segment-aware composition
+DEAL_TEMPLATES = {
+    WON: SmsTemplate("Hi {name}! Congratulations on closing {deal_name}{amount}! How are things going? Let's discuss next steps.{others}"),
+    LOST: SmsTemplate("Hi {name}, I wanted to follow up on {deal_name}. I'd love to understand what we could improve for future opportunities. Are you available for a quick chat?{others}"),
+    PROPOSAL: SmsTemplate("Hi {name}! Checking in on {deal_name}{amount}. Do you have any questions about the proposal? Happy to discuss!{others}"),
+    NEGOTIATION: SmsTemplate("Hi {name}, following up on {deal_name}{amount}. I'm here to help with any final questions or concerns you might have.{others}"),
+    EARLY: SmsTemplate("Hi {name}! Wanted to touch base about {deal_name}{amount}. How can I best support you moving forward?{others}")
+}
+SHORT_DEAL_TEMPLATE = SmsTemplate("Hi {name}! Following up on {deal_name}{amount}. Let's connect soon!", shrinkable=('deal_name', 'name'))
+COMPANY_TEMPLATES = (
+    SmsTemplate("Hi {name}! Hope things are going well at {company}. I'd love to explore how we can help support your goals. Are you available for a brief call?"),
+    SmsTemplate("Hi {name}! Hope all is well at {company}. Would love to connect about how we can help. Available for a quick call?", shrinkable=('company', 'name'))
+)
+NO_COMPANY_TEMPLATES = (
+    SmsTemplate("Hi {name}! I wanted to reach out and see how we might be able to help with your current projects. Would you be interested in a quick conversation?"),
+    SmsTemplate("Hi {name}! Would love to connect about your current projects and how we might help. Available for a quick call?", shrinkable=('name',))
+)
+
+
+def fit_message(templates, values: Dict[str, Any], max_segments: int) -> Tuple[str, bool]:
+    """The full template when it fits the segment budget, otherwise the short one shortened to fit"""
+    full, short = templates
+    message, fits = full.fit(values, max_segments)
+    if fits:
+        return message, True
+    return short.fit(values, max_segments)
+
+
+def fit_deal_message(name: str, deal_name: Any, amount: str, stage: int, deal_count: int, max_segments: int) -> str:
+    values = {
+        'name': name,
+        'deal_name': deal_name,
+        'amount': (f" for {amount}" if stage == WON else f" ({amount})") if amount else '',
+        'others': f" (+ {deal_count - 1} other opportunities)" if deal_count > 1 else ''
+    }
+    message, fits = DEAL_TEMPLATES[stage].fit(values, max_segments)
+    if fits:
+        return message
+    values['amount'] = f" ({amount})" if amount else ''
+    return SHORT_DEAL_TEMPLATE.fit(values, max_segments)[0]
+
+
+def fit_no_deal_message(name: str, company: Any, max_segments: int) -> str:
+    if company:
+        message, fits = fit_message(COMPANY_TEMPLATES, {'name': name, 'company': company}, max_segments)
+        if fits:
+            return message
+        # A company too long to keep readable is left out rather than cut to a stub
+    return fit_message(NO_COMPANY_TEMPLATES, {'name': name}, max_segments)[0]
+
+
+class SmsBatchComposer:
+    """Deal-aware SMS messages for many contacts at once
+
+    Each contact's message is built around its primary deal (highest amount, then latest
+    createdate), or its company when it has no deals. Stage classes, parsed amounts and
+    amount labels are computed once per distinct value, and the primary deal is looked
+    for instead of sorting each contact's deals. Deals come either as a mapping of
+    contact id to deal records, or as one list of deal records whose contact_key
+    property names the contact.
+
+    With max_segments, the long/short choice is made on SMS segments rather than
+    len() > 160, and names, deal names and companies are shortened to fit the budget.
+    With stages (a PipelineCache), deal stage IDs are classified by their pipeline
+    metadata; without it, by the words in the stage ID.
+    """
+
+    def __init__(self, max_segments: int = None, stages: PipelineCache = None):
+        self.max_segments = max_segments
+        self.stages = stages
+        self._stage_classes: Dict[Any, int] = {}
+        self._amounts: Dict[str, float] = {}
+        self._labels: Dict[float, str] = {}
+
+    def _stage(self, stage: Any) -> int:
+        cls = self._stage_classes.get(stage)
+        if cls is None:
+            info = self.stages.stage(stage) if self.stages is not None else None
+            cls = self._stage_classes[stage] = classify_stage(stage, info)
+        return cls
+
+    def _amount(self, raw: Any) -> float:
+        if type(raw) is not str:
+            # Only strings are cached: 1 and 1.0 are equal keys but not equal strings
+            return parse_deal_amount(raw)
+        amount = self._amounts.get(raw)
+        if amount is None:
+            amount = self._amounts[raw] = parse_deal_amount(raw)
+        return amount
+
+    def _label(self, amount: float) -> str:
+        label = self._labels.get(amount)
+        if label is None:
+            label = self._labels[amount] = amount_label(amount)
+        return label
+
+    def primary_deals(self, deals, contact_key: str = 'contact_id') -> Dict[Any, tuple]:
+        """contact id -> (primary deal name, amount label, stage class, deal count), or None for an empty deal"""
+
+        if deals is None:
+            return {}
+        if isinstance(deals, Mapping):
+            grouped = [(contact_id, records) for contact_id, records in deals.items() if records]
+            owners = [contact_id for contact_id, records in grouped for _ in records]
+            records = [record for _, records in grouped for record in records]
+        else:
+            owners = [record.get(contact_key) for record in deals]
+            records = deals
+
+        amounts = [record.get('amount', '0') for record in records]
+
+        def createdate(index):
+            # A null createdate sorts with the empty ones instead of failing the comparison
+            return records[index].get('createdate', '') or ''
+
+        # owner -> [primary index, its amount, its createdate (read only on a tie), deal count]
+        best: Dict[Any, list] = {}
+        cached_amounts = self._amounts
+        for index, owner in enumerate(owners):
+            raw = amounts[index]
+            amount = cached_amounts.get(raw) if type(raw) is str else None
+            if amount is None:
+                amount = self._amount(raw)
+            current = best.get(owner)
+            if current is None:
+                best[owner] = [index, amount, None, 1]
+                continue
+            current[3] += 1
+            # Strictly greater (amount, createdate): on ties the earlier deal stays primary, as in a stable sort
+            if amount < current[1]:
+                continue
+            if amount == current[1]:
+                if current[2] is None:
+                    current[2] = createdate(current[0])
+                created = createdate(index)
+                if created <= current[2]:
+                    continue
+                current[2] = created
+            else:
+                current[2] = None
+            current[0], current[1] = index, amount
+
+        primary = {}
+        for owner, (index, amount, _, count) in best.items():
+            deal = records[index]
+            if not deal:
+                # An empty deal record carries nothing to write about
+                primary[owner] = None
+                continue
+            primary[owner] = (
+                deal.get('dealname', 'your opportunity'),
+                self._label(amount),
+                self._stage(deal.get('dealstage', 'in progress')),
+                count
+            )
+        return primary
+
+    def compose(self, contacts: Sequence, deals=None, contact_key: str = 'contact_id') -> List[str]:
+        """One message per contact, in order"""
+
+        primary = self.primary_deals(deals, contact_key)
+
+        messages = []
+        max_segments = self.max_segments
+        for contact in contacts:
+            contact_id = contact.get('id')
+            name = extract_name(contact)
+            company = contact.get('company', '')
+            deal = primary.get(contact_id) if contact_id is not None else None
+            if max_segments:
+                if deal is None:
+                    messages.append(fit_no_deal_message(name, company, max_segments))
+                else:
+                    messages.append(fit_deal_message(name, *deal, max_segments))
+            elif deal is None:
+                messages.append(render_no_deal_message(name, company))
+            else:
+                messages.append(render_deal_message(name, *deal))
+        return messages
+
+
+def compose_sms_batch(contacts: Sequence, deals=None, contact_key: str = 'contact_id',
+                      max_segments: int = None, stages: PipelineCache = None) -> List[str]:
+    return SmsBatchComposer(max_segments, stages).compose(contacts, deals, contact_key)
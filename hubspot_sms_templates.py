@@ -0,0 +1,206 @@
+"""
+SMS templates compiled once, with GSM-7 / UCS-2 segment budgeting
+
+A message is billed per segment: 160 GSM-7 characters (153 each when split), but a single
+character outside GSM-7 - an emoji, a curly quote - turns the whole message into UCS-2 with
+70 (67) characters per segment.
+"""
+
+import string
+from typing import Dict, List, Any, Iterable, Optional, Sequence, Tuple
+
+GSM7 = 'GSM-7'
+UCS2 = 'UCS-2'
+
+GSM7_BASIC = frozenset(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+# Extension table characters take an escape plus the character (two septets)
+GSM7_EXTENSION = frozenset("^{}\\[]~|€\f")
+GSM7_CHARS = GSM7_BASIC | GSM7_EXTENSION
+
+# (single-segment limit, per-segment limit once split) in characters of that encoding
+SEGMENT_LIMITS = {GSM7: (160, 153), UCS2: (70, 67)}
+
+# Punctuation that word processors and CRMs substitute in, mapped back to GSM-7
+GSM7_REPLACEMENTS = str.maketrans({
+    '‘': "'", '’': "'", '‚': "'", '‛': "'", '´': "'", '′': "'",
+    '“': '"', '”': '"', '„': '"', '«': '"', '»': '"', '″': '"',
+    '–': '-', '—': '-', '−': '-', '…': '...',
+    '\u00a0': ' ', '\u2009': ' ', '\u200b': ''
+})
+
+# Fields keep at least this many characters when shortened; a template that would need them
+# shorter does not fit (callers fall back to a template without the field)
+MIN_FIELD_CHARS = 10
+
+# Quote marks and brackets a shortened field must not leave open
+PAIRED_MARKS = (('"', '"'), ('(', ')'), ('[', ']'))
+
+
+def is_gsm7(text: str) -> bool:
+    return GSM7_CHARS.issuperset(text)
+
+
+def to_gsm7(text: str) -> str:
+    """Replace typographic punctuation with its GSM-7 equivalent (emoji etc. are left alone)"""
+    if text.isascii():
+        return text
+    return text.translate(GSM7_REPLACEMENTS)
+
+
+def units(text: str, encoding: str) -> int:
+    """Length in the encoding's characters: septets for GSM-7, UTF-16 code units for UCS-2"""
+    if encoding == GSM7:
+        if GSM7_EXTENSION.isdisjoint(text):
+            return len(text)
+        return len(text) + sum(1 for char in text if char in GSM7_EXTENSION)
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le')) // 2
+
+
+def segments_for(length: int, encoding: str) -> int:
+    single, multi = SEGMENT_LIMITS[encoding]
+    if length <= single:
+        return 1
+    return -(-length // multi)
+
+
+def capacity(encoding: str, max_segments: int) -> int:
+    """Characters that fit in max_segments segments"""
+    single, multi = SEGMENT_LIMITS[encoding]
+    return single if max_segments <= 1 else multi * max_segments
+
+
+def measure(text: str) -> Tuple[str, int, int]:
+    """(encoding, length in that encoding, segments)"""
+    encoding = GSM7 if is_gsm7(text) else UCS2
+    length = units(text, encoding)
+    return encoding, length, segments_for(length, encoding)
+
+
+def close_marks(text: str) -> str:
+    """Drop the quote marks and opening brackets a cut left without their partner"""
+    for opener, closer in PAIRED_MARKS:
+        unmatched = text.count(opener) % 2 if opener == closer else text.count(opener) - text.count(closer)
+        for _ in range(max(unmatched, 0)):
+            index = text.rfind(opener)
+            text = text[:index] + text[index + 1:]
+    return ' '.join(text.split())
+
+
+def truncate_units(text: str, max_units: int, encoding: str) -> str:
+    """Prefix of text within max_units, cut at a word boundary unless the first word alone is too long
+
+    Quotes and brackets opened before the cut are dropped rather than left unbalanced.
+    """
+    if units(text, encoding) <= max_units:
+        return text
+    used = 0
+    for index, char in enumerate(text):
+        if encoding == GSM7:
+            size = 2 if char in GSM7_EXTENSION else 1
+        else:
+            size = 2 if ord(char) > 0xFFFF else 1
+        if used + size > max_units:
+            cut = text[:index]
+            space = cut.rfind(' ')
+            if text[index] != ' ' and space > 0:
+                cut = cut[:space]
+            return close_marks(cut).rstrip(' ,-')
+        used += size
+    return text
+
+
+class SmsTemplate:
+    """A str.format-style template ('Hi {name}! ...') parsed and measured once
+
+    render() fills it in; fit() also keeps the result within a segment budget by shortening
+    the shrinkable fields, each in proportion to how far it can shrink.
+    """
+
+    def __init__(self, template: str, shrinkable: Sequence[str] = ()):
+        self.template = template
+        self.shrinkable = tuple(shrinkable)
+        self.parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(template):
+            if format_spec or conversion:
+                raise ValueError(f"SMS template fields take no format spec or conversion: {template!r}")
+            self.parts.append((literal, field))
+        self.fields = [field for _, field in self.parts if field is not None]
+        literal = ''.join(literal for literal, _ in self.parts)
+        self.literal_gsm7 = is_gsm7(literal)
+        self.literal_units = {GSM7: units(literal, GSM7), UCS2: units(literal, UCS2)}
+
+    def render(self, values: Dict[str, Any]) -> str:
+        return self.template.format_map(values)
+
+    def fit(self, values: Dict[str, Any], max_segments: int = 1) -> Tuple[str, bool]:
+        """(message, fits): shortened to max_segments where the shrinkable fields allow"""
+
+        texts = {field: to_gsm7(str(values[field])) for field in self.fields}
+        filled = ''.join(texts.values())
+        encoding = GSM7 if self.literal_gsm7 and is_gsm7(filled) else UCS2
+
+        budget = capacity(encoding, max_segments) - self.literal_units[encoding]
+        overflow = units(filled, encoding) - budget
+        if overflow <= 0:
+            return self.render(texts), True
+
+        # Each field gives up the same share of the characters it can spare above MIN_FIELD_CHARS,
+        # so one long field isn't cut to the bone while the next stays whole
+        lengths = {field: units(texts[field], encoding) for field in self.shrinkable if field in texts}
+        spare = {field: length - MIN_FIELD_CHARS for field, length in lengths.items() if length > MIN_FIELD_CHARS}
+        total = sum(spare.values())
+        for field, available in spare.items():
+            cut = min(available, -(-overflow * available // total))
+            texts[field] = truncate_units(texts[field], lengths[field] - cut, encoding)
+
+        return self.render(texts), units(''.join(texts.values()), encoding) <= budget
+
+
+class SegmentReport:
+    """Segment totals for a campaign, computed before anything is sent"""
+
+    def __init__(self, max_segments: int = 1):
+        self.max_segments = max_segments
+        self.messages = 0
+        self.segments = 0
+        self.by_encoding = {GSM7: 0, UCS2: 0}
+        self.over_budget = 0
+        self.non_gsm7_chars = set()
+
+    def add(self, message: str):
+        encoding, _, segments = measure(message)
+        self.messages += 1
+        self.segments += segments
+        self.by_encoding[encoding] += 1
+        if segments > self.max_segments:
+            self.over_budget += 1
+        if encoding == UCS2:
+            self.non_gsm7_chars.update(char for char in message if char not in GSM7_CHARS)
+
+    @classmethod
+    def of(cls, messages: Iterable[str], max_segments: int = 1) -> 'SegmentReport':
+        report = cls(max_segments)
+        for message in messages:
+            report.add(message)
+        return report
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'messages': self.messages,
+            'segments': self.segments,
+            'gsm7_messages': self.by_encoding[GSM7],
+            'ucs2_messages': self.by_encoding[UCS2],
+            'over_budget': self.over_budget,
+            'non_gsm7_chars': ''.join(sorted(self.non_gsm7_chars))
+        }
+
+    def log(self):
+        print(f"📊 SMS campaign: {self.messages} messages, {self.segments} segments "
+              f"({self.by_encoding[UCS2]} UCS-2, {self.over_budget} over {self.max_segments} segment(s))")
+        if self.non_gsm7_chars:
+            print(f"   ⚠️  Characters forcing UCS-2: {''.join(sorted(self.non_gsm7_chars))}")
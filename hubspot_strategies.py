@@ -0,0 +1,177 @@
+"""
+Adaptive ordering of lookup cascades: which search strategies actually find records, and how
+fast, per query shape, so the likeliest cheap strategy runs first and dead ones are skipped
+"""
+
+import re
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+# Latency assumed for a strategy that has not been timed yet (seconds)
+DEFAULT_LATENCY = 0.4
+# A strategy that missed this many times without a hit is skipped...
+PRUNE_AFTER = 20
+# ...except on every Nth cascade, so a strategy that starts working is noticed again
+EXPLORE_EVERY = 25
+
+
+def _values(params: Dict[str, Any]) -> List[str]:
+    values = []
+    if params.get('query'):
+        values.append(str(params['query']))
+    for group in params.get('filterGroups') or []:
+        for filter_item in group.get('filters', []):
+            for value in [filter_item.get('value')] + list(filter_item.get('values') or []):
+                if value not in (None, ''):
+                    values.append(str(value))
+    return values
+
+
+def value_kind(value: str) -> str:
+    """'email', 'phone' or 'text', for grouping strategies by what is being looked up"""
+    if '@' in value:
+        return 'email'
+    digits = re.sub(r'\D', '', value)
+    if len(digits) >= 7 and not re.search(r'[A-Za-z]', value):
+        return 'phone'
+    return 'text'
+
+
+def lookup_key(value: str) -> str:
+    """The value being looked up, whatever format a strategy sends it in
+
+    Phone numbers reduce to their national digits, so '+1 (555) 010-0000', '15550100000'
+    and '5550100000' are one lookup.
+    """
+    value = value.strip()
+    if value_kind(value) != 'phone':
+        return value.lower()
+    digits = re.sub(r'\D', '', value)
+    return digits[1:] if len(digits) == 11 and digits.startswith('1') else digits
+
+
+def _value_variant(value: str) -> str:
+    """Phone formatting as the strategy sends it: '10d' (no country code), '11d', '+', 'fmt'"""
+    if value_kind(value) != 'phone':
+        return value_kind(value)
+    if value.startswith('+'):
+        return '+'
+    if not value.isdigit():
+        return 'fmt'
+    return f"{len(value)}d"
+
+
+def strategy_signature(endpoint_config: Dict[str, Any]) -> str:
+    """What kind of search a strategy is, independent of the value searched for
+
+    'contacts:filter:hs_searchable_calculated_phone_number/CONTAINS_TOKEN:10d' or
+    'contacts:query:11d'
+    """
+    params = endpoint_config.get('params', {})
+    object_type = endpoint_config.get('endpoint', '').strip('/').split('/')[-1]
+    values = _values(params)
+    variant = _value_variant(values[0]) if values else 'none'
+    if params.get('query'):
+        return f"{object_type}:query:{variant}"
+    filters = sorted(
+        f"{filter_item.get('propertyName')}/{filter_item.get('operator')}"
+        for group in params.get('filterGroups') or [] for filter_item in group.get('filters', [])
+    )
+    return f"{object_type}:filter:{'+'.join(filters)}:{variant}"
+
+
+def query_shape(endpoints: List[Dict[str, Any]]) -> str:
+    """Cascade shape: object type and kind of value looked up ('contacts:phone')"""
+    kinds = sorted({value_kind(value) for entry in endpoints for value in _values(entry.get('params', {}))})
+    object_types = sorted({entry.get('endpoint', '').strip('/').split('/')[-1] for entry in endpoints})
+    return f"{'+'.join(object_types)}:{'+'.join(kinds) or 'none'}"
+
+
+class StrategyStats:
+    __slots__ = ('attempts', 'hits', 'misses_in_a_row', 'latency')
+
+    def __init__(self):
+        self.attempts = 0
+        self.hits = 0
+        self.misses_in_a_row = 0
+        self.latency: Optional[float] = None
+
+    @property
+    def hit_rate(self) -> float:
+        # Smoothed so an untried strategy starts at 0.5
+        return (self.hits + 1) / (self.attempts + 2)
+
+    @property
+    def score(self) -> float:
+        """Expected hits per second spent"""
+        return self.hit_rate / (self.latency or DEFAULT_LATENCY)
+
+
+class StrategyOrderer:
+    """Orders a lookup cascade by observed hit rate per second of latency, per query shape
+
+    Strategies with no history keep the planner's order (ties sort stably). A strategy that
+    has missed PRUNE_AFTER times in a row for a shape is skipped, except on exploration runs.
+    """
+
+    def __init__(self, prune_after: int = PRUNE_AFTER, explore_every: int = EXPLORE_EVERY):
+        self.prune_after = prune_after
+        self.explore_every = explore_every
+        self._stats: Dict[Tuple[str, str], StrategyStats] = {}
+        self._cascades: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.pruned_calls = 0
+
+    def order(self, endpoints: List[Dict[str, Any]]) -> Tuple[str, List[Tuple[str, Dict[str, Any]]]]:
+        """(shape, [(signature, endpoint config)]) in the order to try them"""
+
+        shape = query_shape(endpoints)
+        with self._lock:
+            run = self._cascades[shape] = self._cascades.get(shape, 0) + 1
+            explore = run % self.explore_every == 0
+            scored = []
+            for position, entry in enumerate(endpoints):
+                signature = strategy_signature(entry)
+                stats = self._stats.get((shape, signature)) or StrategyStats()
+                scored.append((-stats.score, position, signature, entry, stats))
+        scored.sort(key=lambda item: item[:2])
+
+        ordered = [(signature, entry) for _, _, signature, entry, stats in scored
+                   if explore or stats.misses_in_a_row < self.prune_after]
+        if not ordered:
+            # Every strategy looks dead: try them all rather than nothing
+            ordered = [(signature, entry) for _, _, signature, entry, _ in scored]
+        skipped = len(scored) - len(ordered)
+        if skipped:
+            self.pruned_calls += skipped
+            print(f"✂️  Skipping {skipped} strategies that never match {shape} lookups")
+        return shape, ordered
+
+    def record(self, shape: str, signature: str, hit: bool, seconds: float):
+        with self._lock:
+            stats = self._stats.get((shape, signature))
+            if stats is None:
+                stats = self._stats[(shape, signature)] = StrategyStats()
+            stats.attempts += 1
+            if hit:
+                stats.hits += 1
+                stats.misses_in_a_row = 0
+            else:
+                stats.misses_in_a_row += 1
+            # Exponentially weighted, so the estimate follows HubSpot's current latency
+            stats.latency = seconds if stats.latency is None else 0.8 * stats.latency + 0.2 * seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'cascades': dict(self._cascades),
+                'pruned_calls': self.pruned_calls,
+                'strategies': {
+                    f"{shape} {signature}": {
+                        'attempts': stats.attempts,
+                        'hits': stats.hits,
+                        'latency_ms': round(stats.latency * 1000) if stats.latency is not None else None
+                    }
+                    for (shape, signature), stats in self._stats.items()
+                }
+            }
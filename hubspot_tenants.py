@@ -0,0 +1,360 @@
+"""
+Multi-tenant support: per-portal credentials, rate limits and a bounded LRU of warm systems
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Any, Callable, Optional
+import requests
+
+DEFAULT_TENANT = 'default'
+
+# Private apps get 100 requests per 10 seconds per portal; stay just under it
+DEFAULT_RATE_LIMIT = 9.0
+DEFAULT_BURST = 20
+
+TENANT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+# Fields holding credentials; never sent back to the browser in full
+SECRET_FIELDS = ('hubspot_api_key', 'anthropic_api_key', 'kixie_api_key')
+
+
+class TenantError(Exception):
+    """Raised for unknown or malformed tenant ids"""
+    status_code = 404
+
+
+class TenantAuthError(TenantError):
+    """Raised when a request's credentials don't grant the tenant or operation it asks for"""
+
+    def __init__(self, message: str, status_code: int = 401):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class TenantConfig:
+    """Everything that differs between HubSpot portals served by one deployment"""
+    tenant_id: str
+    hubspot_api_key: Optional[str] = None
+    anthropic_api_key: Optional[str] = None
+    claude_model: Optional[str] = None
+    kixie_api_key: Optional[str] = None
+    kixie_business_id: Optional[str] = None
+    sender_email: Optional[str] = None
+    rate_limit: float = DEFAULT_RATE_LIMIT  # HubSpot requests per second
+    burst: int = DEFAULT_BURST
+    integrations: Dict[str, Any] = field(default_factory=dict)
+    # Requests authenticate as this tenant with the bearer token hashing to this
+    access_token_sha256: Optional[str] = None
+
+    @classmethod
+    def from_env(cls, tenant_id: str = DEFAULT_TENANT) -> 'TenantConfig':
+        """The single-portal setup read from HUBSPOT_API_KEY, ANTHROPIC_API_KEY, KIXIE_* etc."""
+        return cls(
+            tenant_id=tenant_id,
+            hubspot_api_key=os.getenv('HUBSPOT_API_KEY'),
+            anthropic_api_key=os.getenv('ANTHROPIC_API_KEY'),
+            kixie_api_key=os.getenv('KIXIE_API_KEY'),
+            kixie_business_id=os.getenv('KIXIE_BUSINESS_ID'),
+            sender_email=os.getenv('SENDER_EMAIL', 'cmarshall@kixie.com')
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TenantConfig':
+        known = cls.__dataclass_fields__
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+    def apply_setup(self, payload: Dict[str, Any]):
+        """Merge what setup_interface.html posts ({'integrations', 'configuration': {...}})"""
+
+        configuration = payload.get('configuration') or {}
+        hubspot = configuration.get('hubspot') or {}
+        claude = configuration.get('claude') or {}
+        kixie = configuration.get('kixie') or {}
+
+        updates = {
+            'hubspot_api_key': hubspot.get('api_key'),
+            'anthropic_api_key': claude.get('api_key'),
+            'claude_model': claude.get('model'),
+            'kixie_api_key': kixie.get('api_key'),
+            'kixie_business_id': kixie.get('business_id'),
+            'sender_email': kixie.get('sender_email')
+        }
+        for key, value in updates.items():
+            # Blank form fields keep the stored value
+            if value:
+                setattr(self, key, value)
+
+        if payload.get('integrations'):
+            self.integrations = payload['integrations']
+
+    def to_dict(self, redact: bool = False) -> Dict[str, Any]:
+        data = asdict(self)
+        if redact:
+            data.pop('access_token_sha256', None)
+            for key in SECRET_FIELDS:
+                if data.get(key):
+                    # Short values would be given away entirely by their last four characters
+                    data[key] = '••••' + (data[key][-4:] if len(data[key]) > 12 else '')
+        return data
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a request may go out"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+
+class RateLimitedSession(requests.Session):
+    """requests.Session that takes a token from the tenant's bucket before every request"""
+
+    def __init__(self, bucket: TokenBucket = None):
+        super().__init__()
+        self.bucket = bucket
+
+    def request(self, *args, **kwargs):
+        if self.bucket:
+            self.bucket.acquire()
+        return super().request(*args, **kwargs)
+
+
+class TenantStore:
+    """Tenant configurations persisted as one JSON file (written atomically, owner-readable only)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # (mtime, contents): every request authenticates against the store, so it is only
+        # re-read when another process has rewritten it
+        self._cache: Optional[tuple] = None
+
+    def _read(self) -> Dict[str, Dict]:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self._cache is not None and self._cache[0] == mtime:
+            return self._cache[1]
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            print(f"⚠️  Ignoring unreadable tenant store {self.path}: {e}")
+            return {}
+        self._cache = (mtime, data)
+        return data
+
+    def saved(self, tenant_id: str) -> TenantConfig:
+        """Only what was saved for the tenant (no environment fallback) - what save() should write back"""
+        with self._lock:
+            data = self._read().get(tenant_id) or {}
+        return TenantConfig.from_dict({**data, 'tenant_id': tenant_id})
+
+    def get(self, tenant_id: str) -> Optional[TenantConfig]:
+        """Effective configuration, or None for a tenant that was never set up"""
+        # The default tenant is the environment configuration and nothing else
+        if tenant_id == DEFAULT_TENANT:
+            return TenantConfig.from_env()
+        with self._lock:
+            data = self._read().get(tenant_id)
+        if data is None:
+            return None
+        return TenantConfig.from_dict({**data, 'tenant_id': tenant_id})
+
+    def tenant_for_token(self, token: str) -> Optional[str]:
+        """The tenant a bearer token belongs to, None when it belongs to none"""
+        hashed = hash_token(token)
+        with self._lock:
+            tenants = self._read()
+        for tenant_id, data in tenants.items():
+            if hmac.compare_digest(str(data.get('access_token_sha256') or ''), hashed):
+                return tenant_id
+        return None
+
+    def save(self, config: TenantConfig):
+        if config.tenant_id == DEFAULT_TENANT:
+            raise TenantError("The default tenant is configured by the environment, not saved settings")
+        with self._lock:
+            tenants = dict(self._read())
+            tenants[config.tenant_id] = config.to_dict()
+            temp_path = f"{self.path}.tmp"
+            with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+                json.dump(tenants, f, indent=2)
+            os.replace(temp_path, self.path)
+
+
+class TenantRegistry:
+    """Bounded LRU of warm per-tenant systems; each has its own sessions, rate limit and caches"""
+
+    def __init__(self, factory: Callable[[TenantConfig], Any], store: TenantStore, max_tenants: int = 16):
+        self.factory = factory
+        self.store = store
+        self.max_tenants = max_tenants
+        self._systems: 'OrderedDict[str, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id: str = None):
+        """Warm system for the tenant, building it (and evicting the coldest) if needed"""
+
+        tenant_id = validate_tenant_id(tenant_id)
+        with self._lock:
+            system = self._systems.get(tenant_id)
+            if system is not None:
+                self._systems.move_to_end(tenant_id)
+                return system
+
+        config = self.store.get(tenant_id)
+        if config is None:
+            raise TenantError(f"Unknown tenant '{tenant_id}'")
+
+        # Build outside the lock so a slow tenant doesn't block the others
+        system = self.factory(config)
+
+        with self._lock:
+            if tenant_id in self._systems:
+                # Another thread won the race; keep the first one
+                self._close(system)
+                self._systems.move_to_end(tenant_id)
+                return self._systems[tenant_id]
+            self._systems[tenant_id] = system
+            evicted = []
+            while len(self._systems) > self.max_tenants:
+                evicted.append(self._systems.popitem(last=False))
+
+        # Evicted systems may still be serving a request, so they are not closed here;
+        # their pools close when the last reference goes away
+        for evicted_id, _ in evicted:
+            print(f"♻️  Evicted tenant '{evicted_id}' from the warm pool")
+        return system
+
+    def warm(self) -> List[Any]:
+        """The systems currently built (for broadcasting webhook changes to their caches)"""
+        with self._lock:
+            return list(self._systems.values())
+
+    def invalidate(self, tenant_id: str):
+        """Drop a tenant's warm system so the next request picks up new configuration"""
+        with self._lock:
+            self._systems.pop(tenant_id, None)
+
+    @staticmethod
+    def _close(system):
+        close = getattr(system, 'close_connections', None)
+        if close:
+            close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'warm_tenants': list(self._systems), 'max_tenants': self.max_tenants}
+
+
+def validate_tenant_id(tenant_id: Optional[str]) -> str:
+    tenant_id = tenant_id or DEFAULT_TENANT
+    if not TENANT_ID_PATTERN.match(tenant_id):
+        raise TenantError(f"Invalid tenant id '{tenant_id}'")
+    return tenant_id
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def new_access_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def bearer_token(flask_request) -> Optional[str]:
+    """Authorization: Bearer <token>, else an access_token form field (form posts can't set headers)"""
+    header = flask_request.headers.get('Authorization', '')
+    if header[:7].lower() == 'bearer ':
+        return header[7:].strip() or None
+    return flask_request.form.get('access_token') or None
+
+
+def is_admin(flask_request) -> bool:
+    """Whether the request carries the operator's ADMIN_TOKEN (X-Admin-Token)"""
+    admin_token = os.getenv('ADMIN_TOKEN')
+    supplied = flask_request.headers.get('X-Admin-Token')
+    return bool(admin_token and supplied) and hmac.compare_digest(supplied, admin_token)
+
+
+def require_admin(flask_request):
+    """Configuration changes need ADMIN_TOKEN; without one set they are disabled"""
+    if not os.getenv('ADMIN_TOKEN'):
+        raise TenantAuthError("Configuration changes are disabled until ADMIN_TOKEN is set", 403)
+    if not is_admin(flask_request):
+        raise TenantAuthError("A valid X-Admin-Token is required")
+
+
+def tenant_id_from_request(flask_request, store: TenantStore) -> str:
+    """The tenant the request is authenticated as
+
+    A bearer token selects the tenant it was issued to. Without one the request is the default
+    (environment) tenant, which needs API_TOKEN as its bearer token when that is set. Only
+    admins may name a tenant directly (X-Tenant-ID or tenant_id).
+    """
+    if is_admin(flask_request):
+        return requested_tenant_id(flask_request)
+
+    token = bearer_token(flask_request)
+    api_token = os.getenv('API_TOKEN')
+    if token is None:
+        if api_token:
+            raise TenantAuthError("An access token is required")
+        return DEFAULT_TENANT
+    if api_token and hmac.compare_digest(token, api_token):
+        return DEFAULT_TENANT
+    tenant_id = store.tenant_for_token(token)
+    if tenant_id is None:
+        raise TenantAuthError("Invalid access token")
+    return tenant_id
+
+
+def authenticated_tenant_id(flask_request, store: TenantStore) -> str:
+    """tenant_id_from_request for changes that always need credentials (an access token or X-Admin-Token)"""
+    if not is_admin(flask_request) and bearer_token(flask_request) is None:
+        raise TenantAuthError("An access token or X-Admin-Token is required")
+    return tenant_id_from_request(flask_request, store)
+
+
+def requested_tenant_id(flask_request) -> str:
+    """X-Tenant-ID header, else a tenant_id field in the JSON body, form or query string"""
+
+    tenant_id = flask_request.headers.get('X-Tenant-ID')
+    if not tenant_id:
+        body = flask_request.get_json(silent=True) if flask_request.is_json else None
+        if isinstance(body, dict):
+            tenant_id = body.get('tenant_id')
+    if not tenant_id:
+        tenant_id = flask_request.values.get('tenant_id')
+    return validate_tenant_id(tenant_id)
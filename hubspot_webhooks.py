@@ -0,0 +1,221 @@
+"""
+HubSpot webhook ingestion: v3 signature checks, per-object coalescing of event bursts, and
+batched delivery to cache listeners from one background thread
+"""
+
+import base64
+import hashlib
+import hmac
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Callable, Iterable, Optional
+
+# Deliveries signed longer ago than this are rejected as possible replays
+MAX_SIGNATURE_AGE_SECONDS = 300
+
+# The characters HubSpot decodes in the request URI before signing it
+_SIGNED_URI_ESCAPES = {
+    '%3A': ':', '%2F': '/', '%3F': '?', '%40': '@', '%21': '!', '%24': '$',
+    '%27': "'", '%28': '(', '%29': ')', '%2A': '*', '%2C': ',', '%3B': ';'
+}
+_SIGNED_URI_PATTERN = re.compile('|'.join(_SIGNED_URI_ESCAPES), re.IGNORECASE)
+
+# subscriptionType prefix -> CRM object type as the rest of the code names it
+OBJECT_TYPES = {
+    'contact': 'contacts', 'company': 'companies', 'deal': 'deals', 'ticket': 'tickets',
+    'product': 'products', 'line_item': 'line_items'
+}
+
+# Event IDs remembered to drop HubSpot's redeliveries
+SEEN_EVENT_IDS = 50000
+
+
+def signed_uri(flask_request, override: str = None) -> str:
+    """The URL HubSpot signed: the public one, even behind a TLS-terminating proxy"""
+    if override:
+        return override
+    scheme = flask_request.headers.get('X-Forwarded-Proto', flask_request.scheme).split(',')[0].strip()
+    return f"{scheme}://{flask_request.host}{flask_request.full_path.rstrip('?')}"
+
+
+def verify_signature_v3(client_secret: str, method: str, uri: str, body: bytes,
+                        timestamp: Optional[str], signature: Optional[str], now: float = None) -> bool:
+    """X-HubSpot-Signature-v3: base64 HMAC-SHA256 of method + uri + body + timestamp"""
+
+    if not client_secret or not signature:
+        return False
+    try:
+        timestamp_ms = int(timestamp)
+    except (TypeError, ValueError):
+        return False
+    now = time.time() if now is None else now
+    if abs(now * 1000 - timestamp_ms) > MAX_SIGNATURE_AGE_SECONDS * 1000:
+        return False
+
+    try:
+        text = body.decode('utf-8')
+    except UnicodeDecodeError:
+        return False  # HubSpot signs the body as UTF-8 text, so no genuine delivery gets here
+    uri = _SIGNED_URI_PATTERN.sub(lambda match: _SIGNED_URI_ESCAPES[match.group(0).upper()], uri)
+    source = f"{method.upper()}{uri}{text}{timestamp}"
+    expected = base64.b64encode(
+        hmac.new(client_secret.encode('utf-8'), source.encode('utf-8'), hashlib.sha256).digest()
+    ).decode()
+    return hmac.compare_digest(expected, signature)
+
+
+@dataclass
+class ObjectChange:
+    """Everything a burst of events said about one record, coalesced"""
+    portal_id: str
+    object_type: str
+    object_id: str
+    created: bool = False
+    deleted: bool = False
+    # Merges, restores, association changes...: something changed, without details
+    other: bool = False
+    # property -> (occurredAt, value), the latest value per property
+    changes: Dict[str, tuple] = field(default_factory=dict)
+    events: int = 0
+
+    @property
+    def properties(self) -> Dict[str, Any]:
+        return {name: value for name, (_, value) in self.changes.items()}
+
+    def add(self, kind: str, event: Dict[str, Any]):
+        self.events += 1
+        if kind == 'deletion' or kind == 'privacyDeletion':
+            self.deleted = True
+            self.changes.clear()
+        elif kind == 'creation':
+            self.created = True
+            self.deleted = False
+        elif kind == 'propertyChange' and not self.deleted:
+            name = event.get('propertyName')
+            occurred = event.get('occurredAt') or 0
+            if name and occurred >= self.changes.get(name, (0, None))[0]:
+                self.changes[name] = (occurred, event.get('propertyValue'))
+        else:
+            self.other = True
+
+
+@dataclass
+class WebhookBatch:
+    """The coalesced changes of one portal since the previous flush"""
+    portal_id: str
+    changes: List[ObjectChange]
+
+
+def parse_event(event: Any) -> Optional[tuple]:
+    """(portal id, object type, object id, event kind) for a webhook event, None if unusable"""
+    if not isinstance(event, dict):
+        return None
+    prefix, _, kind = str(event.get('subscriptionType', '')).partition('.')
+    object_id = event.get('objectId')
+    if not kind or object_id is None:
+        return None
+    object_type = OBJECT_TYPES.get(prefix, f"{prefix}s")
+    return str(event.get('portalId', '')), object_type, str(object_id), kind
+
+
+class WebhookDispatcher:
+    """Coalesces events per record and hands them to listeners every flush_seconds
+
+    submit() only merges into the pending map, so a burst of thousands of events for a few
+    records costs a few listener calls. When more than max_pending records are waiting,
+    submit() refuses the delivery and HubSpot retries it later (back-pressure).
+    """
+
+    def __init__(self, flush_seconds: float = 1.0, max_pending: int = 10000):
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.listeners: List[Callable[[WebhookBatch], None]] = []
+        self._pending: Dict[tuple, ObjectChange] = {}
+        self._seen: 'OrderedDict[Any, None]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            'received': 0, 'duplicates': 0, 'ignored': 0, 'rejected_deliveries': 0,
+            'flushes': 0, 'records_flushed': 0, 'listener_errors': 0
+        }
+        self.last_flush: Optional[float] = None
+
+    def add_listener(self, listener: Callable[[WebhookBatch], None]):
+        self.listeners.append(listener)
+
+    def submit(self, events: Iterable[Any]) -> bool:
+        """Queue one delivery; False (nothing queued) when the backlog is full"""
+
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self._stats['rejected_deliveries'] += 1
+                return False
+            for event in events:
+                parsed = parse_event(event)
+                if parsed is None:
+                    self._stats['ignored'] += 1
+                    continue
+                event_id = event.get('eventId')
+                if event_id is not None:
+                    if event_id in self._seen:
+                        self._stats['duplicates'] += 1
+                        continue
+                    self._seen[event_id] = None
+                    if len(self._seen) > SEEN_EVENT_IDS:
+                        self._seen.popitem(last=False)
+                self._stats['received'] += 1
+                portal_id, object_type, object_id, kind = parsed
+                key = (portal_id, object_type, object_id)
+                change = self._pending.get(key)
+                if change is None:
+                    change = self._pending[key] = ObjectChange(portal_id, object_type, object_id)
+                change.add(kind, event)
+        self._start()
+        return True
+
+    def _start(self):
+        # Started on first use so each forked worker runs its own flusher
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='hubspot-webhooks', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self) -> int:
+        """Deliver everything pending to the listeners now; returns the number of records"""
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        by_portal: Dict[str, List[ObjectChange]] = {}
+        for change in pending.values():
+            by_portal.setdefault(change.portal_id, []).append(change)
+        for portal_id, changes in by_portal.items():
+            batch = WebhookBatch(portal_id, changes)
+            for listener in self.listeners:
+                try:
+                    listener(batch)
+                except Exception as e:
+                    self._stats['listener_errors'] += 1
+                    print(f"❌ Webhook listener error for portal {portal_id}: {e}")
+
+        self._stats['flushes'] += 1
+        self._stats['records_flushed'] += len(pending)
+        self.last_flush = time.time()
+        return len(pending)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+        return {**self._stats, 'pending_records': pending, 'max_pending': self.max_pending,
+                'flush_seconds': self.flush_seconds, 'last_flush': self.last_flush}
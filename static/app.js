@@ -0,0 +1,444 @@
+// Global state
+let currentResults = null;
+let currentAnalysis = null;
+let lastResponse = null;
+let isProcessing = false;
+
+// Server-side conversation holding the last plan and result; follow-ups refine or act on it
+let sessionId = null;
+let resultId = null;
+
+// Portal to work with: the access token issued when the tenant was set up. ?token=<token>
+// stores it for this browser tab and is then dropped from the address bar.
+const accessToken = (function() {
+    const params = new URLSearchParams(window.location.search);
+    const token = params.get('token');
+    if (token) {
+        sessionStorage.setItem('accessToken', token);
+        params.delete('token');
+        const query = params.toString();
+        window.history.replaceState(null, '', window.location.pathname + (query ? `?${query}` : ''));
+    }
+    return token || sessionStorage.getItem('accessToken') || '';
+})();
+
+function apiHeaders() {
+    const headers = { 'Content-Type': 'application/json' };
+    if (accessToken) {
+        headers['Authorization'] = `Bearer ${accessToken}`;
+    }
+    return headers;
+}
+
+// Initialize
+document.addEventListener('DOMContentLoaded', function() {
+    addLog('System initialized and ready', 'info');
+    updateStatus('ready');
+    checkSystemStatus();
+});
+
+function selectQuestion(question) {
+    document.getElementById('user-question').value = question;
+    addLog(`Selected question: ${question}`, 'info');
+}
+
+function updateStatus(status, message = '') {
+    const statusDot = document.getElementById('status-dot');
+    const statusText = document.getElementById('status-text');
+
+    statusDot.className = 'status-dot';
+
+    switch(status) {
+        case 'ready':
+            statusText.textContent = 'Ready';
+            break;
+        case 'processing':
+            statusDot.classList.add('loading');
+            statusText.textContent = message || 'Processing...';
+            break;
+        case 'error':
+            statusDot.classList.add('offline');
+            statusText.textContent = message || 'Error';
+            break;
+        case 'success':
+            statusText.textContent = message || 'Success';
+            break;
+    }
+}
+
+function addLog(message, type = 'info') {
+    const logContent = document.getElementById('log-content');
+    const timestamp = new Date().toLocaleTimeString();
+    const logEntry = document.createElement('div');
+    logEntry.className = `log-entry log-${type}`;
+    logEntry.textContent = `[${timestamp}] ${message}`;
+    logContent.appendChild(logEntry);
+    logContent.scrollTop = logContent.scrollHeight;
+}
+
+function clearLogs() {
+    document.getElementById('log-content').innerHTML = '';
+    addLog('Logs cleared', 'info');
+}
+
+function clearResults() {
+    document.getElementById('results-section').style.display = 'none';
+    document.getElementById('results-content').innerHTML = '';
+    document.getElementById('actions-section').style.display = 'none';
+    document.getElementById('export-bar').style.display = 'none';
+    currentResults = null;
+    currentAnalysis = null;
+    lastResponse = null;
+    sessionId = null;
+    resultId = null;
+    addLog('Results cleared', 'info');
+}
+
+async function checkSystemStatus() {
+    try {
+        const response = await fetch('/api/status', { headers: apiHeaders() });
+        const data = await response.json();
+
+        if (data.system_initialized) {
+            addLog('✅ Backend system is initialized', 'success');
+        } else {
+            addLog('❌ Backend system not initialized', 'error');
+        }
+
+        // Check environment variables
+        const env = data.environment;
+        addLog(`HubSpot API: ${env.hubspot_api_key ? 'Configured' : 'Missing'}`, 
+               env.hubspot_api_key ? 'success' : 'warning');
+        addLog(`Claude API: ${env.claude_api_key ? 'Configured' : 'Missing'}`, 
+               env.claude_api_key ? 'success' : 'warning');
+        addLog(`MySQL: ${env.mysql_configured ? 'Configured' : 'Missing'}`, 
+               env.mysql_configured ? 'success' : 'warning');
+        addLog(`Kixie SMS: ${env.kixie_configured ? 'Configured' : 'Missing'}`, 
+               env.kixie_configured ? 'success' : 'warning');
+
+    } catch (error) {
+        addLog(`❌ Could not connect to backend: ${error.message}`, 'error');
+        updateStatus('error', 'Backend unavailable');
+    }
+}
+
+async function testConnections() {
+    updateStatus('processing', 'Testing connections...');
+    addLog('Testing API connections...', 'info');
+
+    try {
+        const response = await fetch('/api/test-connections', {
+            method: 'POST',
+            headers: apiHeaders()
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            const results = data.results;
+            addLog(`✅ HubSpot API: ${results.hubspot ? 'Connected' : 'Failed'}`, 
+                   results.hubspot ? 'success' : 'error');
+            addLog(`✅ Claude API: ${results.claude ? 'Connected' : 'Failed'}`, 
+                   results.claude ? 'success' : 'error');
+            addLog(`✅ MySQL Database: ${results.mysql ? 'Connected' : 'Failed'}`, 
+                   results.mysql ? 'success' : 'error');
+            addLog(`✅ Kixie SMS API: ${results.kixie ? 'Connected' : 'Failed'}`, 
+                   results.kixie ? 'success' : 'error');
+
+            if (results.errors && results.errors.length > 0) {
+                results.errors.forEach(error => addLog(`❌ ${error}`, 'error'));
+            }
+
+            updateStatus('success', 'Connection test completed');
+        } else {
+            addLog(`❌ Connection test failed: ${data.error}`, 'error');
+            updateStatus('error', 'Connection test failed');
+        }
+
+        setTimeout(() => updateStatus('ready'), 3000);
+
+    } catch (error) {
+        addLog(`❌ Connection test failed: ${error.message}`, 'error');
+        updateStatus('error', 'Connection failed');
+        setTimeout(() => updateStatus('ready'), 3000);
+    }
+}
+
+async function processQuestion() {
+    if (isProcessing) return;
+
+    const question = document.getElementById('user-question').value.trim();
+    const actionType = document.getElementById('action-type').value;
+
+    if (!question) {
+        addLog('Please enter a question', 'warning');
+        return;
+    }
+
+    isProcessing = true;
+    const processBtn = document.getElementById('process-btn');
+    processBtn.disabled = true;
+    processBtn.textContent = 'Processing...';
+
+    updateStatus('processing', 'Analyzing question...');
+    addLog(`Processing question: "${question}"`, 'info');
+
+    try {
+        // Show loading in results
+        const resultsSection = document.getElementById('results-section');
+        const resultsContent = document.getElementById('results-content');
+
+        resultsSection.style.display = 'block';
+        resultsContent.innerHTML = `
+            <div class="loading">
+                <div class="spinner"></div>
+                <p>Claude is analyzing your question and querying the data...</p>
+            </div>
+        `;
+
+        // Make actual API call to backend
+        const response = await fetch('/api/process-question', {
+            method: 'POST',
+            headers: apiHeaders(),
+            body: JSON.stringify({
+                question: question,
+                action_type: actionType,
+                session_id: sessionId
+            })
+        });
+
+        const data = await response.json();
+
+        if (data.success && data.follow_up && data.follow_up.type === 'action') {
+            // "Text them" etc. act on the previous result, which stays on screen
+            if (lastResponse) displayResults(lastResponse);
+            addLog(`Follow-up on "${data.follow_up.base_question}": ${data.follow_up.action}`, 'info');
+            updateStatus('ready');
+            if (confirm(`Run ${data.follow_up.action} on the results of "${data.follow_up.base_question}"?`)) {
+                await executeAction(data.follow_up.action);
+            }
+        } else if (data.success) {
+            sessionId = data.session_id;
+            resultId = data.result_id;
+            lastResponse = data;
+            if (data.follow_up && data.follow_up.type === 'refine') {
+                addLog(`🔁 Narrowed "${data.follow_up.base_question}" with ${data.follow_up.filter.propertyName} ${data.follow_up.filter.operator}`, 'info');
+            }
+            if (data.materialized) {
+                addLog(`🗓️ Scheduled answer computed at ${new Date(data.materialized.computed_at).toLocaleTimeString()}`, 'info');
+            }
+            currentResults = data.results;
+            currentAnalysis = data.analysis;
+            document.getElementById('export-bar').style.display =
+                currentAnalysis && currentAnalysis.hubspot_endpoints ? 'block' : 'none';
+
+            // Display results
+            displayResults(data);
+
+            // Show actions if action type selected
+            if (actionType) {
+                document.getElementById('actions-section').style.display = 'block';
+                addLog(`Action "${actionType}" ready to execute`, 'info');
+            }
+
+            updateStatus('success', 'Query completed');
+            addLog('✅ Query processing completed successfully', 'success');
+            addLog(`Found ${data.total_records} total records`, 'info');
+
+        } else {
+            throw new Error(data.error || 'Unknown error occurred');
+        }
+
+    } catch (error) {
+        addLog(`❌ Error processing question: ${error.message}`, 'error');
+        updateStatus('error', 'Query failed');
+
+        document.getElementById('results-content').innerHTML = `
+            <div style="color: #dc3545; text-align: center; padding: 20px;">
+                <h4>❌ Error</h4>
+                <p>${error.message}</p>
+                <p>Please check the logs and ensure your backend is running properly.</p>
+            </div>
+        `;
+    } finally {
+        isProcessing = false;
+        processBtn.disabled = false;
+        processBtn.textContent = '🚀 Process Question';
+        setTimeout(() => updateStatus('ready'), 3000);
+    }
+}
+
+function displayResults(data) {
+    const resultsContent = document.getElementById('results-content');
+
+    let html = '';
+
+    // Show summary if available
+    if (data.summary) {
+        html += `
+            <div class="summary-section">
+                <h4>📊 Summary</h4>
+                <p>${data.summary}</p>
+            </div>
+        `;
+    }
+
+    // Show analysis if available
+    if (data.analysis && Object.keys(data.analysis).length > 0) {
+        html += `
+            <div class="summary-section">
+                <h4>🔍 Analysis</h4>
+                <pre>${JSON.stringify(data.analysis, null, 2)}</pre>
+            </div>
+        `;
+    }
+
+    html += `
+        <div class="result-header">
+            <span class="result-title">Found ${data.total_records} results</span>
+            <span class="result-source">Real Data</span>
+        </div>
+    `;
+
+    if (data.aggregates && data.aggregates.length > 0) {
+        data.aggregates.forEach((item, index) => {
+            if (item.query_type === 'count') {
+                html += `
+                    <div class="result-item">
+                        <div class="result-header">
+                            <span class="result-title">${item.purpose || item.endpoint}</span>
+                        </div>
+                        <p><strong>Total:</strong> ${Number(item.total_count).toLocaleString()}</p>
+                    </div>
+                `;
+                return;
+            }
+
+            html += `<div class="result-item"><div class="result-header"><span class="result-title">Group ${index + 1}</span></div>`;
+            for (let [key, value] of Object.entries(item)) {
+                const shown = typeof value === 'number' ? value.toLocaleString() : value;
+                html += `<p><strong>${key}:</strong> ${shown}</p>`;
+            }
+            html += '</div>';
+        });
+    } else if (data.results && data.results.length > 0) {
+        data.results.forEach((item, index) => {
+            html += `
+                <div class="result-item">
+                    <div class="result-header">
+                        <span class="result-title">${item.source || `Result ${index + 1}`}</span>
+                    </div>
+            `;
+
+            // Display the actual data
+            if (item.data && typeof item.data === 'object') {
+                for (let [key, value] of Object.entries(item.data)) {
+                    if (value !== null && value !== undefined) {
+                        html += `<p><strong>${key}:</strong> ${value}</p>`;
+                    }
+                }
+            } else {
+                html += `<pre>${JSON.stringify(item.data, null, 2)}</pre>`;
+            }
+
+            html += '</div>';
+        });
+    } else {
+        html += `
+            <div class="result-item">
+                <p>No detailed results to display, but query was processed successfully.</p>
+            </div>
+        `;
+    }
+
+    resultsContent.innerHTML = html;
+}
+
+function exportResults(format) {
+    if (!currentAnalysis) {
+        addLog('No query to export', 'warning');
+        return;
+    }
+
+    // A regular form post lets the browser stream the download to disk
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = '/api/export';
+
+    const fields = { format: format, analysis: JSON.stringify(currentAnalysis) };
+    if (accessToken) {
+        fields.access_token = accessToken;
+    }
+    for (const [name, value] of Object.entries(fields)) {
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = name;
+        input.value = value;
+        form.appendChild(input);
+    }
+
+    document.body.appendChild(form);
+    form.submit();
+    form.remove();
+    addLog(`⬇️ Exporting all matching records as ${format.toUpperCase()}`, 'info');
+}
+
+async function executeAction(actionType) {
+    if (!currentResults) {
+        addLog('No results available for action', 'warning');
+        return;
+    }
+
+    updateStatus('processing', `Executing ${actionType}...`);
+    addLog(`🚀 Executing action: ${actionType}`, 'info');
+
+    try {
+        const response = await fetch('/api/execute-action', {
+            method: 'POST',
+            headers: apiHeaders(),
+            body: JSON.stringify({
+                action_type: actionType,
+                result_id: resultId,
+                session_id: sessionId,
+                // The server holds the complete result; only pages without one post records back
+                results: resultId ? undefined : currentResults
+            })
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            addLog(`✅ Action "${actionType}" completed successfully`, 'success');
+            addLog(`Processed ${data.processed_records} records`, 'info');
+            updateStatus('success', 'Action completed');
+        } else {
+            throw new Error(data.error || 'Action failed');
+        }
+
+    } catch (error) {
+        addLog(`❌ Action failed: ${error.message}`, 'error');
+        updateStatus('error', 'Action failed');
+    }
+
+    setTimeout(() => updateStatus('ready'), 3000);
+}
+
+// Keyboard shortcuts
+document.addEventListener('keydown', function(e) {
+    if (e.ctrlKey || e.metaKey) {
+        switch(e.key) {
+            case 'Enter':
+                e.preventDefault();
+                if (!isProcessing) processQuestion();
+                break;
+            case 'l':
+                e.preventDefault();
+                clearLogs();
+                break;
+            case 'r':
+                e.preventDefault();
+                clearResults();
+                break;
+        }
+    }
+});
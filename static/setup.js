@@ -0,0 +1,288 @@
+let currentStep = 1;
+let selectedIntegrations = {
+    crm: [],
+    datasources: [],
+    ai: [],
+    communication: []
+};
+
+let configuration = {};
+
+// Portal being configured; ?tenant=<id> selects one of several saved setups
+const tenantId = new URLSearchParams(window.location.search).get('tenant') || '';
+
+// Saving configuration needs the deployment's ADMIN_TOKEN, asked for once per browser tab
+function adminToken() {
+    let token = sessionStorage.getItem('adminToken');
+    if (!token) {
+        token = prompt('Admin token (ADMIN_TOKEN) for changing configuration:') || '';
+        if (token) {
+            sessionStorage.setItem('adminToken', token);
+        }
+    }
+    return token;
+}
+
+function apiHeaders() {
+    const headers = { 'Content-Type': 'application/json', 'X-Admin-Token': adminToken() };
+    if (tenantId) {
+        headers['X-Tenant-ID'] = tenantId;
+    }
+    return headers;
+}
+
+// Initialize
+document.addEventListener('DOMContentLoaded', function() {
+    setupEventListeners();
+    loadExistingConfiguration();
+});
+
+function setupEventListeners() {
+    // Integration card selection
+    document.querySelectorAll('.integration-card').forEach(card => {
+        card.addEventListener('click', function() {
+            const integration = this.dataset.integration;
+            const status = this.querySelector('.integration-status').textContent;
+
+            // Don't allow selection of "Coming Soon" items
+            if (status === 'Coming Soon') {
+                return;
+            }
+
+            toggleIntegration(this, integration);
+        });
+    });
+}
+
+function toggleIntegration(card, integration) {
+    const isSelected = card.classList.contains('selected');
+    const step = getCurrentStepType();
+
+    if (isSelected) {
+        // Deselect
+        card.classList.remove('selected');
+        selectedIntegrations[step] = selectedIntegrations[step].filter(item => item !== integration);
+
+        // Hide configuration form
+        const configForm = document.getElementById(`config-${integration}`);
+        if (configForm) {
+            configForm.classList.add('hidden');
+        }
+    } else {
+        // Select
+        card.classList.add('selected');
+        if (!selectedIntegrations[step].includes(integration)) {
+            selectedIntegrations[step].push(integration);
+        }
+
+        // Show configuration form
+        const configForm = document.getElementById(`config-${integration}`);
+        if (configForm) {
+            configForm.classList.remove('hidden');
+        }
+    }
+
+    console.log('Selected integrations:', selectedIntegrations);
+}
+
+function getCurrentStepType() {
+    switch(currentStep) {
+        case 1: return 'crm';
+        case 2: return 'datasources';
+        case 3: return 'ai';
+        case 4: return 'communication';
+        default: return 'crm';
+    }
+}
+
+function nextStep() {
+    if (currentStep < 4) {
+        // Hide current step
+        document.getElementById(`step-${getStepName(currentStep)}`).classList.add('hidden');
+
+        // Mark current step as completed
+        document.getElementById(`step-${currentStep}`).classList.remove('active');
+        document.getElementById(`step-${currentStep}`).classList.add('completed');
+        document.getElementById(`line-${currentStep}`).classList.add('completed');
+
+        currentStep++;
+
+        // Show next step
+        document.getElementById(`step-${getStepName(currentStep)}`).classList.remove('hidden');
+        document.getElementById(`step-${currentStep}`).classList.add('active');
+
+        updateButtons();
+    }
+}
+
+function previousStep() {
+    if (currentStep > 1) {
+        // Hide current step
+        document.getElementById(`step-${getStepName(currentStep)}`).classList.add('hidden');
+        document.getElementById(`step-${currentStep}`).classList.remove('active');
+
+        currentStep--;
+
+        // Show previous step
+        document.getElementById(`step-${getStepName(currentStep)}`).classList.remove('hidden');
+        document.getElementById(`step-${currentStep}`).classList.remove('completed');
+        document.getElementById(`step-${currentStep}`).classList.add('active');
+        document.getElementById(`line-${currentStep}`).classList.remove('completed');
+
+        updateButtons();
+    }
+}
+
+function updateButtons() {
+    const prevBtn = document.getElementById('prev-btn');
+    const nextBtn = document.getElementById('next-btn');
+    const saveBtn = document.getElementById('save-btn');
+
+    // Show/hide previous button
+    prevBtn.style.display = currentStep > 1 ? 'inline-block' : 'none';
+
+    // Show/hide next vs save button
+    if (currentStep === 4) {
+        nextBtn.classList.add('hidden');
+        saveBtn.classList.remove('hidden');
+    } else {
+        nextBtn.classList.remove('hidden');
+        saveBtn.classList.add('hidden');
+    }
+}
+
+function getStepName(step) {
+    switch(step) {
+        case 1: return 'crm';
+        case 2: return 'datasources';
+        case 3: return 'ai';
+        case 4: return 'communication';
+        default: return 'crm';
+    }
+}
+
+async function testHubSpotConnection() {
+    const apiKey = document.getElementById('hubspot-api-key').value;
+    if (!apiKey) {
+        alert('Please enter your HubSpot API key');
+        return;
+    }
+
+    // Test API call
+    try {
+        const response = await fetch(`https://api.hubapi.com/crm/v3/objects/contacts?limit=1`, {
+            headers: {
+                'Authorization': `Bearer ${apiKey}`
+            }
+        });
+
+        if (response.ok) {
+            alert('✅ HubSpot connection successful!');
+            configuration.hubspot = { api_key: apiKey };
+        } else {
+            alert('❌ HubSpot connection failed. Please check your API key.');
+        }
+    } catch (error) {
+        alert('❌ Connection error: ' + error.message);
+    }
+}
+
+async function testMySQLConnection() {
+    const config = {
+        host: document.getElementById('mysql-host').value,
+        port: document.getElementById('mysql-port').value,
+        database: document.getElementById('mysql-database').value,
+        username: document.getElementById('mysql-username').value,
+        password: document.getElementById('mysql-password').value
+    };
+
+    if (!config.host || !config.database || !config.username) {
+        alert('Please fill in all required MySQL fields');
+        return;
+    }
+
+    // This would need to be handled by your backend
+    alert('MySQL connection test would be handled by the backend server');
+    configuration.mysql = config;
+}
+
+async function testClaudeConnection() {
+    const apiKey = document.getElementById('claude-api-key').value;
+    const model = document.getElementById('claude-model').value;
+
+    if (!apiKey) {
+        alert('Please enter your Claude API key');
+        return;
+    }
+
+    // This would need to be handled by your backend due to CORS
+    alert('Claude connection test would be handled by the backend server');
+    configuration.claude = { api_key: apiKey, model: model };
+}
+
+async function testKixieConnection() {
+    const config = {
+        api_key: document.getElementById('kixie-api-key').value,
+        business_id: document.getElementById('kixie-business-id').value,
+        sender_email: document.getElementById('kixie-sender-email').value
+    };
+
+    if (!config.api_key || !config.business_id) {
+        alert('Please fill in all required Kixie fields');
+        return;
+    }
+
+    alert('Kixie connection test would be handled by the backend server');
+    configuration.kixie = config;
+}
+
+async function saveConfiguration() {
+    // Collect all configuration data
+    const finalConfig = {
+        integrations: selectedIntegrations,
+        configuration: configuration,
+        timestamp: new Date().toISOString()
+    };
+
+    console.log('Final configuration:', finalConfig);
+
+    try {
+        const response = await fetch('/api/save-configuration', {
+            method: 'POST',
+            headers: apiHeaders(),
+            body: JSON.stringify(finalConfig)
+        });
+
+        const result = await response.json();
+        if (response.ok) {
+            if (result.access_token) {
+                // Shown once: only its hash is stored
+                alert(`✅ Configuration saved!\n\nAccess token for tenant '${result.tenant_id}' (shown only once):\n${result.access_token}`);
+                window.location.href = `/?token=${encodeURIComponent(result.access_token)}`;
+            } else {
+                alert('✅ Configuration saved successfully!');
+                window.location.href = '/';
+            }
+        } else {
+            if (response.status === 401) {
+                sessionStorage.removeItem('adminToken');
+            }
+            alert('❌ Failed to save configuration: ' + (result.error || response.status));
+        }
+    } catch (error) {
+        alert('❌ Error saving configuration: ' + error.message);
+    }
+}
+
+async function loadExistingConfiguration() {
+    try {
+        const response = await fetch('/api/get-configuration', { headers: apiHeaders() });
+        if (response.ok) {
+            const config = await response.json();
+            // Populate form fields with existing configuration
+            console.log('Loaded existing configuration:', config);
+        }
+    } catch (error) {
+        console.log('No existing configuration found');
+    }
+}
@@ -0,0 +1,251 @@
+"""
+Response compression, precompressed static pages and fingerprinted /static assets for the Flask servers
+"""
+
+import gzip
+import hashlib
+import os
+import re
+from typing import Callable, Dict, Optional
+from flask import Response, abort, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Responses smaller than this are not worth the CPU or the extra headers
+MIN_COMPRESS_SIZE = 1024
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/json', 'application/javascript', 'application/x-ndjson'
+}
+
+
+def supported_encodings():
+    """Encodings this server can produce, in order of preference"""
+    return ['br', 'gzip'] if brotli else ['gzip']
+
+
+def choose_encoding() -> Optional[str]:
+    """Pick the best encoding the client accepts (honours q=0)"""
+    accepted = request.accept_encodings
+    for encoding in supported_encodings():
+        if accepted[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str, level: int = 6) -> bytes:
+    if encoding == 'br':
+        # Brotli quality 0-11; map the gzip-style level onto it
+        return brotli.compress(data, quality=min(11, level + 1))
+    return gzip.compress(data, compresslevel=level)
+
+
+def add_vary(response: Response):
+    if 'Accept-Encoding' not in response.vary:
+        response.vary.add('Accept-Encoding')
+
+
+def init_compression(app, min_size: int = MIN_COMPRESS_SIZE, level: int = 6):
+    """Compress JSON/HTML responses above min_size for clients that accept gzip or brotli"""
+
+    @app.after_request
+    def compress_response(response: Response):
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        encoding = choose_encoding()
+        add_vary(response)
+        if not encoding:
+            return response
+
+        response.set_data(compress(data, encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    return app
+
+
+class StaticAsset:
+    """A file loaded once, hashed for its ETag and precompressed at maximum level"""
+
+    def __init__(self, path: str, mimetype: str = 'text/html', cache_control: str = 'no-cache',
+                 transform: Callable[[bytes], bytes] = None):
+        self.path = path
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.transform = transform
+        self.variants: Dict[Optional[str], bytes] = {}
+        self.etag = None
+        self.mtime = None
+        self.load()
+
+    @property
+    def exists(self) -> bool:
+        return bool(self.variants)
+
+    @property
+    def fingerprint(self) -> str:
+        """Short content hash used in cache-busted URLs"""
+        return (self.etag or '')[:10]
+
+    def changed_on_disk(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime_ns != self.mtime
+        except FileNotFoundError:
+            return self.mtime is not None
+
+    def load(self):
+        """Read, hash and precompress the file; leaves the asset empty if it is missing"""
+        try:
+            with open(self.path, 'rb') as f:
+                self.mtime = os.fstat(f.fileno()).st_mtime_ns
+                raw = f.read()
+        except FileNotFoundError:
+            self.variants = {}
+            self.etag = None
+            self.mtime = None
+            return
+
+        if self.transform:
+            raw = self.transform(raw)
+
+        self.etag = hashlib.sha256(raw).hexdigest()[:32]
+        self.variants = {None: raw, 'gzip': gzip.compress(raw, compresslevel=9)}
+        if brotli:
+            self.variants['br'] = brotli.compress(raw, quality=11)
+
+        sizes = ', '.join(f"{encoding or 'raw'} {len(body):,}B" for encoding, body in self.variants.items())
+        print(f"📦 Loaded {os.path.basename(self.path)} ({sizes})")
+
+    def response(self) -> Response:
+        """Serve the asset for the current request, answering 304 when the ETag matches"""
+
+        if request.if_none_match.contains(self.etag):
+            response = Response(status=304)
+        else:
+            encoding = choose_encoding()
+            response = Response(self.variants[encoding], mimetype=self.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(self.etag)
+        response.headers['Cache-Control'] = self.cache_control
+        add_vary(response)
+        return response
+
+
+# One year: hashed asset URLs change whenever the content does
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+STATIC_MIMETYPES = {
+    '.css': 'text/css',
+    '.js': 'text/javascript',
+    '.html': 'text/html',
+    '.svg': 'image/svg+xml',
+    '.png': 'image/png',
+    '.ico': 'image/x-icon'
+}
+
+
+class AssetRegistry:
+    """Static files held in memory, served at fingerprinted URLs, with HTML pages rewritten to use them"""
+
+    def __init__(self, static_dir: str, url_prefix: str = '/static', auto_reload: bool = False):
+        self.static_dir = static_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.auto_reload = auto_reload
+        self.assets: Dict[str, StaticAsset] = {}
+        self.pages: Dict[str, StaticAsset] = {}
+        self.load_static()
+
+    def load_static(self):
+        """Load every file in the static directory"""
+        self.assets = {}
+        if not os.path.isdir(self.static_dir):
+            return
+        for name in sorted(os.listdir(self.static_dir)):
+            path = os.path.join(self.static_dir, name)
+            mimetype = STATIC_MIMETYPES.get(os.path.splitext(name)[1])
+            if os.path.isfile(path) and mimetype:
+                self.assets[name] = StaticAsset(path, mimetype=mimetype, cache_control=IMMUTABLE_CACHE)
+
+    def url_for(self, name: str) -> str:
+        """Fingerprinted URL, e.g. /static/app.3f9c2a1b7d.js"""
+        asset = self.assets[name]
+        stem, extension = os.path.splitext(name)
+        return f"{self.url_prefix}/{stem}.{asset.fingerprint}{extension}"
+
+    def rewrite_html(self, raw: bytes) -> bytes:
+        """Point /static/<name> references at their fingerprinted URLs"""
+        pattern = re.compile(re.escape(self.url_prefix).encode() + rb'/([\w.-]+)')
+
+        def replace(match):
+            name = match.group(1).decode()
+            return self.url_for(name).encode() if name in self.assets else match.group(0)
+
+        return pattern.sub(replace, raw)
+
+    def page(self, path: str) -> StaticAsset:
+        """Register an HTML page whose asset links get fingerprinted"""
+        page = StaticAsset(path, transform=self.rewrite_html)
+        self.pages[path] = page
+        return page
+
+    def refresh(self):
+        """Reload anything changed on disk (development only); pages follow their assets"""
+        if not self.auto_reload:
+            return
+        names = set(os.listdir(self.static_dir)) if os.path.isdir(self.static_dir) else set()
+        assets_changed = (
+            names != set(self.assets)
+            or any(asset.changed_on_disk() for asset in self.assets.values())
+        )
+        if assets_changed:
+            self.load_static()
+        for page in self.pages.values():
+            if assets_changed or page.changed_on_disk():
+                page.load()
+
+    def lookup(self, filename: str) -> Optional[StaticAsset]:
+        """Find the asset for either a fingerprinted or a plain file name"""
+        if filename in self.assets:
+            return self.assets[filename]
+        stem, extension = os.path.splitext(filename)
+        name, _, fingerprint = stem.rpartition('.')
+        asset = self.assets.get(name + extension)
+        if asset and fingerprint == asset.fingerprint:
+            return asset
+        return None
+
+    def init_app(self, app):
+        """Add the static route and the development reload hook"""
+
+        @app.route(f'{self.url_prefix}/<path:filename>')
+        def static_asset(filename):
+            asset = self.lookup(filename)
+            if not asset:
+                abort(404)
+            response = asset.response()
+            # Plain (unversioned) names must revalidate; fingerprinted ones never change
+            if filename in self.assets:
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        # refresh() is a no-op unless auto_reload is on, so it can be switched on after startup
+        app.before_request(self.refresh)
+        return self
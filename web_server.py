@@ -1,47 +1,168 @@
+from web_startup import startup_profile  # first, so the imports below are timed
+
 import os
 import json
 import traceback
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
 # Import our main system
-from hubspot_claude_system import HubSpotClaudeSystem
+from hubspot_claude_system import ACTION_RECORD_LIMITS, HubSpotClaudeSystem, QueryResult, result_from_json, result_to_json
+from hubspot_export import ExportError, stream_export
+from hubspot_results import ResultStore, default_spill_dir
+from hubspot_scheduler import QuestionScheduler
+from hubspot_sessions import SessionStore, classify_follow_up
+from hubspot_tenants import (
+    DEFAULT_TENANT, TenantAuthError, TenantError, TenantRegistry, TenantStore, authenticated_tenant_id, hash_token,
+    new_access_token, require_admin, requested_tenant_id, tenant_id_from_request
+)
+from hubspot_webhooks import WebhookDispatcher, signed_uri, verify_signature_v3
+from web_assets import AssetRegistry, init_compression
+
+startup_profile.mark('imports')
 
 # Load environment variables
 load_dotenv()
 
 # Initialize Flask app
-app = Flask(__name__)
+# Flask's own static route is replaced by the fingerprinted asset registry below
+app = Flask(__name__, static_folder=None)
 CORS(app)  # Enable CORS for web interface
+init_compression(app)  # gzip/brotli for JSON and HTML responses
+startup_profile.init_app(app)
+
+# Static pages and their JS/CSS are read, hashed and precompressed once at startup.
+# ASSET_RELOAD=1 re-reads anything edited on disk (development).
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+static_assets = AssetRegistry(
+    os.path.join(BASE_DIR, 'static'),
+    auto_reload=os.getenv('ASSET_RELOAD') == '1'
+).init_app(app)
+web_interface_asset = static_assets.page(os.path.join(BASE_DIR, 'web_interface.html'))
+setup_interface_asset = static_assets.page(os.path.join(BASE_DIR, 'setup_interface.html'))
+startup_profile.mark('static_assets')
+
+# One warm system per tenant, each with its own credentials, HTTP pool, rate limit and
+# caches. Requests are the tenant their bearer token was issued to; without one they are the
+# 'default' tenant, the environment configuration. Others are added through
+# /api/save-configuration, which needs ADMIN_TOKEN.
+tenant_store = TenantStore(os.getenv('TENANT_CONFIG_PATH', os.path.join(BASE_DIR, 'tenants.json')))
+tenants = TenantRegistry(
+    HubSpotClaudeSystem,
+    tenant_store,
+    max_tenants=int(os.getenv('MAX_WARM_TENANTS', 16))
+)
+
+# Conversations keep their last plan and result server-side so follow-ups ("only the ones in
+# Texas", "text them") reuse them. They live in this process's memory: run one worker, or
+# route a session to the same worker, for follow-ups to find their context.
+sessions = SessionStore(ttl_seconds=int(os.getenv('SESSION_TTL_SECONDS', 1800)))
+
+# Query results stay on the server under an opaque result_id; actions reference the ID and run
+# over the records the plan asked for, in the order they were displayed. The held page is used
+# when it covers the action; otherwise they are paged in once, capped at ACTION_MAX_RECORDS
+result_store = ResultStore(
+    ttl_seconds=int(os.getenv('RESULT_TTL_SECONDS', 1800)),
+    max_memory_records=int(os.getenv('RESULT_MEMORY_RECORDS', 5000)),
+    spill_dir=os.getenv('RESULT_SPILL_DIR') or default_spill_dir()
+)
+ACTION_MAX_RECORDS = int(os.getenv('ACTION_MAX_RECORDS', 10000))
+
+# Scheduled questions (/api/schedules) are re-run in the background on their cron schedule
+# (UTC); asking one while its answer is younger than max_age_seconds returns that answer
+# without calling Claude or HubSpot. Schedules and answers are shared by every worker through
+# SCHEDULE_PATH; one worker (holding its leader lock) runs them. Adding or removing one needs an
+# access token or X-Admin-Token, and runs are at least SCHEDULE_MIN_INTERVAL_SECONDS apart.
+scheduler = QuestionScheduler(
+    tenants.get,
+    path=os.getenv('SCHEDULE_PATH', os.path.join(BASE_DIR, 'schedules.json')),
+    default_max_age=int(os.getenv('SCHEDULE_MAX_AGE_SECONDS', 3600)),
+    min_interval_seconds=int(os.getenv('SCHEDULE_MIN_INTERVAL_SECONDS', 900)),
+    encode_result=result_to_json,
+    decode_result=result_from_json
+)
+
+# HubSpot webhook subscriptions post to /webhooks/hubspot. Deliveries are checked against the
+# app's client secret, coalesced per record, and applied to warm tenants' caches and held
+# results every WEBHOOK_FLUSH_SECONDS. WEBHOOK_URL is the public URL when a proxy rewrites it.
+HUBSPOT_CLIENT_SECRET = os.getenv('HUBSPOT_CLIENT_SECRET')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+MAX_WEBHOOK_BYTES = 1024 * 1024
+webhooks = WebhookDispatcher(
+    flush_seconds=float(os.getenv('WEBHOOK_FLUSH_SECONDS', 1)),
+    max_pending=int(os.getenv('WEBHOOK_MAX_PENDING', 10000))
+)
+
+def apply_webhook_batch(batch):
+    for system in tenants.warm():
+        # A tenant whose portal isn't known yet gets nothing rather than every portal's changes
+        if system.hubspot_portal_id != batch.portal_id:
+            continue
+        system.apply_webhook_batch(batch)
+        result_store.apply_changes(system.tenant.tenant_id, batch.changes)
+        scheduler.mark_dirty(system.tenant.tenant_id, {change.object_type for change in batch.changes})
+
+webhooks.add_listener(apply_webhook_batch)
 
 # Initialize the HubSpot system
 try:
-    hubspot_system = HubSpotClaudeSystem()
+    hubspot_system = tenants.get(DEFAULT_TENANT)
     print("✅ HubSpot system initialized successfully")
 except Exception as e:
     print(f"❌ Failed to initialize HubSpot system: {e}")
     hubspot_system = None
+startup_profile.mark('hubspot_system')
+startup_profile.ready()
+
+@app.before_request
+def start_scheduler():
+    # Started on the first request in each process (threads don't survive a worker fork);
+    # the worker holding the leader lock runs the schedules, the others stand by
+    scheduler.start()
+
+def current_system():
+    """Warm system for the requesting tenant (None if it could not be built)"""
+    tenant_id = tenant_id_from_request(request, tenant_store)
+    try:
+        return tenants.get(tenant_id)
+    except TenantError:
+        raise
+    except Exception as e:
+        print(f"❌ Failed to initialize HubSpot system for tenant '{tenant_id}': {e}")
+        return None
+
+def session_id_from_request(data: dict):
+    return request.headers.get('X-Session-ID') or (data or {}).get('session_id')
+
+@app.errorhandler(TenantError)
+def tenant_error(error):
+    return jsonify({'success': False, 'error': str(error)}), error.status_code
 
 @app.route('/')
 def index():
     """Serve the main web interface"""
-    try:
-        # Read the HTML file we created
-        with open('web_interface.html', 'r') as f:
-            html_content = f.read()
-        return html_content
-    except FileNotFoundError:
+    if web_interface_asset.exists:
+        return web_interface_asset.response()
+    else:
         return '''
         <h1>HubSpot Query Interface</h1>
         <p>Please make sure the web_interface.html file is in the same directory as this server.</p>
         <p>You can copy the HTML content from the artifact and save it as "web_interface.html"</p>
         '''
 
+@app.route('/setup')
+def setup():
+    """Serve the setup / configuration interface"""
+    if setup_interface_asset.exists:
+        return setup_interface_asset.response()
+    return jsonify({'error': 'setup_interface.html not found'}), 404
+
 @app.route('/api/test-connections', methods=['POST'])
 def test_connections():
     """Test all API connections"""
+    hubspot_system = current_system()
     
     try:
         results = {
@@ -75,8 +196,9 @@ def test_connections():
         
         # Test Claude API
         try:
+            # Connectivity only - the cheapest tier is enough
             response = hubspot_system.claude_client.messages.create(
-                model="claude-3-5-sonnet-20241022",
+                model=hubspot_system.model_router.cheapest.model,
                 max_tokens=10,
                 messages=[{"role": "user", "content": "Test"}]
             )
@@ -112,6 +234,7 @@ def test_connections():
 @app.route('/api/process-question', methods=['POST'])
 def process_question():
     """Process a business question using the HubSpot system"""
+    hubspot_system = current_system()
     
     try:
         data = request.get_json()
@@ -124,16 +247,56 @@ def process_question():
         if not hubspot_system:
             return jsonify({'success': False, 'error': 'HubSpot system not initialized'}), 500
         
-        # Process the question
-        result = hubspot_system.process_business_question(question)
+        session = sessions.get_or_create(session_id_from_request(data), hubspot_system.tenant.tenant_id)
+        with session.lock:
+            follow_up = classify_follow_up(question, session.has_context)
+            
+            if follow_up and follow_up['type'] == 'action':
+                # "Text them" acts on the previous result; the interface confirms and calls execute-action
+                return jsonify({
+                    'success': True,
+                    'question': question,
+                    'session_id': session.session_id,
+                    'follow_up': {**follow_up, 'base_question': session.last_question},
+                    'result_id': session.last_result_id,
+                    'timestamp': datetime.now().isoformat()
+                })
+            
+            # A scheduled question with a fresh answer is served as materialized
+            scheduled = None if follow_up or action_type else scheduler.lookup(session.tenant_id, question)
+            if scheduled:
+                result = scheduled[1].result
+            else:
+                # Process the question, narrowing the previous plan when it is a follow-up
+                result = hubspot_system.process_business_question(
+                    question,
+                    action_type=action_type or None,
+                    base_plan=session.last_plan if follow_up else None,
+                    base_question=session.last_question
+                )
+            
+            refinement = (result or {}).get('analysis', {}).get('refinement')
+            stored = None
+            if result:
+                stored = result_store.put(session.tenant_id, question, result['analysis'], result['results'])
+                session.remember(question, result['analysis'], stored.result_id, follow_up='refine' if refinement else None)
         
         # Format the response for the web interface
         formatted_results = []
+        aggregates = []
+        lookup_matches = {}
         total_records = 0
         
         if result and 'results' in result:
             for query_result in result['results']:
+                # Count and aggregation results carry just totals - no records to page through
+                if query_result.query_type in ('count', 'aggregation'):
+                    total_records += query_result.total_count
+                    aggregates.extend(query_result.data)
+                    continue
+                
                 total_records += len(query_result.data)
+                lookup_matches.update(getattr(query_result, 'lookup_matches', None) or {})
                 
                 # Format each record for display
                 for record in query_result.data[:10]:  # Limit to first 10 for web display
@@ -148,8 +311,17 @@ def process_question():
             'question': question,
             'total_records': total_records,
             'results': formatted_results,
+            'aggregates': aggregates,
+            'lookup_matches': lookup_matches or None,
             'analysis': result.get('analysis', {}) if result else {},
             'summary': result.get('summary', 'No summary available') if result else 'No results',
+            'session_id': session.session_id,
+            'result_id': stored.result_id if stored else None,
+            'follow_up': {'type': 'refine', **refinement} if refinement else None,
+            'materialized': {
+                'schedule_id': scheduled[0].schedule_id,
+                'computed_at': datetime.fromtimestamp(scheduled[1].computed_at).isoformat()
+            } if scheduled else None,
             'timestamp': datetime.now().isoformat()
         }
         
@@ -162,9 +334,62 @@ def process_question():
             'traceback': traceback.format_exc()
         }), 500
 
+@app.route('/api/export', methods=['POST'])
+def export_results():
+    """Re-run a query plan with full pagination and stream every record as CSV, NDJSON or Parquet"""
+    hubspot_system = current_system()
+    
+    try:
+        # Accept JSON from fetch() or a plain form post, which lets the browser stream straight to disk
+        data = request.get_json(silent=True) or request.form.to_dict()
+        export_format = (data.get('format') or 'csv').lower()
+        question = (data.get('question') or '').strip()
+        max_records = int(data.get('max_records') or 100000)
+        
+        analysis = data.get('analysis')
+        if isinstance(analysis, str):
+            analysis = json.loads(analysis) if analysis else None
+        
+        if not hubspot_system:
+            return jsonify({'success': False, 'error': 'HubSpot system not initialized'}), 500
+        
+        if not analysis:
+            if not question:
+                return jsonify({'success': False, 'error': 'Question or analysis is required'}), 400
+            analysis = hubspot_system.process_question_with_claude(question)
+        
+        endpoints = (analysis or {}).get('hubspot_endpoints', [])
+        if not endpoints:
+            return jsonify({'success': False, 'error': 'Plan has no HubSpot endpoints to export'}), 400
+        
+        pages = hubspot_system.iter_plan_records(endpoints, max_records=max_records)
+        mimetype, chunks = stream_export(pages, export_format)
+        
+        filename = f"hubspot_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+        
+        # No Content-Length, so the WSGI server sends the body with chunked transfer encoding
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+        
+    except ExportError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
 @app.route('/api/execute-action', methods=['POST'])
 def execute_action():
     """Execute an action on the last query results"""
+    hubspot_system = current_system()
     
     try:
         data = request.get_json()
@@ -177,28 +402,45 @@ def execute_action():
         if not hubspot_system:
             return jsonify({'success': False, 'error': 'HubSpot system not initialized'}), 500
         
-        # Convert web results back to QueryResult objects for processing
-        from hubspot_claude_system import QueryResult
-        
-        query_results = []
-        
-        # Group results by source
-        sources = {}
-        for item in results_data:
-            source = item.get('source', 'unknown')
-            if source not in sources:
-                sources[source] = []
-            sources[source].append(item.get('data', {}))
-        
-        # Create QueryResult objects
-        for source, data_list in sources.items():
-            query_result = QueryResult(
-                data=data_list,
-                source=source,
-                query_type='web_interface',
-                timestamp=datetime.now()
+        tenant_id = hubspot_system.tenant.tenant_id
+        result_id = data.get('result_id')
+        if not result_id:
+            session = sessions.get(session_id_from_request(data), tenant_id)
+            result_id = session.last_result_id if session else None
+        
+        stored = result_store.get(result_id, tenant_id)
+        if stored is not None:
+            # Act on the server-held result, paging in more only when the action reaches past it
+            query_results = result_store.complete(
+                stored,
+                hubspot_system,
+                max_records=ACTION_MAX_RECORDS,
+                needed=ACTION_RECORD_LIMITS.get(action_type),
+                action_type=action_type
             )
-            query_results.append(query_result)
+        elif (result_id or session_id_from_request(data)) and not results_data:
+            return jsonify({'success': False, 'error': 'Result expired, please ask the question again'}), 410
+        else:
+            # Older clients post the displayed records back
+            query_results = []
+            
+            # Group results by source
+            sources = {}
+            for item in results_data:
+                source = item.get('source', 'unknown')
+                if source not in sources:
+                    sources[source] = []
+                sources[source].append(item.get('data', {}))
+            
+            # Create QueryResult objects
+            for source, data_list in sources.items():
+                query_result = QueryResult(
+                    data=data_list,
+                    source=source,
+                    query_type='web_interface',
+                    timestamp=datetime.now()
+                )
+                query_results.append(query_result)
         
         # Execute the action
         hubspot_system.execute_external_actions(
@@ -224,6 +466,7 @@ def execute_action():
 @app.route('/api/send-test-sms', methods=['POST'])
 def send_test_sms():
     """Send a test SMS"""
+    hubspot_system = current_system()
     
     try:
         data = request.get_json()
@@ -256,19 +499,162 @@ def send_test_sms():
             'traceback': traceback.format_exc()
         }), 500
 
+@app.route('/api/save-configuration', methods=['POST'])
+def save_configuration():
+    """Save the setup page's configuration for a tenant (admin only)
+
+    A new tenant, or one saved with rotate_token, gets an access token; it is returned
+    once and only its hash is stored.
+    """
+    
+    try:
+        require_admin(request)
+        data = request.get_json() or {}
+        tenant_id = requested_tenant_id(request)
+        
+        # Only what was saved before is written back - environment credentials never reach disk
+        config = tenant_store.saved(tenant_id)
+        config.apply_setup(data)
+        access_token = None
+        if not config.access_token_sha256 or data.get('rotate_token'):
+            access_token = new_access_token()
+            config.access_token_sha256 = hash_token(access_token)
+        tenant_store.save(config)
+        
+        # The next request for this tenant builds a fresh system with the new credentials
+        tenants.invalidate(tenant_id)
+        print(f"💾 Saved configuration for tenant '{tenant_id}'")
+        
+        return jsonify({
+            'success': True,
+            'tenant_id': tenant_id,
+            'access_token': access_token,
+            'configuration': config.to_dict(redact=True)
+        })
+        
+    except TenantAuthError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+    except TenantError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+@app.route('/api/get-configuration', methods=['GET'])
+def get_configuration():
+    """Return a tenant's configuration with credentials masked (admin only)"""
+    
+    require_admin(request)
+    tenant_id = requested_tenant_id(request)
+    config = tenant_store.get(tenant_id)
+    if config is None:
+        return jsonify({'success': False, 'error': f"Unknown tenant '{tenant_id}'"}), 404
+    
+    return jsonify({
+        'success': True,
+        'tenant_id': tenant_id,
+        'integrations': config.integrations,
+        'configuration': config.to_dict(redact=True)
+    })
+
+@app.route('/api/schedules', methods=['GET'])
+def list_schedules():
+    """Scheduled questions of the requesting tenant"""
+    tenant_id = tenant_id_from_request(request, tenant_store)
+    return jsonify({'success': True, 'schedules': scheduler.schedules(tenant_id), 'scheduler': scheduler.stats()})
+
+@app.route('/api/schedules', methods=['POST'])
+def create_schedule():
+    """Schedule a question: {question, cron, max_age_seconds}"""
+    authenticated_tenant_id(request, tenant_store)
+    hubspot_system = current_system()
+    if not hubspot_system:
+        return jsonify({'success': False, 'error': 'HubSpot system not initialized'}), 500
+    
+    data = request.get_json() or {}
+    try:
+        schedule = scheduler.add(
+            hubspot_system.tenant.tenant_id,
+            str(data.get('question', '')),
+            str(data.get('cron', '@hourly')),
+            max_age_seconds=int(data['max_age_seconds']) if data.get('max_age_seconds') else None
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'schedule': schedule.summary()})
+
+@app.route('/api/schedules/<schedule_id>', methods=['DELETE'])
+def delete_schedule(schedule_id):
+    if not scheduler.remove(authenticated_tenant_id(request, tenant_store), schedule_id):
+        return jsonify({'success': False, 'error': 'Schedule not found'}), 404
+    return jsonify({'success': True})
+
+@app.route('/webhooks/hubspot', methods=['POST'])
+def hubspot_webhook():
+    """Receive HubSpot change events (v3-signed) and queue them for cache invalidation"""
+    if not HUBSPOT_CLIENT_SECRET:
+        return jsonify({'success': False, 'error': 'Webhooks are not configured (HUBSPOT_CLIENT_SECRET)'}), 503
+    if (request.content_length or 0) > MAX_WEBHOOK_BYTES:
+        return jsonify({'success': False, 'error': 'Payload too large'}), 413
+    
+    body = request.get_data()
+    if not verify_signature_v3(
+        HUBSPOT_CLIENT_SECRET,
+        request.method,
+        signed_uri(request, WEBHOOK_URL),
+        body,
+        request.headers.get('X-HubSpot-Request-Timestamp'),
+        request.headers.get('X-HubSpot-Signature-v3')
+    ):
+        return jsonify({'success': False, 'error': 'Invalid signature'}), 401
+    
+    try:
+        events = json.loads(body)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Body must be a JSON array of events'}), 400
+    if isinstance(events, dict):
+        events = [events]
+    if not isinstance(events, list):
+        return jsonify({'success': False, 'error': 'Body must be a JSON array of events'}), 400
+    
+    if not webhooks.submit(events):
+        # HubSpot redelivers later; the backlog drains in the meantime
+        response = jsonify({'success': False, 'error': 'Webhook backlog full, retry later'})
+        response.headers['Retry-After'] = str(max(int(webhooks.flush_seconds), 1))
+        return response, 503
+    
+    return jsonify({'success': True, 'received': len(events)})
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """Get system status"""
+    hubspot_system = current_system()
     
+    tenant = hubspot_system.tenant if hubspot_system else None
     status = {
         'system_initialized': hubspot_system is not None,
         'timestamp': datetime.now().isoformat(),
+        'tenant_id': tenant.tenant_id if tenant else None,
         'environment': {
-            'hubspot_api_key': bool(os.getenv('HUBSPOT_API_KEY')),
-            'claude_api_key': bool(os.getenv('ANTHROPIC_API_KEY')),
+            'hubspot_api_key': bool(tenant and tenant.hubspot_api_key),
+            'claude_api_key': bool(tenant and tenant.anthropic_api_key),
             'mysql_configured': bool(os.getenv('MYSQL_HOST')),
-            'kixie_configured': bool(os.getenv('KIXIE_API_KEY'))
-        }
+            'kixie_configured': bool(tenant and tenant.kixie_api_key)
+        },
+        'tenants': tenants.stats(),
+        'sessions': sessions.stats(),
+        'results': result_store.stats(),
+        'claude_tiers': hubspot_system.model_router.stats.summary() if hubspot_system else {},
+        'deal_pipelines': hubspot_system.pipelines.stats() if hubspot_system else {},
+        'property_schema': hubspot_system.property_schema.stats() if hubspot_system else {},
+        'dates': hubspot_system.dates.periods().as_dict() if hubspot_system else {},
+        'lookup_strategies': hubspot_system.strategy_orderer.stats() if hubspot_system else {},
+        'webhooks': webhooks.stats(),
+        'scheduler': scheduler.stats(),
+        'startup': startup_profile.report()
     }
     
     return jsonify(status)
@@ -284,7 +670,7 @@ def internal_error(error):
 def create_html_file():
     """Create the HTML file if it doesn't exist"""
     
-    if not os.path.exists('web_interface.html'):
+    if not os.path.exists(web_interface_asset.path):
         print("Creating web_interface.html file...")
         
         # This is a simplified version - you should copy the full HTML from the artifact
@@ -354,9 +740,11 @@ def create_html_file():
 </body>
 </html>'''
         
-        with open('web_interface.html', 'w') as f:
+        with open(web_interface_asset.path, 'w') as f:
             f.write(html_content)
         
+        web_interface_asset.load()
+        
         print("✅ web_interface.html created")
         print("💡 For the full interface, copy the HTML content from the 'Complete HubSpot Query Web Interface' artifact")
 
@@ -366,6 +754,9 @@ if __name__ == '__main__':
     
     # Create HTML file if needed
     create_html_file()
+
+    # The dev server runs with debug=True, so pick up HTML/JS/CSS edits without a restart
+    static_assets.auto_reload = True
     
     # Check environment
     required_vars = ['HUBSPOT_API_KEY', 'ANTHROPIC_API_KEY', 'MYSQL_HOST']
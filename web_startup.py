@@ -0,0 +1,83 @@
+"""
+Startup profile: where cold-start time goes, and how long until the first response
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Iterable
+
+# Import this module before anything else so the clock starts as early as possible
+_STARTED = time.perf_counter()
+
+
+class StartupProfile:
+    """Named startup phases (each measured from the previous mark) plus time to first response"""
+
+    def __init__(self, started: float = _STARTED):
+        self.started = started
+        self.last_mark = started
+        self.phases: Dict[str, float] = {}
+        self.ready_ms = None
+        self.first_response_ms = None
+        self.first_response_pid = None
+
+    @staticmethod
+    def _ms(seconds: float) -> float:
+        return round(seconds * 1000, 1)
+
+    def mark(self, phase: str):
+        """Record the time since the previous mark under this phase name"""
+        now = time.perf_counter()
+        self.phases[phase] = self._ms(now - self.last_mark)
+        self.last_mark = now
+
+    def ready(self):
+        """Module-level setup is done; print where the time went"""
+        self.ready_ms = self._ms(time.perf_counter() - self.started)
+        breakdown = ', '.join(f"{phase} {ms:.0f}ms" for phase, ms in self.phases.items())
+        print(f"⏱️  Startup took {self.ready_ms:.0f}ms ({breakdown})")
+
+    def init_app(self, app):
+        """Record how long after process start each worker answered its first request"""
+
+        @app.after_request
+        def record_first_response(response):
+            # Workers forked from a preloaded master inherit None here and record their own
+            if self.first_response_pid != os.getpid():
+                self.first_response_pid = os.getpid()
+                self.first_response_ms = self._ms(time.perf_counter() - self.started)
+                print(f"⏱️  First response after {self.first_response_ms:.0f}ms (pid {self.first_response_pid})")
+            return response
+
+        return app
+
+    def report(self) -> Dict:
+        return {
+            'phases_ms': dict(self.phases),
+            'ready_ms': self.ready_ms,
+            'first_response_ms': self.first_response_ms if self.first_response_pid == os.getpid() else None,
+            'pid': os.getpid()
+        }
+
+
+def warm_imports(modules: Iterable[str]) -> threading.Thread:
+    """Import slow, lazily-used modules in the background so the first request that needs them doesn't wait"""
+
+    modules = list(modules)
+
+    def run():
+        started = time.perf_counter()
+        for module in modules:
+            try:
+                __import__(module)
+            except ImportError as e:
+                print(f"⚠️  Could not pre-import {module}: {e}")
+        print(f"🔥 Warmed {', '.join(modules)} in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    thread = threading.Thread(target=run, name='warm-imports', daemon=True)
+    thread.start()
+    return thread
+
+
+startup_profile = StartupProfile()